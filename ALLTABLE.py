@@ -3,19 +3,32 @@ import os
 import sys
 import re
 import json
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QTableWidget, QTableWidgetItem, QFileDialog,
-    QMessageBox, QCheckBox, QLabel, QHeaderView, QInputDialog,
-    QComboBox, QDoubleSpinBox,
-    QDialog, QListWidget, QListWidgetItem
-)
-from PyQt6.QtCore import Qt
+# PyQt6 нужен только для GUI; запуск из командной строки работает и без него
+try:
+    from PyQt6.QtWidgets import (
+        QApplication, QWidget, QVBoxLayout, QHBoxLayout,
+        QPushButton, QTableWidget, QTableWidgetItem, QFileDialog,
+        QMessageBox, QCheckBox, QLabel, QHeaderView, QInputDialog,
+        QComboBox, QDoubleSpinBox, QSpinBox,
+        QDialog, QListWidget, QListWidgetItem
+    )
+    from PyQt6.QtCore import Qt, QTimer
+    QT_AVAILABLE = True
+except ImportError:
+    QWidget = QDialog = object
+    QT_AVAILABLE = False
+
+from render_cache import cache_folder, render_key, cached_render
+from profiling import profile_call
+from results_io import read_table, table_columns, resolve_path
 
 # ---------- Визуальные настройки ----------
 sns.set_style("whitegrid")
@@ -116,16 +129,92 @@ def infer_condition_label(base_name: str, auto_normalize: bool) -> str:
     if t and not regime: return t
     return s_norm
 
+def _map_unique(values, fn) -> pd.Categorical:
+    """
+    Применяет fn один раз к каждому уникальному значению и раздаёт результат по кодам;
+    результат — Categorical с отсортированными категориями.
+    """
+    cat = values if isinstance(values, pd.Categorical) else pd.Categorical(values)
+    mapped = np.array([fn(c) for c in cat.categories], dtype=object)
+    uniques = np.array(sorted(set(mapped)), dtype=object)
+    codes = np.asarray(cat.codes, dtype=np.int64)
+    if mapped.size:
+        codes = np.where(codes >= 0, np.searchsorted(uniques, mapped)[codes], -1)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+def _str_categorical(values: pd.Series) -> pd.Categorical:
+    """Как values.astype(str), но по категориям: пропуски становятся строкой "nan"."""
+    cat = values.astype("category").array
+    cat = cat.rename_categories(cat.categories.astype(str))
+    if cat.isna().any():
+        if "nan" not in cat.categories:
+            cat = cat.add_categories(["nan"])
+        cat = cat.fillna("nan")
+    return cat
+
+def _collapse_gata_4_name(g: str) -> str:
+    return re.sub(r"^(GATA-4)(?:_t\d+)?$", r"\1", str(g))
+
 def collapse_gata_4(index_series: pd.Index) -> pd.Index:
-    collapsed = []
-    for g in index_series:
-        g = str(g)
-        g2 = re.sub(r"^(GATA-4)(?:_t\d+)?$", r"\1", g)
-        collapsed.append(g2)
-    return pd.Index(collapsed)
+    values = pd.Index(index_series).astype(str)
+    return pd.Index(np.asarray(_map_unique(values, _collapse_gata_4_name), dtype=object))
 
 # ---------- Построение матриц ----------
 
+# Кэш загруженных файлов на время сессии: (путь, размер, mtime) -> таблица
+_DATASET_CACHE: dict = {}
+_BUILD_CACHE: dict = {}
+
+def file_fingerprint(path: str) -> tuple:
+    # файл, который будет прочитан на самом деле: parquet рядом с TSV, если он свежее
+    path = resolve_path(path)
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """
+    Читает только нужные столбцы файла; имена генов и Base Name хранятся как
+    категориальные столбцы, нормализация выполняется по уникальным значениям.
+    Повторная загрузка неизменённого файла берётся из кэша сессии.
+    """
+    key = file_fingerprint(path)
+    if key in _DATASET_CACHE:
+        return _DATASET_CACHE[key]
+
+    header = pd.DataFrame(columns=table_columns(path))
+    col_base, col_gene, col_pval, col_l2fc = resolve_columns(header)
+    df = read_table(path, columns=[col_base, col_gene, col_pval, col_l2fc])
+
+    data = pd.DataFrame({
+        "GATA": _map_unique(_str_categorical(df[col_gene]), _collapse_gata_4_name),
+        "BaseRaw": _map_unique(_str_categorical(df[col_base]), lambda x: re.sub(r"\s+", " ", x.strip())),
+        "log2FC": pd.to_numeric(df[col_l2fc], errors="coerce"),
+        "pval": pd.to_numeric(df[col_pval], errors="coerce"),
+    })
+    for stale in [k for k in _DATASET_CACHE if k[0] == key[0]]:
+        del _DATASET_CACHE[stale]
+    _DATASET_CACHE[key] = data
+    return data
+
+def _plain_index(index: pd.Index) -> pd.Index:
+    # категориальные уровни сводов -> обычные строки (для диалогов, выгрузок и ключей кэша)
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays(
+            [np.asarray(index.get_level_values(k), dtype=object) for k in range(index.nlevels)], names=index.names)
+    return pd.Index(np.asarray(index, dtype=object), name=index.name)
+
+def pivot_methods(LONG: pd.DataFrame, index: list[str]):
+    """Своды log2FC (mean) и p-value (min): строки — index, столбцы — методы."""
+    M_log2 = LONG.pivot_table(index=index, columns="Method", values="log2FC", aggfunc="mean", observed=True).sort_index()
+    M_p    = LONG.pivot_table(index=index, columns="Method", values="pval",   aggfunc="min", observed=True).reindex(index=M_log2.index, columns=M_log2.columns)
+    for M in (M_log2, M_p):
+        M.index = _plain_index(M.index); M.columns = _plain_index(M.columns)
+    return M_log2, M_p
+
+def _union_column(blocks, column):
+    return pd.api.types.union_categoricals([b[column] for b in blocks], sort_categories=True)
+
+@profile_call("ALLTABLE.build_matrices")
 def build_matrices(datasets, auto_normalize: bool):
     """
     Возвращает:
@@ -133,52 +222,63 @@ def build_matrices(datasets, auto_normalize: bool):
       M_log2     : DataFrame ((ген, ConditionNorm) × методы), log2FC (для совместимости; может не использоваться далее).
       M_p        : DataFrame ((ген, ConditionNorm) × методы), p-value.
       LONG       : DataFrame со строками на уровень наблюдения:
-                   колонки: [GATA, ConditionNorm, BaseRaw, Method, log2FC, pval]
+                   колонки: [GATA, ConditionNorm, BaseRaw, Method, log2FC, pval] (первые четыре — категориальные)
                    (используется в диалоге сопоставления по полным названиям и для реконструкции групп).
+    Результат для тех же файлов (по отпечатку) и того же auto_normalize берётся из кэша сессии.
     """
+    build_key = (tuple((label, file_fingerprint(path)) for label, path in datasets), bool(auto_normalize))
+    if build_key in _BUILD_CACHE:
+        return _BUILD_CACHE[build_key]
+
     wide_blocks = []
     long_blocks = []
 
     for label, path in datasets:
-        df = pd.read_csv(path, sep="\t")
-        col_base, col_gene, col_pval, col_l2fc = resolve_columns(df)
-
-        df = df.copy()
-        base_raw = df[col_base].astype(str).map(lambda x: re.sub(r"\s+", " ", x.strip()))
-        df["__Condition__"] = df[col_base].astype(str).map(lambda x: infer_condition_label(x, auto_normalize))
-        df[col_gene] = collapse_gata_4(df[col_gene])
+        data = load_dataset(path)
+        condition = _map_unique(data["BaseRaw"].array, lambda x: infer_condition_label(x, auto_normalize))
 
         # wide (теплокарта)
-        pivot_val = df.pivot_table(index=col_gene, columns="__Condition__", values=col_l2fc, aggfunc="mean")
-        pivot_p   = df.pivot_table(index=col_gene, columns="__Condition__", values=col_pval, aggfunc="min")
-        pivot_p   = pivot_p.reindex(columns=pivot_val.columns)
+        frame = pd.DataFrame({"GATA": data["GATA"], "__Condition__": condition, "log2FC": data["log2FC"]})
+        pivot_val = frame.pivot_table(index="GATA", columns="__Condition__", values="log2FC", aggfunc="mean", observed=True)
+        pivot_val.index = pd.Index(np.asarray(pivot_val.index, dtype=object), name="GATA")
         pivot_val.columns = [f"{c}\n{label}" for c in pivot_val.columns]
         wide_blocks.append(pivot_val)
 
         # long (для корреляций/сопоставления)
-        tmp = pd.DataFrame({
-            "GATA": df[col_gene].values,
-            "ConditionNorm": df["__Condition__"].values,
-            "BaseRaw": base_raw.values,
-            "Method": [label]*len(df),
-            "log2FC": df[col_l2fc].values,
-            "pval":   df[col_pval].values
-        })
-        long_blocks.append(tmp)
+        long_blocks.append(pd.DataFrame({
+            "GATA": data["GATA"].array,
+            "ConditionNorm": condition,
+            "BaseRaw": data["BaseRaw"].array,
+            "Method": pd.Categorical.from_codes(np.zeros(len(data), dtype=np.int8), categories=[label]),
+            "log2FC": data["log2FC"].to_numpy(),
+            "pval":   data["pval"].to_numpy()
+        }))
 
     combined = pd.concat(wide_blocks, axis=1)
     mean = combined.mean(axis=1)
     std  = combined.std(axis=1).replace(0, np.nan)
     combined_z = combined.sub(mean, axis=0).div(std, axis=0)
 
-    LONG = pd.concat(long_blocks, ignore_index=True)
+    LONG = pd.DataFrame({
+        col: _union_column(long_blocks, col) for col in ("GATA", "ConditionNorm", "BaseRaw", "Method")
+    })
+    LONG["log2FC"] = np.concatenate([b["log2FC"].to_numpy() for b in long_blocks])
+    LONG["pval"] = np.concatenate([b["pval"].to_numpy() for b in long_blocks])
 
     # совместимые «старые» своды по нормализованным условиям (могут не пригодиться далее)
-    M_log2 = LONG.pivot_table(index=["GATA", "ConditionNorm"], columns="Method", values="log2FC", aggfunc="mean").sort_index()
-    M_p    = LONG.pivot_table(index=["GATA", "ConditionNorm"], columns="Method", values="pval",   aggfunc="min").reindex(index=M_log2.index, columns=M_log2.columns)
+    M_log2, M_p = pivot_methods(LONG, ["GATA", "ConditionNorm"])
 
+    _BUILD_CACHE.clear()
+    _BUILD_CACHE[build_key] = (combined_z, M_log2, M_p, LONG)
     return combined_z, M_log2, M_p, LONG
 
+def map_groups(LONG: pd.DataFrame, mapping: dict) -> pd.Series:
+    """Группа сопоставления для каждой строки LONG по ключу "Method||BaseRaw" (ключ считается по уникальным парам)."""
+    pairs = LONG[["Method", "BaseRaw"]].drop_duplicates()
+    keys = pairs["Method"].astype(str) + "||" + pairs["BaseRaw"].astype(str)
+    pairs = pairs.assign(Group=keys.map(mapping).to_numpy())
+    return LONG[["Method", "BaseRaw"]].merge(pairs, on=["Method", "BaseRaw"], how="left")["Group"].set_axis(LONG.index)
+
 # ---------- Корреляции (автовыбор метода) ----------
 
 def _iqr_outlier_fraction(x: np.ndarray) -> float:
@@ -203,28 +303,6 @@ def _normality_ok(x: np.ndarray) -> bool:
     uniq = np.unique(np.round(x, 3)).size
     return (uniq / max(1, x.size)) > 0.5
 
-def _pearson(x, y):
-    r = np.corrcoef(x, y)[0, 1]
-    p = np.nan
-    if SCIPY_AVAILABLE:
-        try:
-            r, p = stats.pearsonr(x, y)
-        except Exception:
-            p = np.nan
-    return float(r), (float(p) if np.isfinite(p) else np.nan)
-
-def _spearman(x, y):
-    if SCIPY_AVAILABLE:
-        try:
-            res = stats.spearmanr(x, y, nan_policy='omit')
-            return float(res.correlation), float(res.pvalue)
-        except Exception:
-            pass
-    sx = pd.Series(x).rank().to_numpy()
-    sy = pd.Series(y).rank().to_numpy()
-    r = np.corrcoef(sx, sy)[0, 1]
-    return float(r), np.nan
-
 def _kendall(x, y):
     if SCIPY_AVAILABLE:
         try:
@@ -236,76 +314,386 @@ def _kendall(x, y):
             return np.nan, np.nan
     return np.nan, np.nan
 
-def _auto_method(x, y):
-    n = len(x)
-    if n < 3:  return "kendall" if SCIPY_AVAILABLE and n >= 2 else "spearman"
-    if n < 10: return "kendall" if SCIPY_AVAILABLE else "spearman"
-    out_frac = max(_iqr_outlier_fraction(x), _iqr_outlier_fraction(y))
-    norm_ok = _normality_ok(x) and _normality_ok(y)
-    return "pearson" if (norm_ok and out_frac < 0.10) else "spearman"
+METHOD_CODES = {"pearson": "P", "spearman": "S", "kendall": "K"}
+
+def _pair_weights(M_log2: pd.DataFrame, M_p: pd.DataFrame, alpha: float, pair_rule: str):
+    """
+    Маски наблюдений по столбцам. Маска пары (i, j) = A_i & A_j & ~(G_i & G_j);
+    G нужна только для правила 'any' (строки, где оба p-value незначимы).
+    """
+    X = M_log2.to_numpy(dtype=float)
+    Pv = M_p.reindex(index=M_log2.index, columns=M_log2.columns).to_numpy(dtype=float)
+    finite = np.isfinite(X)
+    signif = np.isfinite(Pv) & (Pv <= alpha)
+    if pair_rule == 'both':
+        return X, finite & signif, None
+    if pair_rule == 'any':
+        return X, finite, finite & ~signif
+    if pair_rule == 'none':
+        return X, finite, None
+    raise ValueError("Unknown pair_rule")
+
+def _masked_pair_sums(X: np.ndarray, W: np.ndarray):
+    # суммы по всем парам столбцов сразу: n, Σx, Σy, Σx², Σy², Σxy на пересечении масок
+    W = W.astype(float)
+    WX = W * X
+    WX2 = WX * X
+    n = W.T @ W
+    sx = WX.T @ W
+    sxx = WX2.T @ W
+    sxy = WX.T @ WX
+    return n, sx, sx.T, sxx, sxx.T, sxy
+
+def _masked_pearson(X: np.ndarray, A: np.ndarray, G: np.ndarray | None):
+    # центрирование по столбцам уменьшает потерю точности в Σxy - ΣxΣy/n
+    X = np.where(A, X, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        center = np.nanmean(X, axis=0)
+    X = np.nan_to_num(X - np.nan_to_num(center), nan=0.0)
+    n, sx, sy, sxx, syy, sxy = _masked_pair_sums(X, A)
+    if G is not None:
+        sums_g = _masked_pair_sums(X, G)
+        n, sx, sy, sxx, syy, sxy = (s - g for s, g in zip((n, sx, sy, sxx, syy, sxy), sums_g))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        vx = sxx - sx * sx / n
+        vy = syy - sy * sy / n
+        r = cov / np.sqrt(vx * vy)
+    # постоянный столбец в пределах маски пары -> r не определён
+    degenerate = (n < 2) | (vx <= 1e-12 * np.abs(sxx)) | (vy <= 1e-12 * np.abs(syy))
+    r = np.where(degenerate, np.nan, np.clip(r, -1.0, 1.0))
+    return r, np.rint(n).astype(int), degenerate
+
+def _tie_bounds(S: np.ndarray):
+    # для отсортированных столбцов: позиции начала и конца группы равных значений
+    n = S.shape[0]
+    idx = np.arange(n)[:, None]
+    first = np.ones(S.shape, dtype=bool); first[1:] = S[1:] != S[:-1]
+    last = np.ones(S.shape, dtype=bool); last[:-1] = S[:-1] != S[1:]
+    start = np.maximum.accumulate(np.where(first, idx, 0), axis=0)
+    end = np.minimum.accumulate(np.where(last, idx, n - 1)[::-1], axis=0)[::-1]
+    return start, end
+
+def _masked_ranks(Ms: np.ndarray, start: np.ndarray | None, end: np.ndarray | None) -> np.ndarray:
+    # средние ранги (как rankdata 'average') только среди отмеченных строк отсортированного столбца
+    cs = np.cumsum(Ms, axis=0, dtype=np.int64)
+    if start is None:
+        return cs.astype(float)
+    Ms = Ms.astype(np.int64)
+    before = np.take_along_axis(cs, start, axis=0) - np.take_along_axis(Ms, start, axis=0)
+    count = np.take_along_axis(cs, end, axis=0) - before
+    return before + (count + 1) / 2.0
+
+def _weighted_pearson(U: np.ndarray, V: np.ndarray, W: np.ndarray) -> np.ndarray:
+    # корреляция по столбцам только на строках, где W = 1
+    W = W.astype(float)
+    n = W.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = (W * U).sum(axis=0) / n
+        mv = (W * V).sum(axis=0) / n
+        du = W * (U - mu); dv = W * (V - mv)
+        r = (du * dv).sum(axis=0) / np.sqrt((du * du).sum(axis=0) * (dv * dv).sum(axis=0))
+    return np.clip(r, -1.0, 1.0)
+
+def _masked_spearman(X: np.ndarray, A: np.ndarray, G: np.ndarray | None):
+    """
+    Spearman по всем парам: ранги зависят от маски пары, поэтому каждый столбец
+    сортируется один раз, а ранги внутри маски пары получаются накопленными суммами
+    маски в отсортированном порядке — сразу для всех пар (i, j > i).
+    """
+    m = X.shape[1]
+    R = np.full((m, m), np.nan)
+    order = np.argsort(X, axis=0, kind="stable")
+    start, end = _tie_bounds(np.take_along_axis(X, order, axis=0))
+    ties = not np.array_equal(start, end)
+    for i in range(m - 1):
+        cols = slice(i + 1, m)
+        mask = A[:, [i]] & A[:, cols]
+        if G is not None:
+            mask &= ~(G[:, [i]] & G[:, cols])
+
+        # ранги x_j внутри маски каждой пары
+        order_j = order[:, cols]
+        rj_sorted = _masked_ranks(np.take_along_axis(mask, order_j, axis=0),
+                                  start[:, cols] if ties else None, end[:, cols] if ties else None)
+        rj = np.empty(mask.shape)
+        np.put_along_axis(rj, order_j, rj_sorted, axis=0)
+
+        # ранги x_i внутри тех же масок
+        order_i = order[:, i]
+        shape = mask.shape
+        ri_sorted = _masked_ranks(mask[order_i],
+                                  np.broadcast_to(start[:, [i]], shape) if ties else None,
+                                  np.broadcast_to(end[:, [i]], shape) if ties else None)
+        ri = np.empty(shape)
+        ri[order_i] = ri_sorted
+
+        r = _weighted_pearson(ri, rj, mask)
+        R[i, cols] = r; R[cols, i] = r
+    return R
+
+def _t_pvalues(r: np.ndarray, n: np.ndarray, p_two: float = 1.0) -> np.ndarray:
+    # двусторонний p-value из t-распределения с n-2 степенями свободы (как у pearsonr/spearmanr);
+    # при n = 2 (0 степеней свободы) — p_two: pearsonr даёт 1.0, spearmanr — NaN
+    if not SCIPY_AVAILABLE:
+        return np.full(r.shape, np.nan)
+    df = n - 2.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = r * np.sqrt(df / np.maximum(1.0 - r * r, 1e-300))
+        p = 2.0 * stats.t.sf(np.abs(t), np.maximum(df, 1.0))
+    p = np.where(df > 0, p, p_two)
+    return np.where(np.isfinite(r), np.clip(p, 0.0, 1.0), np.nan)
+
+def _column_diagnostics(X: np.ndarray, A: np.ndarray):
+    """Нормальность и доля IQR-выбросов для каждого столбца — считаются один раз."""
+    norm_ok = np.zeros(X.shape[1], dtype=bool)
+    out_frac = np.zeros(X.shape[1])
+    for k in range(X.shape[1]):
+        col = X[A[:, k], k]
+        norm_ok[k] = _normality_ok(col)
+        out_frac[k] = _iqr_outlier_fraction(col)
+    return norm_ok, out_frac
+
+def _auto_methods(n: np.ndarray, norm_ok: np.ndarray, out_frac: np.ndarray) -> np.ndarray:
+    small = "kendall" if SCIPY_AVAILABLE else "spearman"
+    pair_norm = norm_ok[:, None] & norm_ok[None, :]
+    pair_out = np.maximum(out_frac[:, None], out_frac[None, :])
+    large = np.where(pair_norm & (pair_out < 0.10), "pearson", "spearman")
+    return np.where(n < 10, small, large)
 
 def compute_pairwise_correlation_matrices(M_log2: pd.DataFrame,
                                           M_p: pd.DataFrame,
                                           alpha: float,
                                           pair_rule: str,
                                           corr_mode: str):
+    """
+    Корреляции для всех пар методов сразу: Pearson и Spearman считаются матричными
+    операциями на масках попарно полных наблюдений, p-value — из t-распределения.
+    В режиме auto метод выбирается по n пары и по диагностике столбцов (нормальность,
+    доля выбросов), которая считается один раз на столбец.
+    """
     methods = list(M_log2.columns)
     m = len(methods)
-    R  = pd.DataFrame(np.nan, index=methods, columns=methods)
-    P  = pd.DataFrame(np.nan, index=methods, columns=methods)
-    N  = pd.DataFrame(0,     index=methods, columns=methods, dtype=int)
-    Mth = pd.DataFrame("NA", index=methods, columns=methods, dtype=object)
-
-    for i in range(m):
-        R.iloc[i, i] = 1.0
-        P.iloc[i, i] = 0.0
-        N.iloc[i, i] = M_log2[methods[i]].notna().sum()
-        Mth.iloc[i, i] = "—"
-
-    for i in range(m):
-        for j in range(i+1, m):
-            xi = M_log2.iloc[:, i].to_numpy()
-            xj = M_log2.iloc[:, j].to_numpy()
-            pi = M_p.iloc[:, i].to_numpy()
-            pj = M_p.iloc[:, j].to_numpy()
-
-            mask = np.isfinite(xi) & np.isfinite(xj)
-            if pair_rule == 'both':
-                mask &= np.isfinite(pi) & np.isfinite(pj) & (pi <= alpha) & (pj <= alpha)
-            elif pair_rule == 'any':
-                any_ok = ((np.isfinite(pi) & (pi <= alpha)) | (np.isfinite(pj) & (pj <= alpha)))
-                mask &= any_ok
-            elif pair_rule == 'none':
-                pass
-            else:
-                raise ValueError("Unknown pair_rule")
+    X, A, G = _pair_weights(M_log2, M_p, alpha, pair_rule)
+
+    r_p, n, degenerate = _masked_pearson(X, A, G)
+    r_s = _masked_spearman(X, A, G)
+    values = {
+        "pearson": (r_p, _t_pvalues(r_p, n)),
+        "spearman": (r_s, _t_pvalues(r_s, n, p_two=np.nan)),
+    }
+
+    if corr_mode == 'auto':
+        norm_ok, out_frac = _column_diagnostics(X, A)
+        chosen = _auto_methods(n, norm_ok, out_frac)
+    else:
+        chosen = np.full((m, m), corr_mode, dtype=object)
+
+    r_k = np.full((m, m), np.nan); p_k = np.full((m, m), np.nan)
+    for i, j in zip(*np.nonzero(np.triu(chosen == "kendall", k=1) & ~degenerate)):
+        mask = A[:, i] & A[:, j]
+        if G is not None:
+            mask &= ~(G[:, i] & G[:, j])
+        r_k[i, j], p_k[i, j] = _kendall(X[mask, i], X[mask, j])
+        r_k[j, i], p_k[j, i] = r_k[i, j], p_k[i, j]
+    values["kendall"] = (r_k, p_k)
+
+    fallbacks = {"pearson": ["spearman", "kendall"], "spearman": ["pearson", "kendall"], "kendall": ["spearman", "pearson"]}
+    R_arr = np.full((m, m), np.nan); P_arr = np.full((m, m), np.nan)
+    codes = np.full((m, m), "NA", dtype=object)
+    for meth in METHOD_CODES:
+        for cand in [meth] + fallbacks[meth]:
+            r_c, p_c = values[cand]
+            pick = (chosen == meth) & ~degenerate & np.isnan(R_arr) & np.isfinite(r_c)
+            R_arr[pick] = r_c[pick]; P_arr[pick] = p_c[pick]
+            codes[pick] = METHOD_CODES[cand]
+
+    diag = np.arange(m)
+    R_arr[diag, diag] = 1.0; P_arr[diag, diag] = 0.0
+    codes[diag, diag] = "—"
+    n = n.copy(); n[diag, diag] = M_log2.notna().sum().to_numpy()
+
+    R  = pd.DataFrame(R_arr, index=methods, columns=methods)
+    P  = pd.DataFrame(P_arr, index=methods, columns=methods)
+    N  = pd.DataFrame(n, index=methods, columns=methods, dtype=int)
+    Mth = pd.DataFrame(codes, index=methods, columns=methods, dtype=object)
+    return R, P, N, Mth
 
-            x = xi[mask]; y = xj[mask]
-            n = x.size
-            N.iloc[i, j] = n; N.iloc[j, i] = n
+# ---------- Перестановки и бутстрэп ----------
+
+RESAMPLE_BLOCK_ELEMENTS = 2_000_000  # ограничение размера блока ресэмплов (элементов массива)
+CODE_METHODS = {code: meth for meth, code in METHOD_CODES.items()}
+
+def _rowwise_pearson(U: np.ndarray, V: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        du = U - U.mean(axis=1, keepdims=True)
+        dv = V - V.mean(axis=1, keepdims=True)
+        r = (du * dv).sum(axis=1) / np.sqrt((du * du).sum(axis=1) * (dv * dv).sum(axis=1))
+    return np.clip(r, -1.0, 1.0)
+
+def _dense_ranks(v: np.ndarray) -> np.ndarray:
+    # целочисленные ранги 1..k (равные значения — один ранг); порядок сохраняется при любой выборке индексов
+    return np.unique(v, return_inverse=True)[1].reshape(v.shape).astype(np.int64) + 1
+
+def _rowwise_ranks(U: np.ndarray) -> np.ndarray:
+    # средние ранги по строкам целочисленных рангов (_dense_ranks): подсчёт повторов вместо сортировки
+    rows, k = U.shape[0], int(U.max()) + 1
+    cnt = np.bincount((np.arange(rows)[:, None] * k + U).ravel(), minlength=rows * k).reshape(rows, k)
+    mid = np.cumsum(cnt, axis=1) - (cnt - 1) / 2.0
+    return np.take_along_axis(mid, U, axis=1)
+
+def _tied_pairs(K: np.ndarray) -> np.ndarray:
+    """Число пар равных значений в каждой строке K, отсортированной по строкам."""
+    pos = np.broadcast_to(np.arange(K.shape[1]), K.shape)
+    new = np.ones(K.shape, dtype=bool)
+    new[:, 1:] = K[:, 1:] != K[:, :-1]
+    run_start = np.maximum.accumulate(np.where(new, pos, 0), axis=1)
+    return (pos - run_start).sum(axis=1)
+
+def _rowwise_kendall(XR: np.ndarray, YR: np.ndarray) -> np.ndarray:
+    """
+    tau-b по строкам целочисленных рангов (_dense_ranks) за O(n log n) на строку.
+    Строки сортируются по (x, y); дерево Фенвика по рангам y даёт для каждого
+    наблюдения число предыдущих с меньшим y. Отсюда S = Σ sign(dx)·sign(dy):
+    S = 2·Σ less − n0 + T_y − T_x + T_xy, где T — числа пар со связями по x, y и по обоим.
+    """
+    rows, n = XR.shape
+    n0 = n * (n - 1) // 2
+    m = int(YR.max()) if YR.size else 0
+    key = XR * (m + 1) + YR
+    order = np.argsort(key, axis=1, kind="stable")
+    key = np.take_along_axis(key, order, axis=1)
+    Y = np.take_along_axis(YR, order, axis=1)
+    t_x = _tied_pairs(key // (m + 1))
+    t_xy = _tied_pairs(key)
+    t_y = _tied_pairs(np.sort(YR, axis=1))
+
+    # деревья всех строк блока в одном плоском массиве; позиция m + 1 — приёмник выходов за край
+    width = m + 2
+    tree = np.zeros(rows * width, dtype=np.int64)
+    base = np.arange(rows, dtype=np.int64) * width
+    steps = (m + 1).bit_length()
+    less = np.zeros(rows, dtype=np.int64)
+    for p in range(n):
+        v = Y[:, p]
+        idx = v - 1
+        for _ in range(steps):
+            less += tree[base + idx]
+            idx = idx - (idx & -idx)
+        idx = v
+        for _ in range(steps):
+            tree[base + idx] += 1
+            idx = np.minimum(idx + (idx & -idx), m + 1)
+    s = 2 * less - n0 + t_y - t_x + t_xy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return s / np.sqrt((n0 - t_x) * (n0 - t_y).astype(float))
+
+def _rowwise_corr(U: np.ndarray, V: np.ndarray, method: str) -> np.ndarray:
+    """Корреляция по строкам: каждая строка U, V — один ресэмпл (для spearman/kendall — ранги _dense_ranks)."""
+    if method == "pearson":
+        return _rowwise_pearson(U, V)
+    if method == "spearman":
+        return _rowwise_pearson(_rowwise_ranks(U), _rowwise_ranks(V))
+    return _rowwise_kendall(U, V)
+
+def _resample_pair(x: np.ndarray, y: np.ndarray, method: str, n_resamples: int, seed: int, ci: float):
+    """
+    Перестановочный p-value и бутстрэп-интервал для одной пары. Ресэмплы
+    генерируются блоками как двумерные массивы индексов (ресэмпл × наблюдение).
+    Ранги считаются один раз: перестановка переставляет ранги, поэтому Spearman
+    в перестановках — Pearson на рангах; бутстрэп работает с целочисленными рангами.
+    """
+    rng = np.random.default_rng(seed)
+    n = x.size
+    if method != "pearson":
+        x, y = _dense_ranks(x), _dense_ranks(y)
+    r_obs = float(_rowwise_corr(x[None, :], y[None, :], method)[0])
+    if method == "spearman":
+        px, py, perm_method = _rowwise_ranks(x[None, :])[0], _rowwise_ranks(y[None, :])[0], "pearson"
+    else:
+        px, py, perm_method = x, y, method
+    block = max(1, RESAMPLE_BLOCK_ELEMENTS // max(1, n))
+
+    exceed = 0
+    boot = []
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        perm = np.argsort(rng.random((size, n)), axis=1)
+        r_perm = _rowwise_corr(np.broadcast_to(px, (size, n)), py[perm], perm_method)
+        exceed += int(np.sum(np.abs(r_perm) >= abs(r_obs) - 1e-12))
+
+        idx = rng.integers(0, n, size=(size, n))
+        boot.append(_rowwise_corr(x[idx], y[idx], method))
+
+    boot = np.concatenate(boot) if boot else np.array([])
+    tail = (1.0 - ci) / 2.0 * 100.0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lo, hi = np.nanpercentile(boot, [tail, 100.0 - tail]) if np.isfinite(boot).any() else (np.nan, np.nan)
+    return {
+        "r_resample": r_obs,
+        "perm_p": (exceed + 1) / (n_resamples + 1),
+        "boot_ci_low": float(lo), "boot_ci_high": float(hi),
+    }
+
+def _resample_task(args):
+    mi, mj, x, y, method, n_resamples, seed, ci = args
+    res = _resample_pair(x, y, method, n_resamples, seed, ci)
+    return {"method_i": mi, "method_j": mj, **res}
+
+RESAMPLE_COLUMNS = ["method_i", "method_j", "r_resample", "perm_p", "boot_ci_low", "boot_ci_high"]
+
+def resample_tasks(M_log2: pd.DataFrame, M_p: pd.DataFrame, alpha: float, pair_rule: str, Mth: pd.DataFrame,
+                   n_resamples: int = 2000, ci: float = 0.95, seed: int = 0) -> list[tuple]:
+    """
+    Задания _resample_task для всех пар методов: метод пары берётся из Mth (P/S/K),
+    пары без метода (NA) и с n < 3 пропускаются.
+    """
+    methods = list(M_log2.columns)
+    seeds = np.random.SeedSequence(seed).generate_state(max(1, len(methods) ** 2))
+    tasks = []
+    for i in range(len(methods)):
+        for j in range(i + 1, len(methods)):
+            mi, mj = methods[i], methods[j]
+            method = CODE_METHODS.get(Mth.loc[mi, mj])
+            if method is None:
+                continue
+            x, y = _paired_xy(M_log2, M_p, alpha, pair_rule, mi, mj)
+            if x.size < 3:
+                continue
+            tasks.append((mi, mj, x, y, method, n_resamples, int(seeds[i * len(methods) + j]), ci))
+    return tasks
+
+def resample_frame(rows: list[dict], n_resamples: int) -> pd.DataFrame:
+    out = pd.DataFrame(rows, columns=RESAMPLE_COLUMNS)
+    out["n_resamples"] = n_resamples
+    return out
+
+def resample_pairwise_correlations(M_log2: pd.DataFrame, M_p: pd.DataFrame,
+                                   alpha: float, pair_rule: str, Mth: pd.DataFrame,
+                                   n_resamples: int = 2000, ci: float = 0.95,
+                                   seed: int = 0, workers: int | None = None) -> pd.DataFrame:
+    """
+    Перестановочные p-value и бутстрэп-доверительные интервалы для всех пар методов.
+    Для каждой пары используется метод, выбранный в compute_pairwise_correlation_matrices
+    (Mth: P/S/K); пары без метода (NA) пропускаются. workers > 1 распределяет пары по процессам.
+    """
+    tasks = resample_tasks(M_log2, M_p, alpha, pair_rule, Mth, n_resamples, ci, seed)
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            rows = list(pool.map(_resample_task, tasks))
+    else:
+        rows = [_resample_task(t) for t in tasks]
+    return resample_frame(rows, n_resamples)
 
-            if n < 2 or np.all(x == x[0]) or np.all(y == y[0]):
-                r = np.nan; p = np.nan; code = "NA"
-            else:
-                meth = corr_mode if corr_mode != 'auto' else _auto_method(x, y)
-                def _compute(method_name):
-                    if method_name == 'pearson':  return _pearson(x, y), 'P'
-                    if method_name == 'spearman': return _spearman(x, y), 'S'
-                    if method_name == 'kendall':  return _kendall(x, y), 'K'
-                    return ((np.nan, np.nan), 'NA')
-                (r, p), code = _compute(meth)
-                if not np.isfinite(r):
-                    for fb in (['spearman','kendall','pearson'] if meth=='pearson'
-                               else ['pearson','kendall','spearman'] if meth=='spearman'
-                               else ['spearman','pearson','kendall']):
-                        (r, p), code = _compute(fb)
-                        if np.isfinite(r): break
-
-            R.iloc[i, j] = r; R.iloc[j, i] = r
-            P.iloc[i, j] = p; P.iloc[j, i] = p
-            Mth.iloc[i, j] = code; Mth.iloc[j, i] = code
+# сборка результатов фонового ресэмплинга: ждёт futures пар и дописывает таблицу, не блокируя GUI
+_RESAMPLE_WRITER = ThreadPoolExecutor(max_workers=1)
 
-    return R, P, N, Mth
+def _write_resampled_details(det_df: pd.DataFrame, det_csv: str, pair_futures: list, n_resamples: int) -> str:
+    res_df = resample_frame([f.result() for f in pair_futures], n_resamples)
+    det_df.merge(res_df, on=["method_i", "method_j"], how="left").to_csv(det_csv, index=False)
+    return det_csv
 
 # ---------- Визуализация ----------
 
@@ -375,82 +763,211 @@ def _paired_xy(M_log2: pd.DataFrame, M_p: pd.DataFrame, a: float, rule: str, m1:
         pass
     return xi[mask], xj[mask]
 
-def plot_panel_c_scatter(M_log2: pd.DataFrame, M_p: pd.DataFrame,
-                         alpha: float, pair_rule: str,
-                         corr_mode: str, out_path_png: str):
-    methods = list(M_log2.columns)
+PANEL_COLS = 3
+PANEL_PAGE_SIZE = 12  # подграфиков на страницу в режиме «все пары»
+
+def panel_pairs(methods: list[str], all_pairs: bool = False) -> list[tuple[str, str]]:
+    """Пары для панелей (c, d): RT-qPCR (или первый метод) против остальных либо все пары методов."""
+    if all_pairs:
+        return [(methods[i], methods[j]) for i in range(len(methods)) for j in range(i + 1, len(methods))]
     target = _find_rt_qpcr_label(methods) or (methods[0] if len(methods) >= 2 else None)
-    if target is None: return
-    pairs = [(target, m) for m in methods if m != target]
+    if target is None: return []
+    return [(target, m) for m in methods if m != target]
+
+def pair_items(M_log2: pd.DataFrame, M_p: pd.DataFrame, alpha: float, pair_rule: str,
+               pairs: list[tuple[str, str]], R: pd.DataFrame, P: pd.DataFrame, Mth: pd.DataFrame) -> list[tuple]:
+    """
+    Парные массивы для всех панелей сразу (маски из _pair_weights считаются один раз);
+    r, p и метод берутся из уже посчитанных матриц корреляций.
+    Элемент: (m1, m2, x, y, r, p, code).
+    """
+    X, A, G = _pair_weights(M_log2, M_p, alpha, pair_rule)
+    col = {m: k for k, m in enumerate(M_log2.columns)}
+    items = []
+    for m1, m2 in pairs:
+        i, j = col[m1], col[m2]
+        mask = A[:, i] & A[:, j]
+        if G is not None:
+            mask &= ~(G[:, i] & G[:, j])
+        items.append((m1, m2, X[mask, i], X[mask, j],
+                      float(R.loc[m1, m2]), float(P.loc[m1, m2]), str(Mth.loc[m1, m2])))
+    return items
+
+def _draw_scatter(ax, m1, m2, x, y, r, p, code):
+    if x.size >= 2:
+        ax.scatter(x, y, s=28, alpha=0.8)
+        try:
+            coef = np.polyfit(x, y, 1)
+            xs = np.linspace(np.min(x), np.max(x), 100)
+            ys = coef[0]*xs + coef[1]
+            ax.plot(xs, ys, linewidth=2)
+        except Exception:
+            pass
+        ax.set_title(f"{m1} vs {m2}\nr={r:.2f} (p={p:.3g}) | {code}, n={x.size}")
+    else:
+        ax.set_title(f"{m1} vs {m2}\nНедостаточно пар")
+    ax.set_xlabel(m1); ax.set_ylabel(m2)
+
+def _draw_bland_altman(ax, m1, m2, x, y, r, p, code):
+    if x.size >= 2:
+        mean = (x + y) / 2.0
+        diff = (y - x)
+        md = np.mean(diff)
+        sd = np.std(diff, ddof=1) if diff.size > 1 else 0.0
+        loa1 = md - 1.96*sd; loa2 = md + 1.96*sd
+        ax.scatter(mean, diff, s=28, alpha=0.8)
+        ax.axhline(md, linestyle='--'); ax.axhline(loa1, linestyle=':'); ax.axhline(loa2, linestyle=':')
+        ax.set_title(f"Bland–Altman: {m1} vs {m2}\nΔ= {md:.2f} ± 1.96·SD")
+        ax.set_xlabel("Mean"); ax.set_ylabel("Difference (m2 - m1)")
+    else:
+        ax.set_title(f"Bland–Altman: {m1} vs {m2}\nНедостаточно пар")
 
-    nplots = len(pairs)
+PANEL_DRAWERS = {"scatter": _draw_scatter, "bland_altman": _draw_bland_altman}
+
+def plot_pair_page(kind: str, items: list[tuple], out_path_png: str):
+    """Одна страница панелей: подграфик на каждую пару из items."""
+    nplots = len(items)
     if nplots == 0: return
-    ncol = 3; nrow = int(np.ceil(nplots / ncol))
-    plt.figure(figsize=(6*ncol, 5*nrow))
-
-    idx = 1
-    for (m1, m2) in pairs:
-        x, y = _paired_xy(M_log2, M_p, alpha, pair_rule, m1, m2)
-        plt.subplot(nrow, ncol, idx)
-        if x.size >= 2:
-            plt.scatter(x, y, s=28, alpha=0.8)
-            try:
-                coef = np.polyfit(x, y, 1)
-                xs = np.linspace(np.min(x), np.max(x), 100)
-                ys = coef[0]*xs + coef[1]
-                plt.plot(xs, ys, linewidth=2)
-            except Exception:
-                pass
-            method_used = corr_mode if corr_mode != 'auto' else _auto_method(x, y)
-            if method_used == 'pearson':   r, p = _pearson(x, y);  code = "P"
-            elif method_used == 'spearman': r, p = _spearman(x, y); code = "S"
-            else:                           r, p = _kendall(x, y);  code = "K"
-            n = x.size
-            plt.title(f"{m1} vs {m2}\nr={r:.2f} (p={p:.3g}) | {code}, n={n}")
-        else:
-            plt.title(f"{m1} vs {m2}\nНедостаточно пар")
-        plt.xlabel(m1); plt.ylabel(m2); idx += 1
+    ncol = PANEL_COLS; nrow = int(np.ceil(nplots / ncol))
+    fig, axes = plt.subplots(nrow, ncol, figsize=(6*ncol, 5*nrow), squeeze=False)
+    draw = PANEL_DRAWERS[kind]
+    for ax, item in zip(axes.flat, items):
+        draw(ax, *item)
+    for ax in axes.flat[nplots:]:
+        ax.set_visible(False)
+    fig.tight_layout(); fig.savefig(out_path_png, dpi=300); plt.close(fig)
+
+def _init_render_worker():
+    plt.switch_backend("Agg")
+
+def _render_page_task(cache_dir: str | None, kind: str, items: list[tuple], out_path_png: str) -> str:
+    render_cached(cache_dir, plot_pair_page, out_path_png, kind, items)
+    return out_path_png
+
+def render_pair_panels(M_log2: pd.DataFrame, M_p: pd.DataFrame, alpha: float, pair_rule: str,
+                       R: pd.DataFrame, P: pd.DataFrame, Mth: pd.DataFrame, out_dir: str,
+                       all_pairs: bool = False, executor=None, cache_dir: str | None = None):
+    """
+    Панели (c) scatter и (d) Bland–Altman. В режиме all_pairs — все пары методов,
+    по PANEL_PAGE_SIZE подграфиков на страницу (ALLTABLE_panel_*_all_pairs_NN.png).
+    С executor страницы рисуются в пуле процессов: возвращаются пути и futures,
+    которые вызывающий код может дождаться или опрашивать.
+    """
+    items = pair_items(M_log2, M_p, alpha, pair_rule, panel_pairs(list(M_log2.columns), all_pairs), R, P, Mth)
+    if all_pairs:
+        pages = [items[k:k + PANEL_PAGE_SIZE] for k in range(0, len(items), PANEL_PAGE_SIZE)]
+    else:
+        pages = [items] if items else []
+
+    paths, futures = [], []
+    for kind, base in (("scatter", "ALLTABLE_panel_c_scatter"), ("bland_altman", "ALLTABLE_panel_d_bland_altman")):
+        for k, page in enumerate(pages):
+            name = f"{base}_all_pairs_{k + 1:02d}.png" if all_pairs else f"{base}.png"
+            path = os.path.join(out_dir, name)
+            paths.append(path)
+            if executor is not None:
+                futures.append(executor.submit(_render_page_task, cache_dir, kind, page, path))
+            else:
+                _render_page_task(cache_dir, kind, page, path)
+    return paths, futures
+
+def render_cached(cache_dir: str | None, plot_fn, out_path_png: str, *args):
+    """Вызывает plot_fn(*args, out_path_png), если такой картинки ещё нет в кэше."""
+    key = render_key(plot_fn, *args)
+    cached_render(cache_dir, key, out_path_png, lambda: plot_fn(*args, out_path_png))
+
+# ---------- Расчёт по группам (общий для GUI и командной строки) ----------
+
+PROFILE_FILE = "ALLTABLE_profile.json"
+
+def load_profile(path: str) -> dict:
+    """Профиль сопоставления: {"mapping": {"Method||BaseRaw": группа}, "selected_groups": [...] или null}."""
+    with open(path, "r", encoding="utf-8") as f:
+        prof = json.load(f)
+    return {"mapping": dict(prof.get("mapping", {})), "selected_groups": prof.get("selected_groups")}
+
+def save_profile(path: str, mapping: dict, selected_groups: list[str] | None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"mapping": mapping, "selected_groups": selected_groups}, f, ensure_ascii=False, indent=2)
+
+def group_matrices(LONG: pd.DataFrame, mapping: dict):
+    """Своды (ген, группа) × метод только по наблюдениям, попавшим в группы сопоставления."""
+    LONG = LONG.copy()
+    LONG["Group"] = map_groups(LONG, mapping)
+    LONG_sel = LONG[LONG["Group"].notna()].copy()
+    return pivot_methods(LONG_sel, ["GATA", "Group"])
+
+def select_groups(M_log2_grp: pd.DataFrame, M_p_grp: pd.DataFrame, selected_groups):
+    mask_idx = M_log2_grp.index.get_level_values("Group").isin(set(selected_groups))
+    return M_log2_grp.loc[mask_idx], M_p_grp.loc[mask_idx]
+
+def write_group_lists(out_dir: str, groups_all, selected_groups) -> list[str]:
+    paths = [os.path.join(out_dir, "groups_all.txt"), os.path.join(out_dir, "groups_selected.txt")]
+    for path, groups in zip(paths, (groups_all, selected_groups)):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(sorted(map(str, groups))))
+    return paths
+
+def run_correlations(M_log2_sel: pd.DataFrame, M_p_sel: pd.DataFrame,
+                     alpha: float, pair_rule: str, corr_mode: str, out_dir: str,
+                     n_resamples: int = 0, cache_dir: str | None = None,
+                     all_pairs: bool = False, executor=None):
+    """
+    Корреляции, панели (c, d) и ALLTABLE_corr_details.csv по выбранным группам.
+    Возвращает пути файлов и futures фоновых задач (пустой список, если executor не задан):
+    страниц панелей и, при n_resamples > 0, дописывания ресэмплинга в таблицу.
+    """
+    R, P, N, Mth = compute_pairwise_correlation_matrices(
+        M_log2_sel, M_p_sel, alpha=alpha, pair_rule=pair_rule, corr_mode=corr_mode
+    )
+    corr_png = os.path.join(out_dir, "ALLTABLE_corr.png")
+    render_cached(cache_dir, plot_corr_advanced, corr_png, R, P, N, Mth)
 
-    plt.tight_layout(); plt.savefig(out_path_png, dpi=300); plt.close()
+    corr_meth_png = os.path.join(out_dir, "ALLTABLE_corr_methods.png")
+    render_cached(cache_dir, plot_corr_methods, corr_meth_png, Mth, N)
 
-def plot_panel_d_bland_altman(M_log2: pd.DataFrame, M_p: pd.DataFrame,
-                              alpha: float, pair_rule: str,
-                              out_path_png: str):
-    methods = list(M_log2.columns)
-    target = _find_rt_qpcr_label(methods) or (methods[0] if len(methods) >= 2 else None)
-    if target is None: return
-    pairs = [(target, m) for m in methods if m != target]
+    panel_pngs, panel_futures = render_pair_panels(
+        M_log2_sel, M_p_sel, alpha, pair_rule, R, P, Mth, out_dir,
+        all_pairs=all_pairs, executor=executor, cache_dir=cache_dir
+    )
 
-    nplots = len(pairs)
-    if nplots == 0: return
-    ncol = 3; nrow = int(np.ceil(nplots / ncol))
-    plt.figure(figsize=(6*ncol, 5*nrow))
-
-    idx = 1
-    for (m1, m2) in pairs:
-        x, y = _paired_xy(M_log2, M_p, alpha, pair_rule, m1, m2)
-        plt.subplot(nrow, ncol, idx)
-        if x.size >= 2:
-            mean = (x + y) / 2.0
-            diff = (y - x)
-            md = np.mean(diff)
-            sd = np.std(diff, ddof=1) if diff.size > 1 else 0.0
-            loa1 = md - 1.96*sd; loa2 = md + 1.96*sd
-            plt.scatter(mean, diff, s=28, alpha=0.8)
-            plt.axhline(md, linestyle='--'); plt.axhline(loa1, linestyle=':'); plt.axhline(loa2, linestyle=':')
-            plt.title(f"Bland–Altman: {m1} vs {m2}\nΔ= {md:.2f} ± 1.96·SD")
-            plt.xlabel("Mean"); plt.ylabel("Difference (m2 - m1)")
-        else:
-            plt.title(f"Bland–Altman: {m1} vs {m2}\nНедостаточно пар")
-        idx += 1
+    # Детализированная выгрузка
+    details = []
+    methods = list(M_log2_sel.columns)
+    for i in range(len(methods)):
+        for j in range(i+1, len(methods)):
+            mi, mj = methods[i], methods[j]
+            details.append({
+                "method_i": mi, "method_j": mj,
+                "r": R.loc[mi, mj], "p": P.loc[mi, mj], "n": int(N.loc[mi, mj]),
+                "chosen": Mth.loc[mi, mj],
+                "pair_rule": pair_rule, "corr_mode_request": corr_mode
+            })
+    det_df = pd.DataFrame(details)
+    det_csv = os.path.join(out_dir, "ALLTABLE_corr_details.csv")
+    if n_resamples > 0 and not det_df.empty:
+        if executor is not None:
+            # пары считаются в пуле; таблица сохраняется сразу и дописывается по готовности
+            det_df.to_csv(det_csv, index=False)
+            tasks = resample_tasks(M_log2_sel, M_p_sel, alpha, pair_rule, Mth, n_resamples=n_resamples)
+            pair_futures = [executor.submit(_resample_task, t) for t in tasks]
+            panel_futures.append(_RESAMPLE_WRITER.submit(
+                _write_resampled_details, det_df, det_csv, pair_futures, n_resamples))
+            return [corr_png, corr_meth_png] + panel_pngs + [det_csv], panel_futures
+        res_df = resample_pairwise_correlations(
+            M_log2_sel, M_p_sel, alpha, pair_rule, Mth,
+            n_resamples=n_resamples, workers=os.cpu_count()
+        )
+        det_df = det_df.merge(res_df, on=["method_i", "method_j"], how="left")
+    det_df.to_csv(det_csv, index=False)
 
-    plt.tight_layout(); plt.savefig(out_path_png, dpi=300); plt.close()
+    return [corr_png, corr_meth_png] + panel_pngs + [det_csv], panel_futures
 
 # ---------- Диалоги выбора ----------
 
 class ConditionSelectDialog(QDialog):
     """Множественный выбор условий/групп для корреляций (после сопоставления)."""
-    def __init__(self, conditions: list[str], parent=None):
+    def __init__(self, conditions: list[str], parent=None, selected: list[str] | None = None):
         super().__init__(parent)
         self.setWindowTitle("Выбор групп экспериментов для корреляций")
         self.resize(520, 520)
@@ -460,10 +977,11 @@ class ConditionSelectDialog(QDialog):
         self.listw.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
 
         uniq = sorted({str(c) for c in conditions})
+        preselected = set(map(str, selected)) if selected is not None else set(uniq)
         for c in uniq:
             it = QListWidgetItem(c)
-            it.setSelected(True)
             self.listw.addItem(it)
+            it.setSelected(c in preselected)
 
         v.addWidget(QLabel("Отметьте группы, которые войдут в расчёт корреляций и панелей (c, d):"))
         v.addWidget(self.listw)
@@ -501,9 +1019,10 @@ class ConditionPairDialog(QDialog):
     Сопоставление экспериментов (по ПОЛНЫМ названиям BaseRaw + метод).
     Пользователь формирует группы эквивалентных экспериментов; группы используются для корреляций.
     """
-    def __init__(self, records: list[tuple[str, str, str]], parent=None):
+    def __init__(self, records: list[tuple[str, str, str]], parent=None, initial_mapping: dict | None = None):
         """
         records: список кортежей (Method, BaseRaw, ConditionNorm)
+        initial_mapping: сохранённое сопоставление (Method||BaseRaw -> группа) для начального набора групп
         """
         super().__init__(parent)
         self.setWindowTitle("Сопоставление экспериментов (полные названия)")
@@ -551,6 +1070,13 @@ class ConditionPairDialog(QDialog):
 
         # структуры групп: список словарей {'label': ..., 'members': set(ids)}
         self.groups = []
+        if initial_mapping:
+            by_label = {}
+            for mid, label in initial_mapping.items():
+                if mid in self.id2rec:
+                    by_label.setdefault(label, set()).add(mid)
+            self.groups = [{'label': label, 'members': members} for label, members in by_label.items()]
+            self._refresh_groups_view()
 
         # события
         self.btn_make.clicked.connect(self._make_group)
@@ -642,6 +1168,11 @@ class AllTableApp(QWidget):
     def __init__(self):
         super().__init__()
         self.results_folder = load_results_folder()
+        self._render_pool = None
+        self._pending_renders = []
+        self._render_errors = []
+        self._render_timer = QTimer(self)
+        self._render_timer.timeout.connect(self.update_render_status)
         self.init_ui()
 
     def init_ui(self):
@@ -704,12 +1235,25 @@ class AllTableApp(QWidget):
         self.cmb_meth.addItems(["Auto", "Pearson", "Spearman", "Kendall"])
         meth_box.addWidget(meth_label); meth_box.addWidget(self.cmb_meth)
 
+        # перестановки / бутстрэп
+        resample_box = QHBoxLayout()
+        resample_label = QLabel("Перестановки/бутстрэп (0 — выкл.):")
+        self.spn_resamples = QSpinBox(); self.spn_resamples.setRange(0, 100000); self.spn_resamples.setSingleStep(1000)
+        self.spn_resamples.setValue(0)
+        resample_box.addWidget(resample_label); resample_box.addWidget(self.spn_resamples)
+
         h.addWidget(btn_add); h.addWidget(btn_del); h.addStretch(1)
-        h.addLayout(alpha_box); h.addLayout(rule_box); h.addLayout(meth_box); h.addWidget(self.chk_auto)
+        self.chk_all_pairs = QCheckBox("Панели (c, d) для всех пар методов")
+
+        h.addLayout(alpha_box); h.addLayout(rule_box); h.addLayout(meth_box); h.addLayout(resample_box); h.addWidget(self.chk_auto)
+        h.addWidget(self.chk_all_pairs)
         main.addLayout(h)
 
+        bottom = QHBoxLayout()
+        self.lbl_status = QLabel("")
         btn_run = QPushButton("Начать создание"); btn_run.clicked.connect(self.run_build)
-        main.addWidget(btn_run, alignment=Qt.AlignmentFlag.AlignRight)
+        bottom.addWidget(self.lbl_status); bottom.addStretch(1); bottom.addWidget(btn_run)
+        main.addLayout(bottom)
 
         self.setLayout(main)
 
@@ -734,7 +1278,7 @@ class AllTableApp(QWidget):
             start_dir = self.results_folder
             file_name, _ = QFileDialog.getOpenFileName(
                 self, "Выберите файл с данными", start_dir,
-                "Text/TSV files (*.txt *.tsv);;All files (*.*)"
+                "Text/TSV/Parquet files (*.txt *.tsv *.parquet);;All files (*.*)"
             )
             if file_name:
                 self.table.setItem(row, col, QTableWidgetItem(file_name))
@@ -765,8 +1309,13 @@ class AllTableApp(QWidget):
             # 1) Построение теплокарты по всем данным
             combined_z, M_log2_norm, M_p_norm, LONG = build_matrices(datasets, auto_normalize)
             out_dir = self.results_folder if os.path.isdir(self.results_folder) else os.getcwd()
+            cache_dir = cache_folder(out_dir)
             heatmap_png = os.path.join(out_dir, "ALLTABLE_heatmap.png")
-            plot_heatmap(combined_z, heatmap_png)
+            render_cached(cache_dir, plot_heatmap, heatmap_png, combined_z)
+
+            # сохранённый профиль (если есть) подставляется в диалоги как начальный выбор
+            profile_path = os.path.join(out_dir, PROFILE_FILE)
+            profile = load_profile(profile_path) if os.path.exists(profile_path) else {}
 
             # 2) Сопоставление экспериментов по ПОЛНЫМ названиям
             #    records: (Method, BaseRaw, ConditionNorm) — без дублей
@@ -777,7 +1326,7 @@ class AllTableApp(QWidget):
                 QMessageBox.warning(self, "Недостаточно экспериментов",
                                     "Найдено менее двух уникальных экспериментов (по полным названиям)."); return
 
-            dlg_map = ConditionPairDialog(records, self)
+            dlg_map = ConditionPairDialog(records, self, initial_mapping=profile.get("mapping"))
             if dlg_map.exec() != QDialog.DialogCode.Accepted:
                 return
             mapping = dlg_map.mapping()  # ключ: "Method||BaseRaw" -> group_label
@@ -787,88 +1336,76 @@ class AllTableApp(QWidget):
 
             # 3) Построение сводов на основе групп сопоставления
             #    Оставляем ТОЛЬКО те наблюдения, которые попали в группы.
-            LONG = LONG.copy()
-            LONG["__MID__"] = LONG["Method"] + "||" + LONG["BaseRaw"]
-            LONG["Group"] = LONG["__MID__"].map(mapping)
-            LONG_sel = LONG[LONG["Group"].notna()].copy()
-
-            if LONG_sel.empty:
+            M_log2_grp, M_p_grp = group_matrices(LONG, mapping)
+            if M_log2_grp.empty:
                 QMessageBox.warning(self, "Нет данных для корреляций",
                                     "После сопоставления не осталось данных."); return
 
-            # Индекс для корреляций: (GATA, Group)
-            M_log2_grp = LONG_sel.pivot_table(index=["GATA", "Group"], columns="Method", values="log2FC", aggfunc="mean").sort_index()
-            M_p_grp    = LONG_sel.pivot_table(index=["GATA", "Group"], columns="Method", values="pval",   aggfunc="min").reindex(index=M_log2_grp.index, columns=M_log2_grp.columns)
-
             # 4) Дополнительный выбор групп (какие именно группы участвуют)
             groups_all = list(M_log2_grp.index.get_level_values("Group").unique())
-            with open(os.path.join(out_dir, "groups_all.txt"), "w", encoding="utf-8") as f_all:
-                f_all.write("\n".join(sorted(map(str, groups_all))))
-
-            dlg_sel = ConditionSelectDialog(groups_all, self)
+            dlg_sel = ConditionSelectDialog(groups_all, self, selected=profile.get("selected_groups"))
             if dlg_sel.exec() != QDialog.DialogCode.Accepted:
                 return
             selected_groups = dlg_sel.selected_conditions()
             if len(selected_groups) == 0:
                 QMessageBox.warning(self, "Пустой выбор", "Нужно выбрать хотя бы одну группу."); return
-            with open(os.path.join(out_dir, "groups_selected.txt"), "w", encoding="utf-8") as f_sel:
-                f_sel.write("\n".join(sorted(map(str, selected_groups))))
-
-            mask_idx = M_log2_grp.index.get_level_values("Group").isin(set(selected_groups))
-            M_log2_sel = M_log2_grp.loc[mask_idx]
-            M_p_sel    = M_p_grp.loc[mask_idx]
+            group_files = write_group_lists(out_dir, groups_all, selected_groups)
+            save_profile(profile_path, mapping, selected_groups)
 
+            M_log2_sel, M_p_sel = select_groups(M_log2_grp, M_p_grp, selected_groups)
             if M_log2_sel.shape[0] == 0:
                 QMessageBox.warning(self, "Нет данных для корреляций",
                                     "После выбора групп не осталось пар для расчёта."); return
 
-            # 5) Корреляции (расширенные) и панели (c,d) по выбранным ГРУППАМ
-            R, P, N, Mth = compute_pairwise_correlation_matrices(
-                M_log2_sel, M_p_sel, alpha=alpha, pair_rule=pair_rule, corr_mode=corr_mode
-            )
-            corr_png = os.path.join(out_dir, "ALLTABLE_corr.png")
-            plot_corr_advanced(R, P, N, Mth, corr_png)
-
-            corr_meth_png = os.path.join(out_dir, "ALLTABLE_corr_methods.png")
-            plot_corr_methods(Mth, N, corr_meth_png)
-
-            panel_c_png = os.path.join(out_dir, "ALLTABLE_panel_c_scatter.png")
-            plot_panel_c_scatter(M_log2_sel, M_p_sel, alpha, pair_rule, corr_mode, panel_c_png)
-
-            panel_d_png = os.path.join(out_dir, "ALLTABLE_panel_d_bland_altman.png")
-            plot_panel_d_bland_altman(M_log2_sel, M_p_sel, alpha, pair_rule, panel_d_png)
-
-            # 6) Детализированная выгрузка
-            details = []
-            methods = list(M_log2_sel.columns)
-            for i in range(len(methods)):
-                for j in range(i+1, len(methods)):
-                    mi, mj = methods[i], methods[j]
-                    details.append({
-                        "method_i": mi, "method_j": mj,
-                        "r": R.loc[mi, mj], "p": P.loc[mi, mj], "n": int(N.loc[mi, mj]),
-                        "chosen": Mth.loc[mi, mj],
-                        "pair_rule": pair_rule, "corr_mode_request": corr_mode
-                    })
-            det_df = pd.DataFrame(details)
-            det_csv = os.path.join(out_dir, "ALLTABLE_corr_details.csv")
-            det_df.to_csv(det_csv, index=False)
+            # 5-6) Корреляции, панели (c,d) и детализированная выгрузка
+            # панели и ресэмплинг считаются в фоновом пуле процессов, окно остаётся отзывчивым
+            outputs, futures = run_correlations(M_log2_sel, M_p_sel, alpha, pair_rule, corr_mode, out_dir,
+                                                n_resamples=int(self.spn_resamples.value()), cache_dir=cache_dir,
+                                                all_pairs=self.chk_all_pairs.isChecked(), executor=self.render_pool())
+            self.watch_renders(futures)
 
             QMessageBox.information(
                 self, "Готово",
-                "Файлы сохранены:\n"
-                f"{heatmap_png}\n"
-                f"{corr_png}\n"
-                f"{corr_meth_png}\n"
-                f"{panel_c_png}\n"
-                f"{panel_d_png}\n"
-                f"{det_csv}\n"
-                f"{os.path.join(out_dir, 'groups_all.txt')}\n"
-                f"{os.path.join(out_dir, 'groups_selected.txt')}"
+                "Файлы сохранены:\n" + "\n".join([heatmap_png] + outputs + group_files + [profile_path])
+                + ("\n\nПанели (c, d) и ресэмплинг (ALLTABLE_corr_details.csv) досчитываются в фоне"
+                   " — ход виден в строке состояния." if futures else "")
             )
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"{type(e).__name__}: {e}")
 
+    # --- Фоновые задачи: отрисовка панелей и ресэмплинг ---
+    def render_pool(self):
+        if self._render_pool is None:
+            self._render_pool = ProcessPoolExecutor(initializer=_init_render_worker)
+        return self._render_pool
+
+    def watch_renders(self, futures):
+        self._pending_renders = list(futures)
+        self._render_errors = []
+        if self._pending_renders:
+            self._render_timer.start(300)
+        self.update_render_status()
+
+    def update_render_status(self):
+        done = [f for f in self._pending_renders if f.done()]
+        for f in done:
+            if f.exception() is not None:
+                self._render_errors.append(f"{type(f.exception()).__name__}: {f.exception()}")
+        total = len(self._pending_renders)
+        if total == 0 or len(done) == total:
+            self._render_timer.stop()
+            self.lbl_status.setText("Фоновые задачи завершены." if total else "")
+            if self._render_errors:
+                QMessageBox.warning(self, "Ошибка фоновой задачи", "\n".join(self._render_errors))
+            self._pending_renders = []
+        else:
+            self.lbl_status.setText(f"Фоновые задачи (панели, ресэмплинг): {len(done)}/{total}")
+
+    def closeEvent(self, event):
+        if self._render_pool is not None:
+            self._render_pool.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
+
     def collect_datasets(self):
         pairs = []
         for j in range(self.table.columnCount()):
@@ -882,8 +1419,78 @@ class AllTableApp(QWidget):
             pairs.append((label, path))
         return pairs
 
+# ---------- Запуск без GUI ----------
+
+def parse_dataset_arg(text: str) -> tuple[str, str]:
+    label, sep, path = text.partition("=")
+    if not sep:
+        return os.path.splitext(os.path.basename(text))[0], text
+    return label.strip(), path.strip()
+
+def run_headless(args) -> list[str]:
+    """
+    Полный расчёт без диалогов: сопоставление и выбор групп берутся из JSON-профиля,
+    сохранённого предыдущим запуском GUI (ALLTABLE_profile.json).
+    """
+    plt.switch_backend("Agg")
+    datasets = [parse_dataset_arg(d) for d in args.dataset]
+    for _, path in datasets:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Файл не найден: {path}")
+    out_dir = args.out or load_results_folder()
+    os.makedirs(out_dir, exist_ok=True)
+    cache_dir = cache_folder(out_dir)
+    profile = load_profile(args.profile)
+
+    combined_z, _, _, LONG = build_matrices(datasets, not args.no_auto_normalize)
+    heatmap_png = os.path.join(out_dir, "ALLTABLE_heatmap.png")
+    render_cached(cache_dir, plot_heatmap, heatmap_png, combined_z)
+
+    M_log2_grp, M_p_grp = group_matrices(LONG, profile["mapping"])
+    if M_log2_grp.empty:
+        raise ValueError("Ни один эксперимент из файлов не найден в сопоставлении профиля.")
+    groups_all = list(M_log2_grp.index.get_level_values("Group").unique())
+    selected_groups = profile["selected_groups"] if profile["selected_groups"] is not None else groups_all
+    group_files = write_group_lists(out_dir, groups_all, selected_groups)
+
+    M_log2_sel, M_p_sel = select_groups(M_log2_grp, M_p_grp, selected_groups)
+    if M_log2_sel.shape[0] == 0:
+        raise ValueError("После выбора групп из профиля не осталось пар для расчёта.")
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_render_worker) as pool:
+        outputs, futures = run_correlations(M_log2_sel, M_p_sel, args.alpha, args.pair_rule, args.corr_mode, out_dir,
+                                            n_resamples=args.resamples, cache_dir=cache_dir,
+                                            all_pairs=args.all_pairs, executor=pool)
+        for fut in futures:
+            fut.result()
+    return [heatmap_png] + outputs + group_files
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="ALLTABLE: сравнение методов (без аргументов — GUI)")
+    parser.add_argument("--dataset", action="append", default=[], metavar="ИМЯ=ФАЙЛ",
+                        help="набор данных; можно указать несколько раз")
+    parser.add_argument("--profile", help="JSON-профиль сопоставления групп (ALLTABLE_profile.json)")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--pair-rule", choices=["both", "any", "none"], default="both")
+    parser.add_argument("--corr-mode", choices=["auto", "pearson", "spearman", "kendall"], default="auto")
+    parser.add_argument("--resamples", type=int, default=0, help="число перестановок/бутстрэп-выборок (0 — выкл.)")
+    parser.add_argument("--no-auto-normalize", action="store_true", help="не нормализовать названия условий")
+    parser.add_argument("--all-pairs", action="store_true", help="панели (c, d) для всех пар методов")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов для отрисовки панелей и ресэмплинга")
+    parser.add_argument("--out", help="папка результатов (по умолчанию results_folder из settings.json)")
+    return parser.parse_args(argv)
+
 # ---------- Точка входа ----------
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = parse_args(sys.argv[1:])
+        if not args.dataset or not args.profile:
+            sys.exit("Для запуска без GUI нужны --dataset (хотя бы один) и --profile")
+        for path in run_headless(args):
+            print(path)
+        sys.exit(0)
+    if not QT_AVAILABLE:
+        sys.exit("PyQt6 не установлен: используйте запуск с --dataset и --profile")
+
     app = QApplication(sys.argv)
     win = AllTableApp()
     win.show()
@@ -4,32 +4,32 @@ import pandas as pd
 import numpy as np
 from scipy.stats import ttest_ind
 import sys
+from pipeline_log import StepLog
+from results_io import read_table, write_table, latest_table, table_exists
 
 SETTINGS_FILE = "settings.json"
 DEBUG_LOG_FILE = "GTF_results_pvalues_log.txt"
-
-def log(message, logfile=DEBUG_LOG_FILE):
-    print(message)
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(message + "\n")
-
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        sys.exit(1)
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+log = StepLog("GTF_results_pvalues", DEBUG_LOG_FILE)
+
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            sys.exit(1)
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
     folders = settings.get("folders", {})
     results_folder = folders.get("results_folder")
     if not results_folder:
         log("Не задан путь к папке GTF (results_folder) в settings.json!")
         sys.exit(1)
-    return results_folder
+    return results_folder, settings
 
 def get_unique_filename(base_name, extension, folder):
     counter = 1
     file_name = f"{base_name}{extension}"
-    while os.path.exists(os.path.join(folder, file_name)):
+    while table_exists(os.path.join(folder, file_name)):
         file_name = f"{base_name}_{counter}{extension}"
         counter += 1
     return os.path.join(folder, file_name)
@@ -38,18 +38,22 @@ def get_base_name(file_name):
     name = file_name.replace("_merged.gtf", "").replace("_midel_merged.gtf", "").replace("_sorted.gtf", "")
     return name.rstrip("0123456789")
 
-def main():
-    if os.path.exists(DEBUG_LOG_FILE):
-        os.remove(DEBUG_LOG_FILE)
+def main(settings=None, fpkm_all=None, run_folder=None):
+    log.clear()
     log("Начинаем обработку данных...")
 
-    results_folder = load_settings()
-    input_file = os.path.join(results_folder, "GTF_results_fpkm_all.txt")
-    if not os.path.exists(input_file):
-        log(f"Входной файл {input_file} не найден!")
-        sys.exit(1)
-    log(f"Загружаем данные из {input_file}")
-    df = pd.read_csv(input_file, sep="\t")
+    results_folder, settings = load_settings(settings)
+    if fpkm_all is not None:
+        log("Используем данные FPKM, переданные предыдущим шагом.")
+        df = fpkm_all.copy()
+    else:
+        input_folder = run_folder or results_folder
+        input_file = latest_table("GTF_results_fpkm_all", input_folder)
+        if input_file is None:
+            log(f"Входной файл GTF_results_fpkm_all*.txt/.parquet в {input_folder} не найден!")
+            sys.exit(1)
+        log(f"Загружаем данные из {input_file}")
+        df = read_table(input_file, columns=["File", "Gene ID", "GATA Name", "FPKM"])
     log(f"Загружено {len(df)} строк.")
 
     df["Base Name"] = df["File"].apply(get_base_name)
@@ -58,8 +62,9 @@ def main():
     ctrl_df = df[df["Base Name"].str.contains("Control")]
     log(f"Экспериментальных записей: {len(exp_df)}; Контрольных: {len(ctrl_df)}")
 
-    grouped_exp = exp_df.groupby(["Base Name", "Gene ID", "GATA Name"])["FPKM"].apply(list).reset_index()
-    grouped_ctrl = ctrl_df.groupby(["Base Name", "Gene ID", "GATA Name"])["FPKM"].apply(list).reset_index()
+    # observed=True: у категориальных столбцов из parquet иначе появились бы все сочетания категорий
+    grouped_exp = exp_df.groupby(["Base Name", "Gene ID", "GATA Name"], observed=True)["FPKM"].apply(list).reset_index()
+    grouped_ctrl = ctrl_df.groupby(["Base Name", "Gene ID", "GATA Name"], observed=True)["FPKM"].apply(list).reset_index()
     grouped_ctrl["Base Name"] = grouped_ctrl["Base Name"].str.replace("Control", "", regex=False)
 
     merged = pd.merge(grouped_exp, grouped_ctrl, on=["Base Name", "Gene ID", "GATA Name"],
@@ -88,9 +93,16 @@ def main():
         final_df = merged[["Base Name", "Gene ID", "GATA Name", "p-value"]].drop_duplicates()
 
     final_df = final_df.sort_values(by=["Base Name", "Gene ID", "GATA Name"])
-    output_file = get_unique_filename("GTF_results_pvalues", ".txt", results_folder)
-    final_df.to_csv(output_file, sep="\t", index=False)
+    if run_folder:
+        output_file = os.path.join(run_folder, "GTF_results_pvalues.txt")
+    else:
+        output_file = get_unique_filename("GTF_results_pvalues", ".txt", results_folder)
+    write_table(final_df, output_file, settings=settings)
     log(f"Результаты p-value сохранены в {output_file}")
+    return final_df
+
+def run_step(ctx):
+    ctx.data["pvalues"] = main(ctx.settings, ctx.data.get("fpkm_all"), ctx.run_folder)
 
 if __name__ == "__main__":
-    main()
+    main(run_folder=os.environ.get(RUN_FOLDER_ENV))
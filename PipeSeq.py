@@ -11,22 +11,19 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QFont, QPixmap
 from PyQt6.QtCore import Qt
+from pipeline_log import StepLog, write_run_report, write_run_trace
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MEMORY_FILE = os.path.join(SCRIPT_DIR, "Mind.json")
 LOG_FILE = os.path.join(SCRIPT_DIR, "process_log.txt")
 PIPELINE_SETTINGS_FILE = os.path.join(SCRIPT_DIR, "settings.json")  
-
-def log(message):
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(message + '\n')
-    print(message)
+log = StepLog("PipeSeq", LOG_FILE)
 
 def run_command(command, cwd=None):
     """Execute command directly, without WSL"""
     log(f"Executing command: {' '.join(command)}")
     try:
-        subprocess.run(command, check=True, cwd=cwd)
+        log.run(command, cwd=cwd)
     except subprocess.CalledProcessError as e:
         log(f"Error executing command: {e}")
         raise
@@ -105,7 +102,13 @@ class SRAConverterApp(QWidget):
                 "use_stringtie": True,
                 "use_deseq2": False,
                 "strict_annotation": False,
-                "stringtie_sensitivity": ""
+                "stringtie_sensitivity": "",
+                "deseq2_results_only": False,
+                "deseq2_counts_from_stringtie": False,
+                "read_length": 75,
+                "run_steps_in_process": True,
+                "profile_steps": False,
+                "export_tsv": True
             },
             "gene_mapping": {},
             "visualization": {
@@ -297,12 +300,20 @@ class SRAConverterApp(QWidget):
         chk_deseq2 = QCheckBox("DESeq2")
         chk_deseq2.setChecked(self.pipeline_settings["options"].get("use_deseq2", False))
         chk_deseq2.stateChanged.connect(lambda state: self.toggle_pipeline_option("use_deseq2", state))
+        chk_deseq2_results_only = QCheckBox("DESeq2: results only (reuse model)")
+        chk_deseq2_results_only.setChecked(self.pipeline_settings["options"].get("deseq2_results_only", False))
+        chk_deseq2_results_only.stateChanged.connect(lambda state: self.toggle_pipeline_option("deseq2_results_only", state))
+        chk_deseq2_from_stringtie = QCheckBox("DESeq2 counts from StringTie")
+        chk_deseq2_from_stringtie.setChecked(self.pipeline_settings["options"].get("deseq2_counts_from_stringtie", False))
+        chk_deseq2_from_stringtie.stateChanged.connect(lambda state: self.toggle_pipeline_option("deseq2_counts_from_stringtie", state))
 
         grid_pipeline.addWidget(chk_delete_intermediate, 0, 0)
         grid_pipeline.addWidget(chk_fix_genome, 0, 1)
         grid_pipeline.addWidget(chk_strict_annotation, 1, 0)
         grid_pipeline.addWidget(chk_stringtie, 1, 1)
-        grid_pipeline.addWidget(chk_deseq2, 2, 0, 1, 2)
+        grid_pipeline.addWidget(chk_deseq2, 2, 0)
+        grid_pipeline.addWidget(chk_deseq2_results_only, 2, 1)
+        grid_pipeline.addWidget(chk_deseq2_from_stringtie, 3, 0, 1, 2)
 
         hbox_sensitivity = QHBoxLayout()
         lbl_sensitivity = QLabel("StringTie (-c):")
@@ -392,6 +403,7 @@ class SRAConverterApp(QWidget):
         if not all([self.sratoolkit_path, self.sra_download_folder, self.fastq_output_folder]):
             QMessageBox.warning(self, "Error", "Fill in all paths before starting.")
             return
+        started = time.time()
 
         samples_raw = self.input_samples.toPlainText().strip()
         if not samples_raw:
@@ -417,7 +429,7 @@ class SRAConverterApp(QWidget):
             before_prefetch = set(os.listdir(self.sra_download_folder))
             prefetch_path = os.path.join(self.sratoolkit_path, "prefetch.exe")
             if not self.execute_command_with_error_handling([prefetch_path, runid, "--output-directory", self.sra_download_folder],
-                                                              f"Prefetch {runid}"):
+                                                              f"Prefetch {runid}", sample=samplename):
                 log(f"Prefetch step for {runid} skipped.")
                 continue
 
@@ -458,10 +470,12 @@ class SRAConverterApp(QWidget):
                 log("File moving step skipped, moving to next sample.")
                 continue
 
-            self.convert_sra_file(dst_file_path, samplename)
+            with log.timed("sample", sample=samplename):
+                self.convert_sra_file(dst_file_path, samplename)
             self.progress_bar.setValue(i)
 
         self.progress_label.setText("Done.")
+        self.write_run_reports(started)
         QMessageBox.information(self, "Done", "Process completed!")
         self.run_pipeline()
 
@@ -473,16 +487,19 @@ class SRAConverterApp(QWidget):
 
         self.progress_bar.setMaximum(len(sra_files))
         self.progress_bar.setValue(0)
+        started = time.time()
 
         for i, sra_file in enumerate(sra_files, 1):
             sra_path = os.path.join(self.sra_download_folder, sra_file)
             sample_name = sra_file.replace('.sra', '')
 
             self.progress_label.setText(f"Converting {sample_name}... [{i}/{len(sra_files)}]")
-            self.convert_sra_file(sra_path, sample_name)
+            with log.timed("sample", sample=sample_name):
+                self.convert_sra_file(sra_path, sample_name)
             self.progress_bar.setValue(i)
 
         self.progress_label.setText("Done.")
+        self.write_run_reports(started)
         QMessageBox.information(self, "Done", "Conversion completed!")
 
         pipeline_script = os.path.join(SCRIPT_DIR, "runpaiplain.py")
@@ -490,11 +507,21 @@ class SRAConverterApp(QWidget):
         self.close()  
 
 
+    def write_run_reports(self, started):
+        # prefetch, fasterq-dump, выравнивание и SAM → BAM по всем образцам, от дорогих к дешёвым,
+        # и временная шкала образцов × этапов
+        paths = write_run_report(since=started)
+        if paths:
+            log(f"Resource report: {paths[1]}")
+        trace = write_run_trace(since=started)
+        if trace:
+            log(f"Timeline trace: {trace}")
+
     def convert_sra_file(self, sra_file_path, sample_name):
         fasterq_path = os.path.join(self.sratoolkit_path, "fasterq-dump.exe")
         log(f"Starting conversion {sample_name} → FASTQ")
         command = [fasterq_path, sra_file_path, "--split-files", "--outdir", self.fastq_output_folder]
-        if not self.execute_command_with_error_handling(command, f"Conversion {sample_name}"):
+        if not self.execute_command_with_error_handling(command, f"Conversion {sample_name}", sample=sample_name):
             log(f"Conversion skipped for {sample_name}")
             return
 
@@ -516,14 +543,14 @@ class SRAConverterApp(QWidget):
         align_script = os.path.join(SCRIPT_DIR, "align_hisat2.py")
         log(f"Starting alignment for {sample_name}")
         if not self.execute_command_with_error_handling([sys.executable, align_script, sample_name],
-                                                        f"Alignment {sample_name}"):
+                                                        f"Alignment {sample_name}", sample=sample_name):
             log(f"Alignment skipped for {sample_name}")
             return
 
         process_script = os.path.join(SCRIPT_DIR, "process_sam_to_bam.py")
         log(f"Starting SAM → BAM conversion for {sample_name}")
         if not self.execute_command_with_error_handling([sys.executable, process_script, sample_name],
-                                                        f"SAM → BAM conversion {sample_name}"):
+                                                        f"SAM → BAM conversion {sample_name}", sample=sample_name):
             log(f"SAM → BAM conversion skipped for {sample_name}")
 
         if self.pipeline_settings["options"].get("delete_intermediate_files", False):
@@ -575,11 +602,11 @@ class SRAConverterApp(QWidget):
             return "abort"
         return "abort"
 
-    def execute_command_with_error_handling(self, command, stage_desc, cwd=None):
+    def execute_command_with_error_handling(self, command, stage_desc, cwd=None, sample=None):
         while True:
             try:
-                log(f"Executing command: {' '.join(command)} (stage: {stage_desc})")
-                subprocess.run(command, check=True, cwd=cwd)
+                log(f"Executing command: {' '.join(command)} (stage: {stage_desc})", sample=sample)
+                log.run(command, sample=sample, fields={"stage": stage_desc}, cwd=cwd)
                 return True
             except subprocess.CalledProcessError as e:
                 choice = self.handle_error(f"Command error: {' '.join(command)}\nDescription: {e}")
@@ -6,6 +6,7 @@ from PyQt6.QtWidgets import (
     QFileDialog, QLineEdit, QFormLayout, QMessageBox
 )
 from PyQt6.QtCore import Qt
+from results_io import read_table, write_table, table_columns, PARQUET_EXT
 
 class BaseNameReplacer(QWidget):
     def __init__(self):
@@ -42,7 +43,7 @@ class BaseNameReplacer(QWidget):
             self,
             'Выбери файл',
             '',
-            'Text Files (*.txt);;All Files (*)'
+            'Text Files (*.txt);;Parquet Files (*.parquet);;All Files (*)'
         )
         if file_name:
             self.file_path = file_name
@@ -51,15 +52,14 @@ class BaseNameReplacer(QWidget):
 
     def loadBaseNames(self):
         try:
-            df = pd.read_csv(self.file_path, sep='\t')
+            if 'Base Name' not in table_columns(self.file_path):
+                QMessageBox.critical(self, "Ошибка", "В файле нет колонки 'Base Name'")
+                return
+            df = read_table(self.file_path, columns=['Base Name'])
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось прочитать файл:\n{e}")
             return
 
-        if 'Base Name' not in df.columns:
-            QMessageBox.critical(self, "Ошибка", "В файле нет колонки 'Base Name'")
-            return
-
 
         while self.form_layout.count():
             child = self.form_layout.takeAt(0)
@@ -82,13 +82,16 @@ class BaseNameReplacer(QWidget):
             QMessageBox.warning(self, "Ошибка", "Сначала выбери файл.")
             return
 
+        # TSV перечитывается как есть, чтобы перезапись не меняла его числа
+        is_parquet = self.file_path.endswith(PARQUET_EXT)
         try:
-            df = pd.read_csv(self.file_path, sep='\t')
+            df = read_table(self.file_path) if is_parquet else pd.read_csv(self.file_path, sep='\t')
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось прочитать файл:\n{e}")
             return
 
         changes_made = False
+        df['Base Name'] = df['Base Name'].astype(object)
         for old_name, input_field in self.name_inputs.items():
             new_name = input_field.text().strip()
             if new_name and new_name != old_name:
@@ -100,7 +103,8 @@ class BaseNameReplacer(QWidget):
             return
 
         try:
-            df.to_csv(self.file_path, sep='\t', index=False)
+            # parquet рядом с TSV обновляется вместе с ним
+            write_table(df, self.file_path, tsv=not is_parquet)
             QMessageBox.information(self, "Готово", f"Файл успешно перезаписан:\n{self.file_path}")
             self.label.setText(f'Файл перезаписан: {self.file_path}')
         except Exception as e:
@@ -2,14 +2,12 @@ import os
 import subprocess
 import json
 import sys
+from pipeline_log import StepLog
+from resource_usage import wsl_command
 
 SETTINGS_FILE = "settings.json"
-LOG_FILE = "process_sam_to_bam_log.txt"
-
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as log_file:
-        log_file.write(message + "\n")
+LOG_FILE = "align_hisat2_log.txt"
+log = StepLog("align_hisat2", LOG_FILE)
 
 def convert_path_to_wsl(win_path):
     abs_path = os.path.abspath(win_path)
@@ -21,12 +19,12 @@ def convert_path_to_wsl(win_path):
         return wsl_path
     return path
 
-def run_command(command):
-    log(f"Запуск в WSL:\n{command}")
+def run_command(command, sample=None):
+    log(f"Запуск в WSL:\n{command}", sample=sample)
     try:
-        subprocess.run(f'wsl bash -c "{command}"', shell=True, check=True)
+        log.run(wsl_command(command), sample=sample, parse_time=True, shell=True)
     except subprocess.CalledProcessError as e:
-        log(f"Ошибка выполнения команды: {e}")
+        log(f"Ошибка выполнения команды: {e}", sample=sample)
         sys.exit(1)
 
 def find_fasta_file(folder):
@@ -128,21 +126,21 @@ def align_with_hisat2():
         r1_path = f"{fastq_folder_wsl}/{r1}"
         r2_path = f"{fastq_folder_wsl}/{r2}"
         output_sam = f"{bam_folder_wsl}/{base}_paired.sam"
-        log(f"\nВыравнивание парных файлов: {r1} + {r2}")
+        log(f"\nВыравнивание парных файлов: {r1} + {r2}", sample=base)
         command = (
             f"hisat2 -p 4 -x {genome_index_wsl} -1 {r1_path} -2 {r2_path} -S {output_sam}"
         )
-        run_command(command)
+        run_command(command, sample=base)
 
     for f in single_files:
         sample_name = os.path.splitext(f)[0]
         fastq_path = f"{fastq_folder_wsl}/{f}"
         output_sam = f"{bam_folder_wsl}/{sample_name}_single.sam"
-        log(f"\nВыравнивание одиночного файла: {f}")
+        log(f"\nВыравнивание одиночного файла: {f}", sample=sample_name)
         command = (
             f"hisat2 -p 4 -x {genome_index_wsl} -U {fastq_path} -S {output_sam}"
         )
-        run_command(command)
+        run_command(command, sample=sample_name)
     log("\nВыравнивание всех файлов завершено!")
 
 if __name__ == "__main__":
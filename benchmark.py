@@ -0,0 +1,280 @@
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import pipeline_log
+import extract_fpkm
+import GTF_results_pvalues
+import pvalues_log2
+import extract_Deseq2
+import ALLTABLE
+import ct_analysis_qpcr
+import temp_card_p
+from benchmark_data import SyntheticDataset
+
+# Замеры аналитического слоя на синтетических данных: время и пиковая память
+# (tracemalloc) каждого шага для наборов разного размера. Работает без сети и WSL.
+#   python benchmark.py --sizes tiny,small,medium --repeat 3
+SIZES = {
+    "tiny":   (13, 6),
+    "small":  (1000, 24),
+    "medium": (10000, 60),
+    "large":  (60000, 200),
+}
+DEFAULT_SIZES = "tiny,small,medium"
+ALPHA = 0.05
+HEATMAP_TOP_GENES = 50
+
+
+def parse_size(text):
+    """«small» или «5000x48» -> (имя, генов, образцов)."""
+    text = text.strip()
+    if text in SIZES:
+        return (text, *SIZES[text])
+    try:
+        genes, samples = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неизвестный размер {text!r}: {', '.join(SIZES)} или ГЕНЫxОБРАЗЦЫ")
+    return (text, genes, samples)
+
+
+# ---------- Шаги ----------
+# setup готовит входные файлы (не входит в замер), run выполняет шаг и кладёт результат в ctx
+
+def _setup_stringtie(ctx):
+    ctx["data"].write_stringtie(ctx["settings"]["folders"]["gtf_folder"])
+
+
+def _run_extract_fpkm(ctx):
+    folders = ctx["settings"]["folders"]
+    ctx["fpkm"] = extract_fpkm.extract_fpkm(folders["gtf_folder"], folders["results_folder"],
+                                            ctx["data"].gene_mapping, ctx["folder"], ctx["settings"])
+
+
+def _setup_fpkm(ctx):
+    if "fpkm" not in ctx:
+        _setup_stringtie(ctx)
+        _run_extract_fpkm(ctx)
+
+
+def _run_pvalues(ctx):
+    ctx["pvalues"] = GTF_results_pvalues.main(ctx["settings"], ctx["fpkm"]["fpkm_all"], ctx["folder"])
+
+
+def _setup_pvalues(ctx):
+    _setup_fpkm(ctx)
+    if "pvalues" not in ctx:
+        _run_pvalues(ctx)
+
+
+def _run_pvalues_log2(ctx):
+    pvalues_log2.main(ctx["settings"], ctx["pvalues"], ctx["fpkm"]["log2"], ctx["folder"])
+
+
+def _setup_deseq2(ctx):
+    ctx["data"].write_deseq2_results(ctx["folder"])
+    ctx["data"].write_featurecounts(os.path.join(ctx["folder"], "featureCounts"))
+
+
+def _run_extract_deseq2(ctx):
+    extract_Deseq2.extract_genes(ctx["folder"], ctx["data"].gene_mapping, ctx["settings"])
+
+
+def _setup_methods(ctx):
+    ctx["datasets"] = ctx["data"].write_method_tables(os.path.join(ctx["folder"], "methods"))
+
+
+def _run_build_matrices(ctx):
+    # кэши сессии ALLTABLE сделали бы повторные замеры бессмысленными
+    ALLTABLE._BUILD_CACHE.clear()
+    ALLTABLE._DATASET_CACHE.clear()
+    ctx["matrices"] = ALLTABLE.build_matrices(ctx["datasets"], True)
+
+
+def _setup_matrices(ctx):
+    _setup_methods(ctx)
+    _run_build_matrices(ctx)
+
+
+def _run_correlations(ctx):
+    _, M_log2, M_p, _ = ctx["matrices"]
+    ALLTABLE.compute_pairwise_correlation_matrices(M_log2, M_p, ALPHA, "none", "auto")
+
+
+def _setup_genome_table(ctx):
+    # полногеномная таблица DESeq2 по всем экспериментам: у неразмеченных генов GATA Name пуст
+    data = ctx["data"]
+    path = os.path.join(ctx["folder"], "heatmap_genome.tsv")
+    pd.concat([data.deseq2_table(e) for e in range(len(data.experiments))]).to_csv(path, sep="\t", index=False)
+    ctx["genome_table"] = path
+
+
+def _run_heatmap_top_genes(ctx):
+    cfg = {"top_n_genes": HEATMAP_TOP_GENES}
+    df = temp_card_p.limit_to_top_genes(temp_card_p.load_table(ctx["genome_table"]), cfg)
+    temp_card_p.get_possible_values(df)
+    temp_card_p.prepare_matrices(df, cfg)
+
+
+def _setup_ct(ctx):
+    ctx["ct"] = ctx["data"].ct_table()
+    ctx["data"].write_ct_table(os.path.join(ctx["folder"], "qpcr_ct.tsv"))
+
+
+def _run_ct_results(ctx):
+    ct_analysis_qpcr.compute_ct_results(*ctx["ct"])
+
+
+CASES = {
+    "extract_fpkm":        (_setup_stringtie, _run_extract_fpkm),
+    "GTF_results_pvalues": (_setup_fpkm, _run_pvalues),
+    "pvalues_log2":        (_setup_pvalues, _run_pvalues_log2),
+    "extract_Deseq2":      (_setup_deseq2, _run_extract_deseq2),
+    "build_matrices":      (_setup_methods, _run_build_matrices),
+    "correlations":        (_setup_matrices, _run_correlations),
+    "heatmap_top_genes":   (_setup_genome_table, _run_heatmap_top_genes),
+    "ct_results":          (_setup_ct, _run_ct_results),
+}
+
+
+# ---------- Замер ----------
+
+def measure(run, ctx, repeat=1, memory=True):
+    """Лучшее время из repeat запусков и, отдельным запуском под tracemalloc, пик выделенной памяти."""
+    walls, cpus = [], []
+    for _ in range(repeat):
+        gc.collect()
+        times, start = os.times(), time.perf_counter()
+        run(ctx)
+        walls.append(time.perf_counter() - start)
+        after = os.times()
+        cpus.append(after.user - times.user + after.system - times.system)
+    result = {"wall_s": round(min(walls), 4), "wall_median_s": round(float(np.median(walls)), 4),
+              "cpu_s": round(min(cpus), 3), "peak_mb": None}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(ctx)
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _quiet_steps(folder):
+    # сообщения шагов не печатаются, текстовые логи шагов пишутся в папку замера
+    for module in (extract_fpkm, GTF_results_pvalues, pvalues_log2, extract_Deseq2):
+        log = module.log
+        log.echo = False
+        if log.text_file:
+            log.text_file = os.path.join(folder, os.path.basename(log.text_file))
+
+
+def run_size(size, cases, work_folder, repeat=1, memory=True, n_mapped=13, seed=0):
+    name, n_genes, n_samples = size
+    folder = os.path.join(work_folder, name)
+    os.makedirs(folder, exist_ok=True)
+    pipeline_log.configure(folder)
+    _quiet_steps(folder)
+    data = SyntheticDataset(n_genes, n_samples, n_mapped=n_mapped, seed=seed)
+    ctx = {"data": data, "folder": folder, "settings": data.settings(folder)}
+
+    rows = []
+    for case in cases:
+        setup, run = CASES[case]
+        start = time.perf_counter()
+        setup(ctx)
+        row = {"size": name, "genes": data.n_genes, "samples": len(data.samples), "case": case,
+               "setup_s": round(time.perf_counter() - start, 3)}
+        try:
+            row.update(measure(run, ctx, repeat, memory))
+            row["status"] = "ok"
+        except Exception as e:
+            row.update({"wall_s": None, "wall_median_s": None, "cpu_s": None, "peak_mb": None,
+                        "status": f"error: {e!r}"})
+        print(f"  {case:<20} {_fmt(row['wall_s'])} s  {_fmt(row['peak_mb'])} MB  {row['status']}", flush=True)
+        rows.append(row)
+    pipeline_log.flush()
+    return rows
+
+
+def _fmt(value):
+    return "-" if value is None else (f"{value:.3f}" if isinstance(value, float) else str(value))
+
+
+TABLE_COLUMNS = ["size", "genes", "samples", "case", "wall_s", "wall_median_s", "cpu_s", "peak_mb", "setup_s", "status"]
+
+
+def format_table(rows, columns=TABLE_COLUMNS):
+    table = [columns] + [[_fmt(row.get(c)) for c in columns] for row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip() for r in table) + "\n"
+
+
+def environment():
+    return {
+        "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+        "numpy": np.__version__, "pandas": pd.__version__, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры аналитических шагов PipeSeq на синтетических данных")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"через запятую: {', '.join(SIZES)} или ГЕНЫxОБРАЗЦЫ (по умолчанию {DEFAULT_SIZES})")
+    parser.add_argument("--cases", default=",".join(CASES), help="шаги через запятую (по умолчанию все)")
+    parser.add_argument("--repeat", type=int, default=1, help="число запусков для замера времени")
+    parser.add_argument("--no-memory", action="store_true", help="не замерять память (без запуска под tracemalloc)")
+    parser.add_argument("--mapped", type=int, default=13, help="число генов в gene_mapping")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work", help="папка для синтетических данных (по умолчанию временная, удаляется)")
+    parser.add_argument("--report", default="benchmark_results.json",
+                        help="JSON с результатами; рядом пишется таблица .txt")
+    args = parser.parse_args(argv)
+    try:
+        args.sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    args.cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in args.cases if c not in CASES]
+    if unknown:
+        parser.error(f"Неизвестные шаги: {', '.join(unknown)}. Доступны: {', '.join(CASES)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work = args.work or tempfile.mkdtemp(prefix="pipeseq_bench_")
+    rows = []
+    try:
+        for size in args.sizes:
+            print(f"{size[0]}: {size[1]} генов × {size[2]} образцов", flush=True)
+            rows += run_size(size, args.cases, work, args.repeat, not args.no_memory, args.mapped, args.seed)
+    finally:
+        pipeline_log.shutdown()
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": rows}, f, ensure_ascii=False, indent=1)
+    table_path = os.path.splitext(args.report)[0] + ".txt"
+    with open(table_path, "w", encoding="utf-8") as f:
+        f.write(format_table(rows))
+    print(format_table(rows))
+    print(f"Результаты сохранены: {args.report}, {table_path}")
+    return 0 if all(row["status"] == "ok" for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+# Синтетические входные данные для замеров производительности: GTF и _coverage.tsv
+# в формате StringTie (-e -G ... -A), выходы featureCounts, таблицы results_Deseq2_*.tsv,
+# таблицы методов для ALLTABLE и Ct-таблицы qPCR. Всё генерируется детерминированно
+# по seed, без сети и внешних программ.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_PATH = os.path.join(SCRIPT_DIR, "settings.json")
+REPLICATES = 3
+TECH_REPLICATES = 3
+REFERENCE_GENE = "Control-Actin"
+METHODS = ("StringTie", "DESeq2", "qPCR")
+CHROMOSOMES = 17
+GENE_SPACING = 6000
+
+
+def _known_mapping():
+    # реальные гены из settings.json идут первыми, чтобы выборка была похожа на рабочую
+    try:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+            return dict(json.load(f).get("gene_mapping", {}))
+    except (OSError, ValueError):
+        return {}
+
+
+class SyntheticDataset:
+    """
+    Набор данных на n_genes генов и примерно n_samples образцов: эксперименты
+    «Cond<N>h» по REPLICATES экспериментальных и контрольных повторов. Из генов
+    первые n_mapped попадают в gene_mapping (как в settings.json).
+    """
+
+    def __init__(self, n_genes, n_samples, n_mapped=13, seed=0):
+        self.rng = np.random.default_rng(seed)
+        known = list(_known_mapping().items())[:min(n_mapped, n_genes)]
+        extra = [f"CHLRE_{i % CHROMOSOMES + 1:02d}g{500000 + i:06d}v5" for i in range(n_genes - len(known))]
+        self.gene_ids = [g for g, _ in known] + extra
+        self.gene_names = [name for _, name in known] + [f"GENE-{i + 1}" for i in range(len(extra))]
+        self.gene_mapping = dict(zip(self.gene_ids[:n_mapped], self.gene_names[:n_mapped]))
+
+        n_experiments = max(1, n_samples // (2 * REPLICATES))
+        self.experiments = [f"Cond{e + 1}h" for e in range(n_experiments)]
+        # (эксперимент, контроль?, повтор) в порядке записи файлов
+        self.samples = [(e, ctrl, rep) for e in range(n_experiments)
+                        for ctrl in (False, True) for rep in range(1, REPLICATES + 1)]
+
+        n = len(self.gene_ids)
+        self.chrom = np.arange(n) % CHROMOSOMES + 1
+        self.start = (np.arange(n) // CHROMOSOMES + 1) * GENE_SPACING
+        self.length = self.rng.integers(600, 4000, n)
+        self.strand = np.where(self.rng.random(n) < 0.5, "+", "-")
+        self.n_transcripts = np.where(self.rng.random(n) < 0.2, 2, 1)
+        # уровень экспрессии гена, эффект эксперимента и шум повторов
+        base = self.rng.lognormal(2.0, 1.5, n)
+        effect = np.where(self.rng.random((n_experiments, n)) < 0.1,
+                          self.rng.normal(0.0, 1.5, (n_experiments, n)), 0.0)
+        self.log2_effect = effect
+        exp_idx = np.array([s[0] for s in self.samples])
+        treated = ~np.array([s[1] for s in self.samples])
+        noise = self.rng.lognormal(0.0, 0.25, (len(self.samples), n))
+        self.fpkm = base[None, :] * np.exp2(effect[exp_idx] * treated[:, None]) * noise
+
+    @property
+    def n_genes(self):
+        return len(self.gene_ids)
+
+    def sample_name(self, index):
+        e, ctrl, rep = self.samples[index]
+        return f"{self.experiments[e]}{'Control' if ctrl else ''}{rep}"
+
+    def settings(self, folder):
+        return {
+            "folders": {"gtf_folder": os.path.join(folder, "GTF"), "results_folder": folder},
+            "gene_mapping": self.gene_mapping,
+        }
+
+    # ---------- StringTie ----------
+
+    def write_stringtie(self, gtf_folder):
+        """<образец>_sorted.gtf и <образец>_coverage.tsv для каждого образца."""
+        os.makedirs(gtf_folder, exist_ok=True)
+        end = self.start + self.length - 1
+        for s in range(len(self.samples)):
+            name = self.sample_name(s)
+            fpkm = self.fpkm[s]
+            tpm = fpkm / fpkm.sum() * 1e6
+            cov = fpkm * 0.4
+            lines = ["# stringtie -e -G reference.gtf --rf -A coverage.tsv\n", "# StringTie version 2.2.1\n"]
+            for i, gene in enumerate(self.gene_ids):
+                loc = f"chr{self.chrom[i]}\tStringTie\t{{}}\t{self.start[i]}\t{end[i]}\t1000\t{self.strand[i]}\t."
+                half = self.start[i] + self.length[i] // 2
+                for t in range(1, self.n_transcripts[i] + 1):
+                    share = 1.0 / self.n_transcripts[i]
+                    tx = f'gene_id "{gene}"; transcript_id "{gene}.t{t}"; ref_gene_name "{self.gene_names[i]}";'
+                    lines.append(f'{loc.format("transcript")}\t{tx} cov "{cov[i] * share:.6f}"; '
+                                 f'FPKM "{fpkm[i] * share:.6f}"; TPM "{tpm[i] * share:.6f}";\n')
+                    lines.append(f'chr{self.chrom[i]}\tStringTie\texon\t{self.start[i]}\t{half}\t1000\t{self.strand[i]}\t.\t'
+                                 f'{tx} exon_number "1"; cov "{cov[i] * share:.6f}";\n')
+                    lines.append(f'chr{self.chrom[i]}\tStringTie\texon\t{half + 1}\t{end[i]}\t1000\t{self.strand[i]}\t.\t'
+                                 f'{tx} exon_number "2"; cov "{cov[i] * share:.6f}";\n')
+            with open(os.path.join(gtf_folder, f"{name}_sorted.gtf"), "w") as f:
+                f.write("".join(lines))
+            pd.DataFrame({
+                "Gene ID": self.gene_ids, "Gene Name": self.gene_names, "Reference": [f"chr{c}" for c in self.chrom],
+                "Strand": self.strand, "Start": self.start, "End": end,
+                "Coverage": cov.round(6), "FPKM": fpkm.round(6), "TPM": tpm.round(6),
+            }).to_csv(os.path.join(gtf_folder, f"{name}_coverage.tsv"), sep="\t", index=False)
+
+    def write_reference(self, genome_folder):
+        """Эталонная аннотация (reference.gtf: gene/transcript/exon) и genome.fa для stringtie/featureCounts."""
+        os.makedirs(genome_folder, exist_ok=True)
+        end = self.start + self.length - 1
+        lines = []
+        for i, gene in enumerate(self.gene_ids):
+            loc = f"chr{self.chrom[i]}\tphytozome\t{{}}\t{self.start[i]}\t{end[i]}\t.\t{self.strand[i]}\t."
+            attrs = f'gene_id "{gene}"; gene_name "{self.gene_names[i]}";'
+            lines.append(f"{loc.format('gene')}\t{attrs}\n")
+            lines.append(f'{loc.format("transcript")}\t{attrs} transcript_id "{gene}.t1";\n')
+            lines.append(f'{loc.format("exon")}\t{attrs} transcript_id "{gene}.t1"; exon_number "1";\n')
+        with open(os.path.join(genome_folder, "reference.gtf"), "w") as f:
+            f.write("".join(lines))
+        with open(os.path.join(genome_folder, "genome.fa"), "w") as f:
+            for c in range(1, CHROMOSOMES + 1):
+                f.write(f">chr{c}\n" + "ACGT" * 250 + "\n")
+
+    def write_fastq(self, fastq_folder, reads, read_length=75):
+        """Парные <образец>_1.fastq / _2.fastq по reads ридов, как после fasterq-dump --split-files."""
+        os.makedirs(fastq_folder, exist_ok=True)
+        bases = np.array(list("ACGT"))
+        seqs = ["".join(s) for s in bases[self.rng.integers(0, 4, (256, read_length))]]
+        quality = "F" * read_length
+        for s in range(len(self.samples)):
+            name = self.sample_name(s)
+            for mate in (1, 2):
+                records = [f"@{name}.{r} {r}/{mate}\n{seqs[(r * mate) % 256]}\n+\n{quality}\n" for r in range(reads)]
+                with open(os.path.join(fastq_folder, f"{name}_{mate}.fastq"), "w") as f:
+                    f.write("".join(records))
+
+    # ---------- featureCounts / DESeq2 ----------
+
+    def write_featurecounts(self, results_folder):
+        """gene_counts_<образец>_sorted.txt и .summary, как у featureCounts -g gene_id -t exon."""
+        os.makedirs(results_folder, exist_ok=True)
+        counts = self.rng.poisson(self.fpkm * self.length[None, :] / 50.0)
+        for s in range(len(self.samples)):
+            full = f"{self.sample_name(s)}_sorted"
+            bam = f"/mnt/c/PipeSeq-3/Output/{full}.bam"
+            path = os.path.join(results_folder, f"gene_counts_{full}.txt")
+            with open(path, "w") as f:
+                f.write(f'# Program:featureCounts v2.0.6; Command:"featureCounts" "-a" "reference.gtf" "-o" "{path}" '
+                        f'"-T" "4" "-g" "gene_id" "-t" "exon" "-s" "0" "{bam}"\n')
+            pd.DataFrame({
+                "Geneid": self.gene_ids, "Chr": [f"chr{c}" for c in self.chrom], "Start": self.start,
+                "End": self.start + self.length - 1, "Strand": self.strand, "Length": self.length, bam: counts[s],
+            }).to_csv(path, sep="\t", index=False, mode="a")
+            assigned = int(counts[s].sum())
+            with open(path + ".summary", "w") as f:
+                f.write(f"Status\t{bam}\nAssigned\t{assigned}\nUnassigned_NoFeatures\t{assigned // 20}\n"
+                        f"Unassigned_Ambiguity\t{assigned // 100}\n")
+
+    def deseq2_table(self, e):
+        n = self.n_genes
+        signal = self.log2_effect[e] != 0
+        pvalue = np.where(signal, self.rng.beta(0.3, 8.0, n), self.rng.random(n))
+        return pd.DataFrame({
+            "Base Name": self.experiments[e],
+            "Gene ID": self.gene_ids,
+            "GATA Name": [self.gene_mapping.get(g) for g in self.gene_ids],
+            "p-value": pvalue,
+            "log2(Exp/Control)": self.log2_effect[e] + self.rng.normal(0.0, 0.2, n),
+        })
+
+    def write_deseq2_results(self, results_folder):
+        """results_Deseq2_<эксперимент>.tsv со всеми генами, как пишет deseq2_analysis."""
+        os.makedirs(results_folder, exist_ok=True)
+        for e, experiment in enumerate(self.experiments):
+            self.deseq2_table(e).to_csv(os.path.join(results_folder, f"results_Deseq2_{experiment}.tsv"),
+                                        sep="\t", index=False)
+
+    # ---------- ALLTABLE ----------
+
+    def write_method_tables(self, folder):
+        """Таблицы Base Name / GATA Name / p-value / log2 для каждого метода; возвращает [(метод, путь)]."""
+        os.makedirs(folder, exist_ok=True)
+        datasets = []
+        for method in METHODS:
+            table = pd.concat([self.deseq2_table(e) for e in range(len(self.experiments))], ignore_index=True)
+            table["GATA Name"] = np.tile(self.gene_names, len(self.experiments))
+            path = os.path.join(folder, f"{method}.txt")
+            table[["Base Name", "GATA Name", "p-value", "log2(Exp/Control)"]].to_csv(path, sep="\t", index=False)
+            datasets.append((method, path))
+        return datasets
+
+    # ---------- qPCR ----------
+
+    def ct_table(self, missing=0.03):
+        """
+        Вход ct_analysis_qpcr.compute_ct_results: значения Ct (образец × столбец повтора),
+        маска заполненных ячеек, гены столбцов (первый — референсный Control-) и образцы.
+        """
+        genes = [REFERENCE_GENE] + self.gene_names
+        col_genes = [g for g in genes for _ in range(TECH_REPLICATES)]
+        exp_idx = np.array([s[0] for s in self.samples])
+        treated = ~np.array([s[1] for s in self.samples])
+        base = np.concatenate([[18.0], self.rng.normal(26.0, 3.0, self.n_genes)])
+        shift = np.concatenate([np.zeros((len(self.experiments), 1)), -self.log2_effect], axis=1)
+        mean = base[None, :] + shift[exp_idx] * treated[:, None]
+        values = np.repeat(mean, TECH_REPLICATES, axis=1) + self.rng.normal(0.0, 0.3, (len(self.samples), len(col_genes)))
+        filled = self.rng.random(values.shape) >= missing
+        values[~filled] = np.nan
+
+        samples = []
+        for e, ctrl, rep in self.samples:
+            label = f"{e + 1}{'Control-' if ctrl else ''}{self.experiments[e]}_{rep}"
+            samples.append({'label': label, 'exp_num': e + 1, 'is_ctrl': ctrl,
+                            'cond': self.experiments[e], 'bio_rep': rep})
+        return values, filled, col_genes, samples
+
+    def write_ct_table(self, path):
+        """Ct-таблица в виде, в котором её вставляют в окно ct_analysis_qpcr (образцы по строкам)."""
+        values, filled, col_genes, samples = self.ct_table()
+        text = np.where(filled, np.char.mod("%.2f", np.nan_to_num(values)), "")
+        pd.DataFrame(text, index=[s['label'] for s in samples], columns=col_genes).to_csv(path, sep="\t")
+        return path
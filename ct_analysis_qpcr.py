@@ -4,13 +4,419 @@ import re
 import numpy as np
 import pandas as pd
 import json
+import glob
+import argparse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from scipy.stats import shapiro, ttest_ind, mannwhitneyu
-from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QTableWidget, QTableWidgetItem, QMessageBox, QLabel
-)
-from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QInputDialog
+# PyQt6 нужен только для окна; импорт планшетов из командной строки работает и без него
+try:
+    from PyQt6.QtWidgets import (
+        QApplication, QWidget, QVBoxLayout, QHBoxLayout,
+        QPushButton, QTableView, QMessageBox, QLabel, QFileDialog
+    )
+    from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+    from PyQt6.QtWidgets import QInputDialog
+    QT_AVAILABLE = True
+except ImportError:
+    QWidget = QAbstractTableModel = object
+    QModelIndex = None
+    QT_AVAILABLE = False
+
+RESULT_COLUMNS = ["Base Name", "Gene ID", "Gene Name", "p-value", "log2(Exp/Control)"]
+SAMPLE_RE = re.compile(r'^(\d+)(Control-)?(.+?)_(\d+)$')
+
+
+def parse_sample_label(s):
+    """«1Control-Condition, time_1» / «1Condition, time_1» -> словарь образца или None."""
+    m = SAMPLE_RE.match(s.strip())
+    if not m:
+        return None
+    exp_num, ctrl_pref, cond, bio_rep = m.groups()
+    return {
+        'label':    s.strip(),
+        'exp_num':  int(exp_num),
+        'is_ctrl':  bool(ctrl_pref),
+        'cond':     cond.strip(),
+        'bio_rep':  int(bio_rep),
+    }
+
+
+# ---------- Импорт экспортов прибора ----------
+
+# допустимые названия столбцов в экспортах разных приборов (после приведения к нижнему регистру)
+PLATE_COLUMNS = {
+    "well":   ["well position", "well", "pos", "position"],
+    "sample": ["sample", "sample name", "name"],
+    "target": ["target", "target name", "detector", "detector name", "gene"],
+    "ct":     ["ct", "cт", "cq", "crt", "c(t)", "ct mean"],
+}
+LAYOUT_COLUMNS = {
+    "plate":  ["plate", "file"],
+    "well":   PLATE_COLUMNS["well"],
+    "sample": PLATE_COLUMNS["sample"],
+    "target": PLATE_COLUMNS["target"],
+}
+WELL_RE = re.compile(r'^\s*([A-Pa-p])\s*0*(\d{1,2})\s*$')
+
+
+def normalize_well(well):
+    m = WELL_RE.match(str(well))
+    return f"{m.group(1).upper()}{int(m.group(2))}" if m else str(well).strip()
+
+
+def _find_header(path, max_lines=200):
+    # экспорты приборов часто начинаются с блока метаданных; ищем строку заголовка таблицы
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for n, line in enumerate(f):
+            if n >= max_lines:
+                break
+            low = line.lower()
+            if "well" in low and re.search(r'\b(ct|cq|crt|cт)\b', low):
+                sep = max(["\t", ";", ","], key=line.count)
+                return n, sep
+    raise ValueError(f"Не найден заголовок таблицы (Well, Ct) в файле {path}")
+
+
+def _pick_columns(df, names, required):
+    lower = {str(c).strip().lower(): c for c in df.columns}
+    found = {}
+    for key, options in names.items():
+        col = next((lower[o] for o in options if o in lower), None)
+        if col is None and key in required:
+            raise ValueError(f"Нет столбца «{key}» (ожидается одно из: {', '.join(options)})")
+        found[key] = col
+    return found
+
+
+def read_plate(path):
+    """Один экспорт планшета -> таблица plate, well, sample, target, ct (NaN — Undetermined)."""
+    skip, sep = _find_header(path)
+    df = pd.read_csv(path, sep=sep, skiprows=skip, dtype=str, encoding="utf-8-sig",
+                     skip_blank_lines=True, on_bad_lines="skip")
+    cols = _pick_columns(df, PLATE_COLUMNS, required=("well", "ct"))
+    out = pd.DataFrame({
+        "plate":  os.path.splitext(os.path.basename(path))[0],
+        "well":   df[cols["well"]].map(normalize_well),
+        "sample": df[cols["sample"]].str.strip() if cols["sample"] else np.nan,
+        "target": df[cols["target"]].str.strip() if cols["target"] else np.nan,
+        "ct":     pd.to_numeric(df[cols["ct"]].str.strip().str.replace(',', '.', regex=False), errors="coerce"),
+    })
+    return out[out["well"].astype(str).str.len() > 0]
+
+
+def read_layout(path):
+    """Раскладка планшета: well, sample, target и (необязательно) plate — имя файла экспорта без расширения."""
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        first = f.readline()
+    sep = max(["\t", ";", ","], key=first.count)
+    df = pd.read_csv(path, sep=sep, dtype=str, encoding="utf-8-sig")
+    cols = _pick_columns(df, LAYOUT_COLUMNS, required=("well",))
+    layout = pd.DataFrame({
+        "plate":  df[cols["plate"]].str.strip() if cols["plate"] else np.nan,
+        "well":   df[cols["well"]].map(normalize_well),
+        "sample": df[cols["sample"]].str.strip() if cols["sample"] else np.nan,
+        "target": df[cols["target"]].str.strip() if cols["target"] else np.nan,
+    })
+    return layout
+
+
+def apply_layout(records, layout):
+    # строки раскладки с plate относятся к одному планшету, без plate — ко всем
+    out = records.copy()
+    for scoped in (False, True):
+        part = layout[layout["plate"].notna() == scoped]
+        if part.empty:
+            continue
+        keys = ["plate", "well"] if scoped else ["well"]
+        part = part.drop_duplicates(subset=keys, keep="last").set_index(keys)
+        idx = pd.MultiIndex.from_frame(out[keys]) if scoped else pd.Index(out["well"])
+        for col in ("sample", "target"):
+            mapped = part[col].reindex(idx).to_numpy()
+            out[col] = np.where(pd.notna(mapped), mapped, out[col])
+    return out
+
+
+def import_plates(paths, layout_path=None, workers=None):
+    """Все экспорты планшетов (читаются параллельно) -> одна длинная таблица с раскладкой."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        plates = list(pool.map(read_plate, paths))
+    records = pd.concat(plates, ignore_index=True) if plates else pd.DataFrame(columns=["plate", "well", "sample", "target", "ct"])
+    if layout_path:
+        records = apply_layout(records, read_layout(layout_path))
+    return records[records["sample"].notna() & records["target"].notna()].reset_index(drop=True)
+
+
+def records_to_ct_table(records):
+    """
+    Длинная таблица (sample, target, ct) -> вход ΔΔCt-движка: значения и маска
+    (образец × столбец повтора), имена генов столбцов и разобранные образцы.
+    Образцы с именами вне схемы «1Control-условие_1» возвращаются отдельным списком.
+    """
+    samples, bad = [], []
+    for label in dict.fromkeys(records["sample"]):
+        parsed = parse_sample_label(label)
+        (samples if parsed else bad).append(parsed or label)
+    labels = [s['label'] for s in samples]
+    recs = records[records["sample"].str.strip().isin(labels)].copy()
+    recs["sample"] = recs["sample"].str.strip()
+
+    recs["rep"] = recs.groupby(["sample", "target"], sort=False).cumcount()
+    genes = list(dict.fromkeys(recs["target"]))
+    max_reps = recs.groupby("target", sort=False)["rep"].max().reindex(genes) + 1
+    col_genes = [g for g in genes for _ in range(int(max_reps[g]))]
+    col_offset = dict(zip(genes, np.cumsum([0] + [int(max_reps[g]) for g in genes[:-1]])))
+
+    row = recs["sample"].map({lab: i for i, lab in enumerate(labels)}).to_numpy()
+    col = (recs["target"].map(col_offset) + recs["rep"]).to_numpy(dtype=int)
+    values = np.full((len(labels), len(col_genes)), np.nan)
+    filled = np.zeros_like(values, dtype=bool)
+    ct = recs["ct"].to_numpy(dtype=float)
+    ok = np.isfinite(ct)
+    values[row[ok], col[ok]] = ct[ok]
+    filled[row[ok], col[ok]] = True
+    return values, filled, col_genes, samples, bad
+
+
+def fix_output_format(out_path):
+
+    df = pd.read_csv(out_path, sep="\t")
+
+    df["Gene Name"] = df["Gene Name"].astype(str)
+    df["Gene Name"] = df["Gene Name"].str.replace('"', '', regex=False)
+    df["Gene Name"] = df["Gene Name"].str.replace('\n', '', regex=False)
+    df["Gene Name"] = df["Gene Name"].str.strip()
+
+
+
+    if "Gene Name" in df.columns:
+        df = df.rename(columns={"Gene Name": "GATA Name"})
+
+
+    df = df.drop_duplicates(subset=["Base Name", "GATA Name"])
+
+    df["GATA_num"] = df["GATA Name"].str.extract(r'(\d+)').astype(float)
+    df = df.sort_values(by=["Base Name", "GATA_num"])
+    df = df.drop(columns=["GATA_num"])
+
+    cols = ["Base Name", "GATA Name", "p-value", "log2(Exp/Control)"]
+    df = df[cols]
+    df.to_csv(out_path, sep="\t", index=False)
+
+
+def analyze_plates(paths, layout_path, out_path, workers=None):
+    """Импорт планшетов и ΔΔCt без окна; возвращает путь результата и образцы с неверными именами."""
+    records = import_plates(paths, layout_path, workers)
+    values, filled, col_genes, samples, bad = records_to_ct_table(records)
+    if not any(g.startswith("Control-") for g in col_genes):
+        raise ValueError("Reference gene with prefix Control- was not found")
+    df = compute_ct_results(values, filled, col_genes, samples)
+    df.to_csv(out_path, sep="\t", index=False)
+    fix_output_format(out_path)
+    return out_path, bad
+
+
+def build_ct_cube(values, filled, col_genes):
+    """
+    Ct-массив (образец × ген × повтор). Повторы гена — столбцы с одинаковым именем
+    без суффикса _N; заполненные значения сдвигаются к началу, как в списке повторов.
+    Возвращает (ct, counts, gene_names).
+    """
+    gene_names = list(dict.fromkeys(col_genes))
+    code = np.array([gene_names.index(g) for g in col_genes], dtype=int)
+    n_samples = values.shape[0]
+    max_reps = max(np.bincount(code, minlength=len(gene_names)).max(initial=0), 1)
+
+    ct = np.full((n_samples, len(gene_names), max_reps), np.nan)
+    counts = np.zeros((n_samples, len(gene_names)), dtype=int)
+    for j, g in enumerate(code):
+        rows = np.nonzero(filled[:, j])[0]
+        ct[rows, g, counts[rows, g]] = values[rows, j]
+        counts[rows, g] += 1
+    return ct, counts, gene_names
+
+
+def _pooled_delta(delta, paired, idx):
+    # ΔCt выбранных образцов, собранные по генам: (ген × образец·повтор), NaN — нет пары
+    d = delta[idx].transpose(1, 0, 2).reshape(delta.shape[1], -1)
+    p = paired[idx].transpose(1, 0, 2).reshape(delta.shape[1], -1)
+    return np.where(p, d, np.nan), p.sum(axis=1)
+
+
+def compare_groups(d_exp, n_exp, d_ctrl, n_ctrl):
+    """
+    p-value для всех генов сразу: Welch t-test; если в обеих группах ≥ 3 значений
+    и одна из них не проходит Shapiro (p ≤ 0.05) — Mann–Whitney.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        pval = np.asarray(ttest_ind(d_exp, d_ctrl, axis=1, equal_var=False, nan_policy='omit')[1], dtype=float)
+        enough = (n_ctrl >= 3) & (n_exp >= 3)
+        if enough.any():
+            p_nc = np.atleast_1d(shapiro(d_ctrl[enough], axis=1, nan_policy='omit')[1])
+            p_ne = np.atleast_1d(shapiro(d_exp[enough], axis=1, nan_policy='omit')[1])
+            nonnormal = np.zeros_like(enough)
+            nonnormal[enough] = ~((p_nc > 0.05) & (p_ne > 0.05))
+            if nonnormal.any():
+                pval[nonnormal] = mannwhitneyu(d_exp[nonnormal], d_ctrl[nonnormal], alternative='two-sided',
+                                               axis=1, nan_policy='omit')[1]
+    return pval
+
+
+def compute_ct_results(values, filled, col_genes, samples):
+    """
+    ΔCt относительно первого гена Control-, средние и log2FC для каждой пары
+    (номер эксперимента, условие) против контролей того же эксперимента.
+    """
+    ct, counts, genes = build_ct_cube(values, filled, col_genes)
+    ref = [g for g in genes if g.startswith("Control-")][0]
+    r = genes.index(ref)
+
+    reps = np.arange(ct.shape[2])
+    paired = reps[None, None, :] < np.minimum(counts, counts[:, [r]])[:, :, None]
+    delta = ct - ct[:, [r], :]
+
+    targets = np.array([k for k in range(len(genes)) if k != r], dtype=int)
+    exp_num = np.array([s['exp_num'] for s in samples])
+    is_ctrl = np.array([s['is_ctrl'] for s in samples], dtype=bool)
+    cond = np.array([s['cond'] for s in samples], dtype=object)
+
+    blocks = []
+    for e, c in sorted({(s['exp_num'], s['cond']) for s in samples if not s['is_ctrl']}):
+        ctrls = np.nonzero((exp_num == e) & is_ctrl)[0]
+        exps = np.nonzero((exp_num == e) & ~is_ctrl & (cond == c))[0]
+        if ctrls.size == 0 or exps.size == 0 or targets.size == 0:
+            continue
+
+        d_ctrl, n_ctrl = _pooled_delta(delta[:, targets], paired[:, targets], ctrls)
+        d_exp, n_exp = _pooled_delta(delta[:, targets], paired[:, targets], exps)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            log2fc = np.nanmean(d_exp, axis=1) - np.nanmean(d_ctrl, axis=1)
+
+        blocks.append(pd.DataFrame({
+            "Base Name":         c,
+            "Gene ID":           "CHLRE_01g025050v5",
+            "Gene Name":         [genes[k] for k in targets],
+            "p-value":           compare_groups(d_exp, n_exp, d_ctrl, n_ctrl),
+            "log2(Exp/Control)": log2fc
+        }))
+
+    if not blocks:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(blocks, ignore_index=True)[RESULT_COLUMNS]
+
+
+def parse_ct_text(text):
+    """Массив строк ячеек -> значения Ct (NaN — пусто или не число) и маска заполненных ячеек."""
+    flat = pd.Series(np.asarray(text, dtype=object).ravel(), dtype=object)
+    flat = flat.str.strip().str.replace(',', '.', regex=False)
+    values = pd.to_numeric(flat, errors="coerce").to_numpy(dtype=float).reshape(np.shape(text))
+    return values, ~np.isnan(values)
+
+
+class CtTableModel(QAbstractTableModel):
+    """
+    Ct-таблица поверх массивов NumPy: text — то, что видно в ячейках,
+    values/filled — разобранные числа для расчёта. Вставка и копирование
+    работают срезами массива, представление запрашивает только видимые ячейки.
+    """
+
+    def __init__(self, n_rows, n_cols, parent=None):
+        super().__init__(parent)
+        self.text = np.full((n_rows, n_cols), "", dtype=object)
+        self.values = np.full((n_rows, n_cols), np.nan)
+        self.filled = np.zeros((n_rows, n_cols), dtype=bool)
+        self.row_labels = [f"Sample_{i+1}" for i in range(n_rows)]
+        self.col_labels = [f"Gene_{j+1}" for j in range(n_cols)]
+
+    def rowCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else self.text.shape[0]
+
+    def columnCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else self.text.shape[1]
+
+    def data(self, index, role=None):
+        role = Qt.ItemDataRole.DisplayRole if role is None else role
+        if index.isValid() and role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return self.text[index.row(), index.column()]
+        return None
+
+    def setData(self, index, value, role=None):
+        role = Qt.ItemDataRole.EditRole if role is None else role
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole:
+            return False
+        self.set_block(index.row(), index.column(), [[str(value)]])
+        return True
+
+    def flags(self, index):
+        return (Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
+                | Qt.ItemFlag.ItemIsEditable)
+
+    def headerData(self, section, orientation, role=None):
+        role = Qt.ItemDataRole.DisplayRole if role is None else role
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        labels = self.col_labels if orientation == Qt.Orientation.Horizontal else self.row_labels
+        return labels[section] if 0 <= section < len(labels) else None
+
+    def set_labels(self, orientation, start, names):
+        labels = self.col_labels if orientation == Qt.Orientation.Horizontal else self.row_labels
+        names = names[:max(0, len(labels) - start)]
+        if not names:
+            return
+        labels[start:start + len(names)] = names
+        self.headerDataChanged.emit(orientation, start, start + len(names) - 1)
+
+    def set_block(self, r0, c0, rows, rmax=None, cmax=None):
+        """Записывает строки rows (списки текстов) начиная с (r0, c0), не выходя за rmax/cmax."""
+        rmax = self.text.shape[0] - 1 if rmax is None else rmax
+        cmax = self.text.shape[1] - 1 if cmax is None else cmax
+        rows = [row[:cmax - c0 + 1] for row in rows[:rmax - r0 + 1]]
+        width = max((len(row) for row in rows), default=0)
+        if r0 < 0 or c0 < 0 or not width:
+            return
+        for i, row in enumerate(rows):
+            self.text[r0 + i, c0:c0 + len(row)] = row
+        r1, c1 = r0 + len(rows), c0 + width
+        self.values[r0:r1, c0:c1], self.filled[r0:r1, c0:c1] = parse_ct_text(self.text[r0:r1, c0:c1])
+        self.dataChanged.emit(self.index(r0, c0), self.index(r1 - 1, c1 - 1))
+
+    def block_text(self, r0, c0, r1, c1):
+        return '\n'.join('\t'.join(row) for row in self.text[r0:r1 + 1, c0:c1 + 1])
+
+    def insert_row(self, row):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.text = np.insert(self.text, row, "", axis=0)
+        self.values = np.insert(self.values, row, np.nan, axis=0)
+        self.filled = np.insert(self.filled, row, False, axis=0)
+        self.row_labels.insert(row, f"Sample_{row+1}")
+        self.endInsertRows()
+
+    def insert_column(self, col):
+        self.beginInsertColumns(QModelIndex(), col, col)
+        self.text = np.insert(self.text, col, "", axis=1)
+        self.values = np.insert(self.values, col, np.nan, axis=1)
+        self.filled = np.insert(self.filled, col, False, axis=1)
+        self.col_labels.insert(col, f"Gene_{col+1}")
+        self.endInsertColumns()
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.text = np.delete(self.text, row, axis=0)
+        self.values = np.delete(self.values, row, axis=0)
+        self.filled = np.delete(self.filled, row, axis=0)
+        del self.row_labels[row]
+        self.endRemoveRows()
+
+    def remove_column(self, col):
+        self.beginRemoveColumns(QModelIndex(), col, col)
+        self.text = np.delete(self.text, col, axis=1)
+        self.values = np.delete(self.values, col, axis=1)
+        self.filled = np.delete(self.filled, col, axis=1)
+        del self.col_labels[col]
+        self.endRemoveColumns()
+
 
 class CtAnalysisApp(QWidget):
 
@@ -33,14 +439,10 @@ class CtAnalysisApp(QWidget):
         instr.setWordWrap(True)
         main_layout.addWidget(instr, alignment=Qt.AlignmentFlag.AlignLeft)
 
-        self.table = QTableWidget(2, 2)
-        self.table.setHorizontalHeaderLabels(["Gene_1", "Gene_2"])
-        self.table.setVerticalHeaderLabels  (["Sample_1", "Sample_2"])
+        self.model = CtTableModel(2, 2, self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
 
-        self.table.horizontalHeader().setSectionsClickable(True)
-        self.table.verticalHeader  ().setSectionsClickable(True)
-        self.table.horizontalHeader().sectionDoubleClicked.connect(self.edit_horizontal_header)
-        self.table.verticalHeader  ().sectionDoubleClicked.connect(self.edit_vertical_header)
         self.table.horizontalHeader().setSectionsClickable(True)
         self.table.verticalHeader  ().setSectionsClickable(True)
         self.table.horizontalHeader().sectionDoubleClicked.connect(self.edit_horizontal_header)
@@ -59,6 +461,8 @@ class CtAnalysisApp(QWidget):
         self.del_row_btn.clicked.connect(self.remove_sample)
         self.del_col_btn = QPushButton("Remove gene")
         self.del_col_btn.clicked.connect(self.remove_gene)
+        self.import_btn = QPushButton("Import plates…")
+        self.import_btn.clicked.connect(self.import_plates)
 
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(self.add_row_btn)
@@ -66,6 +470,7 @@ class CtAnalysisApp(QWidget):
         btn_layout.addWidget(self.add_col_btn)
         btn_layout.addWidget(self.del_col_btn)    
         btn_layout.addWidget(self.compute_btn)
+        btn_layout.addWidget(self.import_btn)
         main_layout.addLayout(btn_layout)
 
         self.setLayout(main_layout)
@@ -81,65 +486,53 @@ class CtAnalysisApp(QWidget):
 
 
     def add_sample(self):
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-        self.table.setVerticalHeaderItem(row, QTableWidgetItem(f"Sample_{row+1}"))
+        self.model.insert_row(self.model.rowCount())
 
     def add_gene(self):
-        col = self.table.columnCount()
-        self.table.insertColumn(col)
-        self.table.setHorizontalHeaderItem(col, QTableWidgetItem(f"Gene_{col+1}"))
+        self.model.insert_column(self.model.columnCount())
 
     def remove_sample(self):
-        row = self.table.currentRow()
-        if row < 0 or row >= self.table.rowCount():
-            row = self.table.rowCount() - 1
+        row = self.table.currentIndex().row()
+        if row < 0 or row >= self.model.rowCount():
+            row = self.model.rowCount() - 1
         if row >= 0:
-            self.table.removeRow(row)
+            self.model.remove_row(row)
         else:
             QMessageBox.warning(self, "Removing a sample", "There are no rows available to delete.")
 
     def remove_gene(self):
 
-        col = self.table.currentColumn()
-        if col < 0 or col >= self.table.columnCount():
-            col = self.table.columnCount() - 1
+        col = self.table.currentIndex().column()
+        if col < 0 or col >= self.model.columnCount():
+            col = self.model.columnCount() - 1
         if col >= 0:
-            self.table.removeColumn(col)
+            self.model.remove_column(col)
         else:
             QMessageBox.warning(self, "Removing a gene", "There are no columns available to delete.")
 
 
     def parse_headers(self):
 
-        gene_headers = [self.table.horizontalHeaderItem(j).text() 
-                        for j in range(self.table.columnCount())]
+        gene_headers = self.model.col_labels
         genes = [re.sub(r'_(\d+)$', '', h) for h in gene_headers]
 
 
         samples = []
-        for i in range(self.table.rowCount()):
-            s = self.table.verticalHeaderItem(i).text().strip()
+        for label in self.model.row_labels:
+            s = label.strip()
 
-            m = re.match(r'^(\d+)(Control-)?(.+?)_(\d+)$', s)
-            if not m:
+            parsed = parse_sample_label(s)
+            if parsed is None:
                 QMessageBox.critical(self, "Error", 
                     f"Incorrect sample format: «{s}»\n"
                     "Should be: 1Control-Condition, time_1 or 1Condition, time_1")
                 return None, None
-            exp_num, ctrl_pref, cond, bio_rep = m.groups()
-            samples.append({
-                'label':    s,
-                'exp_num':  int(exp_num),
-                'is_ctrl':  bool(ctrl_pref),
-                'cond':     cond.strip(),   
-                'bio_rep':  int(bio_rep),
-            })
+            samples.append(parsed)
         return genes, samples
     
     def edit_horizontal_header(self, index: int):
         
-        old = [self.table.horizontalHeaderItem(j).text() for j in range(self.table.columnCount())]
+        old = self.model.col_labels
         text, ok = QInputDialog.getText(
             self, 
             "Rename genes",
@@ -148,15 +541,11 @@ class CtAnalysisApp(QWidget):
         )
         if not (ok and text):
             return
-        parts = text.split('\t')
-        for k, name in enumerate(parts):
-            col = index + k
-            if col < self.table.columnCount():
-                self.table.setHorizontalHeaderItem(col, QTableWidgetItem(name))
+        self.model.set_labels(Qt.Orientation.Horizontal, index, text.split('\t'))
 
     def edit_vertical_header(self, index: int):
         
-        old = [self.table.verticalHeaderItem(i).text() for i in range(self.table.rowCount())]
+        old = self.model.row_labels
         text, ok = QInputDialog.getText(
             self,
             "Rename samples",
@@ -166,22 +555,19 @@ class CtAnalysisApp(QWidget):
         if not (ok and text):
             return
        
-        parts = re.split(r'[\t\n]+', text)
-        for k, name in enumerate(parts):
-            row = index + k
-            if row < self.table.rowCount():
-                self.table.setVerticalHeaderItem(row, QTableWidgetItem(name))
+        self.model.set_labels(Qt.Orientation.Vertical, index, re.split(r'[\t\n]+', text))
+
+    def selected_range(self):
+        ranges = self.table.selectionModel().selection()
+        if ranges.isEmpty():
+            return None
+        sel = ranges[0]
+        return sel.top(), sel.left(), sel.bottom(), sel.right()
 
     def copy_selection(self):
-        selection = self.table.selectedRanges()[0]
-        data = []
-        for row in range(selection.topRow(), selection.bottomRow() + 1):
-            row_data = []
-            for col in range(selection.leftColumn(), selection.rightColumn() + 1):
-                item = self.table.item(row, col)
-                row_data.append(item.text() if item else "")
-            data.append('\t'.join(row_data))
-        QApplication.clipboard().setText('\n'.join(data))
+        sel = self.selected_range()
+        if sel:
+            QApplication.clipboard().setText(self.model.block_text(*sel))
 
     def paste_selection(self):
        
@@ -189,145 +575,94 @@ class CtAnalysisApp(QWidget):
 
         rows = [r.split('\t') for r in text.splitlines()]
 
-        sel = self.table.selectedRanges()
+        sel = self.selected_range()
         if sel:
 
-            r0, c0 = sel[0].topRow(), sel[0].leftColumn()
-            rmax, cmax = sel[0].bottomRow(), sel[0].rightColumn()
+            r0, c0, rmax, cmax = sel
         else:
 
-            r0, c0 = self.table.currentRow(), self.table.currentColumn()
-            rmax, cmax = self.table.rowCount()-1, self.table.columnCount()-1
+            cur = self.table.currentIndex()
+            r0, c0 = max(cur.row(), 0), max(cur.column(), 0)
+            rmax, cmax = self.model.rowCount()-1, self.model.columnCount()-1
 
-        for i, row in enumerate(rows):
-            for j, val in enumerate(row):
-                r = r0 + i
-                c = c0 + j
-                if r > rmax or c > cmax:
-                    continue
+        self.model.set_block(r0, c0, rows, rmax, cmax)
 
-                self.table.setItem(r, c, QTableWidgetItem(val))
+    def table_arrays(self):
+        """Ct-таблица прямо из массивов модели: значения (NaN — пусто) и маска заполненных ячеек."""
+        return self.model.values.copy(), self.model.filled.copy()
 
     def compute_statistics(self):
 
-        with open("settings.json", "r", encoding="utf-8") as f:
-            settings = json.load(f)
-        res_dir = settings["folders"]["results_folder"]
-        os.makedirs(res_dir, exist_ok=True)
-        out_path = os.path.join(res_dir, "ct_analysis_results.txt")
-
+        out_path = results_path()
 
         genes, samples = self.parse_headers()
         if genes is None:
             return
 
-        raw_ct  = {}
-        mean_ct = {}
-        for i, samp in enumerate(samples):
-            lab = samp['label']
-            raw_ct[lab]  = {}
-            mean_ct[lab] = {}
-            for g in genes:
-                vals = []
-                for j in range(self.table.columnCount()):
-                    hdr = self.table.horizontalHeaderItem(j).text()
-                    if re.sub(r'_(\d+)$', '', hdr) == g:
-                        it = self.table.item(i, j)
-                        if it and it.text().strip():
-                            try:
-                                vals.append(float(it.text().replace(',', '.')))
-                            except ValueError:
-                                pass
-                raw_ct[lab][g]  = vals
-                mean_ct[lab][g] = np.nanmean(vals) if vals else np.nan
-
-
         ref_genes = [g for g in genes if g.startswith("Control-")]
         if not ref_genes:
             QMessageBox.critical(self, "Error", "Reference gene with prefix Control- was not found")
             return
-        ref = ref_genes[0]
-
-        results = []
-
-        uniq = sorted({(s['exp_num'], s['cond']) 
-                       for s in samples if not s['is_ctrl']})
-        for exp_num, cond in uniq:
-
-            ctrls = [s['label'] for s in samples 
-                     if s['exp_num']==exp_num and s['is_ctrl']]
-
-            exps  = [s['label'] for s in samples 
-                     if s['exp_num']==exp_num and not s['is_ctrl'] and s['cond']==cond]
-            if not ctrls or not exps:
-                continue
-
-            for gene in genes:
-                if gene == ref:
-                    continue  
-
-                d_ctrl = []
-                for lab in ctrls:
-
-                    d_ctrl += [x - y for x, y in zip(raw_ct[lab][gene], raw_ct[lab][ref])]
-                d_exp = []
-                for lab in exps:
-                    d_exp += [x - y for x, y in zip(raw_ct[lab][gene], raw_ct[lab][ref])]
-
-                mean_ctrl = np.nanmean(d_ctrl)
-                mean_exp  = np.nanmean(d_exp)
-                log2fc    = mean_exp - mean_ctrl
-
-
-                if len(d_ctrl)>=3 and len(d_exp)>=3:
-                    p_nc = shapiro(d_ctrl)[1]
-                    p_ne = shapiro(d_exp)[1]
-                    if p_nc>0.05 and p_ne>0.05:
-                        pval = ttest_ind(d_exp, d_ctrl, equal_var=False)[1]
-                    else:
-                        pval = mannwhitneyu(d_exp, d_ctrl, alternative='two-sided')[1]
-                else:
-                    pval = ttest_ind(d_exp, d_ctrl, equal_var=False)[1]
-
-                results.append({
-                    "Base Name":         cond,
-                    "Gene ID":           "CHLRE_01g025050v5",
-                    "Gene Name":         gene,
-                    "p-value":           pval,
-                    "log2(Exp/Control)": log2fc
-                })
-        
-        df = pd.DataFrame(results)        
+
+        values, filled = self.table_arrays()
+        df = compute_ct_results(values, filled, genes, samples)
         df.to_csv(out_path, sep="\t", index=False)
-        self.fix_output_format(out_path)
+        fix_output_format(out_path)
         QMessageBox.information(self, "Ready", f"The results are recorded in {out_path}")
 
-    def fix_output_format(self, out_path):
-
-        df = pd.read_csv(out_path, sep="\t")
+    def import_plates(self):
+        # экспорты прибора считаются сразу движком ΔΔCt, минуя таблицу окна
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Plate exports", "", "Plate exports (*.csv *.tsv *.txt);;All files (*)")
+        if not paths:
+            return
+        layout_path, _ = QFileDialog.getOpenFileName(
+            self, "Plate layout (Cancel — use sample/target from exports)", "",
+            "Layout (*.csv *.tsv *.txt);;All files (*)")
+        try:
+            out_path, bad = analyze_plates(paths, layout_path or None, results_path())
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        msg = f"{len(paths)} plate(s) imported.\nThe results are recorded in {out_path}"
+        if bad:
+            msg += ("\n\nSkipped samples with incorrect format:\n" + "\n".join(bad[:20]))
+        QMessageBox.information(self, "Ready", msg)
 
-        df["Gene Name"] = df["Gene Name"].astype(str)
-        df["Gene Name"] = df["Gene Name"].str.replace('"', '', regex=False)
-        df["Gene Name"] = df["Gene Name"].str.replace('\n', '', regex=False)
-        df["Gene Name"] = df["Gene Name"].str.strip()
 
+def results_path(settings_path="settings.json"):
+    with open(settings_path, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    res_dir = settings["folders"]["results_folder"]
+    os.makedirs(res_dir, exist_ok=True)
+    return os.path.join(res_dir, "ct_analysis_results.txt")
 
 
-        if "Gene Name" in df.columns:
-            df = df.rename(columns={"Gene Name": "GATA Name"})
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="RT-qPCR ΔΔCt: окно или пакетный импорт экспортов планшетов")
+    p.add_argument("--plates", nargs="+", metavar="FILE",
+                   help="экспорты планшетов (CSV/TSV с Well, Sample, Target, Ct); допускаются маски *.csv")
+    p.add_argument("--layout", help="раскладка планшета: Well, Sample, Target и необязательный Plate")
+    p.add_argument("--out", help="файл результата (по умолчанию results_folder из settings.json)")
+    p.add_argument("--workers", type=int, default=None, help="число потоков чтения файлов")
+    return p.parse_args(argv)
 
 
-        df = df.drop_duplicates(subset=["Base Name", "GATA Name"])
+def run_headless(args):
+    paths = sorted({p for pattern in args.plates for p in (glob.glob(pattern) or [pattern])})
+    out_path = args.out or results_path()
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    out_path, bad = analyze_plates(paths, args.layout, out_path, args.workers)
+    for label in bad:
+        print(f"Skipped sample with incorrect format: {label}", file=sys.stderr)
+    print(f"The results are recorded in {out_path}")
 
-        df["GATA_num"] = df["GATA Name"].str.extract(r'(\d+)').astype(float)
-        df = df.sort_values(by=["Base Name", "GATA_num"])
-        df = df.drop(columns=["GATA_num"])
 
-        cols = ["Base Name", "GATA Name", "p-value", "log2(Exp/Control)"]
-        df = df[cols]
-        df.to_csv(out_path, sep="\t", index=False)
-        
 if __name__ == '__main__':
+    args = parse_args()
+    if args.plates:
+        run_headless(args)
+        sys.exit(0)
     app = QApplication(sys.argv)
     win = CtAnalysisApp()
     win.show()
@@ -3,9 +3,17 @@ import re
 import subprocess
 import json
 import sys
+import hashlib
+import math
+import pickle
+import sqlite3
+from collections import defaultdict
 import pandas as pd
 from pydeseq2.dds import DeseqDataSet
 from pydeseq2.ds import DeseqStats
+from pipeline_log import StepLog
+from resource_usage import wsl_command
+from results_io import read_table, write_table, table_exists
 
 
 import tkinter as tk
@@ -13,21 +21,22 @@ from tkinter import messagebox
 
 SETTINGS_FILE = "settings.json"
 LOG_FILE = "deseq2_analysis_log.txt"
+MODEL_FILE = "deseq2_model.pkl"
+GLOBAL_COUNTS_FILE = "global_merged_counts.tsv"
+RESULTS_DB = "deseq2_results.sqlite"
+DEFAULT_READ_LENGTH = 75
+GTF_ATTR_RE = re.compile(r'(\S+) "([^"]*)"')
+log = StepLog("deseq2_analysis", LOG_FILE)
 
 
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as log_file:
-        log_file.write(message + "\n")
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            sys.exit(1)
 
-
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        sys.exit(1)
-
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
 
     folders = settings.get("folders", {})
     bam_folder = folders.get("bam_folder")
@@ -53,12 +62,12 @@ def convert_path_to_wsl(win_path):
     return path
 
 
-def run_command(command):
-    log(f"Запуск в WSL:\n{command}")
+def run_command(command, sample=None):
+    log(f"Запуск в WSL:\n{command}", sample=sample)
     try:
-        subprocess.run(f'wsl bash -c "{command}"', shell=True, check=True)
+        log.run(wsl_command(command), sample=sample, parse_time=True, shell=True)
     except subprocess.CalledProcessError as e:
-        log(f"Ошибка выполнения команды: {e}")
+        log(f"Ошибка выполнения команды: {e}", sample=sample)
         sys.exit(1)
 
 
@@ -68,7 +77,7 @@ def parse_sample_name(filename):
     full_sample = filename
 
     base = filename
-    for suffix in ["_paired_sorted", "_single_sorted"]:
+    for suffix in ["_paired_sorted", "_single_sorted", "_sorted"]:
         if base.endswith(suffix):
             base = base[:-len(suffix)]
 
@@ -104,6 +113,10 @@ def parse_sample_info(bam_files):
     return pd.DataFrame(samples)
 
 
+def parse_sample_columns(columns):
+    return pd.DataFrame([parse_sample_name(str(c)) for c in columns])
+
+
 
 def run_featurecounts_individual(bam_file, bam_folder, results_folder, annotation_gtf_wsl, extra_options=""):
     full_sample = os.path.splitext(bam_file)[0]
@@ -115,7 +128,7 @@ def run_featurecounts_individual(bam_file, bam_folder, results_folder, annotatio
         f"featureCounts -a {annotation_gtf_wsl} -o {output_counts_wsl} "
         f"{extra_options} -T 4 -g gene_id -t exon -s 0 {bam_path_wsl}"
     )
-    run_command(cmd)
+    run_command(cmd, sample=full_sample)
     return output_counts
 
 
@@ -127,6 +140,61 @@ def prepare_count_matrix(count_file):
 
 
 
+def read_stringtie_gene_counts(gtf_path, read_length, reference_only=False):
+    """
+    Подход prepDE: число ридов транскрипта ≈ ceil(cov * длина экзонов / длина рида),
+    затем суммирование по гену (ref_gene_id, если есть, иначе gene_id).
+    reference_only: транскрипты без ref_gene_id (новые локусы STRG.*) отбрасываются —
+    без -e их gene_id назначаются в каждом образце независимо и между образцами не сравнимы.
+    """
+    tx_length = defaultdict(int)
+    tx_cov = {}
+    tx_gene = {}
+    with open(gtf_path, "r") as gtf_file:
+        for line in gtf_file:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 9 or fields[2] not in ("transcript", "exon"):
+                continue
+            attrs = dict(GTF_ATTR_RE.findall(fields[8]))
+            transcript_id = attrs.get("transcript_id")
+            if transcript_id is None:
+                continue
+            if fields[2] == "exon":
+                tx_length[transcript_id] += int(fields[4]) - int(fields[3]) + 1
+            else:
+                gene_id = attrs.get("ref_gene_id") or (None if reference_only else attrs.get("gene_id"))
+                if gene_id is None:
+                    continue
+                tx_cov[transcript_id] = float(attrs.get("cov", 0.0))
+                tx_gene[transcript_id] = gene_id
+
+    gene_counts = defaultdict(int)
+    for transcript_id, cov in tx_cov.items():
+        gene_counts[tx_gene[transcript_id]] += math.ceil(cov * tx_length[transcript_id] / read_length)
+    return pd.Series(gene_counts, dtype="int64")
+
+
+def count_from_stringtie(gtf_folder, read_length, reference_only=False):
+    gtf_files = sorted(f for f in os.listdir(gtf_folder) if f.endswith(".gtf"))
+    if not gtf_files:
+        log(f"Нет GTF-файлов StringTie в папке {gtf_folder}!")
+        sys.exit(1)
+
+    log(f"Подсчёт counts по покрытию StringTie ({len(gtf_files)} GTF, длина рида {read_length}).")
+    count_series = {}
+    for gtf_file in gtf_files:
+        sample = os.path.splitext(gtf_file)[0]
+        count_series[sample] = read_stringtie_gene_counts(os.path.join(gtf_folder, gtf_file), read_length,
+                                                          reference_only)
+
+    global_counts = pd.DataFrame(count_series).fillna(0).astype("int64")
+    global_counts.index.name = "gene"
+    sample_df = parse_sample_columns(global_counts.columns)
+    return global_counts, sample_df
+
+
 def run_global_deseq2(count_matrix, sample_table):
     dds = DeseqDataSet(
         counts=count_matrix.T,
@@ -139,7 +207,57 @@ def run_global_deseq2(count_matrix, sample_table):
     return dds
 
 
-def format_and_save_results(results, mapping, results_folder, base_name, output_filename):
+def compute_fingerprint(count_matrix, sample_table, design_factors="group"):
+    """
+    Отпечаток входных данных модели: значения counts, имена генов/образцов и дизайн.
+    Модель переобучается только если отпечаток изменился.
+    """
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(count_matrix, index=True).values.tobytes())
+    h.update("\t".join(map(str, count_matrix.columns)).encode("utf-8"))
+    design = sample_table.loc[count_matrix.columns, [design_factors]]
+    h.update(pd.util.hash_pandas_object(design, index=True).values.tobytes())
+    h.update(design_factors.encode("utf-8"))
+    return h.hexdigest()
+
+
+def save_fitted_model(dds, fingerprint, results_folder):
+    model_path = os.path.join(results_folder, MODEL_FILE)
+    with open(model_path, "wb") as f:
+        pickle.dump({"fingerprint": fingerprint, "dds": dds}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    log(f"Модель DESeq2 сохранена в файл: {model_path}")
+
+
+def load_fitted_model(results_folder, fingerprint):
+    model_path = os.path.join(results_folder, MODEL_FILE)
+    if not os.path.exists(model_path):
+        return None
+    try:
+        with open(model_path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        log(f"Не удалось загрузить сохранённую модель DESeq2: {e}")
+        return None
+    if payload.get("fingerprint") != fingerprint:
+        log("Входные данные или дизайн изменились, сохранённая модель DESeq2 не используется.")
+        return None
+    return payload["dds"]
+
+
+def get_or_fit_model(global_counts, sample_table, results_folder):
+    fingerprint = compute_fingerprint(global_counts, sample_table)
+    dds = load_fitted_model(results_folder, fingerprint)
+    if dds is not None:
+        log("Используется сохранённая модель DESeq2 (входные данные не изменились).")
+        return dds
+    log("Запуск глобальной нормализации DESeq2...")
+    with log.timed("stage", name="deseq2_fit", usage=True):
+        dds = run_global_deseq2(global_counts, sample_table)
+    save_fitted_model(dds, fingerprint, results_folder)
+    return dds
+
+
+def format_and_save_results(results, mapping, results_folder, base_name, output_filename, settings=None):
     results = results.reset_index()
     results = results.rename(columns={
         "log2FoldChange": "log2(Exp/Control)",
@@ -151,8 +269,43 @@ def format_and_save_results(results, mapping, results_folder, base_name, output_
     results["Base Name"] = base_name
     cols = ["Base Name", "Gene ID", "GATA Name", "p-value", "log2(Exp/Control)"]
     output_path = os.path.join(results_folder, output_filename)
-    results[cols].to_csv(output_path, sep="\t", index=False)
+    write_table(results[cols], output_path, settings=settings)
     log(f"Результаты сохранены в файл: {output_path}")
+    save_results_to_store(results[cols], results_folder, base_name)
+
+
+def save_results_to_store(results, results_folder, contrast):
+    """
+    Записывает результаты контраста в SQLite с ключом (contrast, gene_id),
+    чтобы extract_Deseq2 читал только нужные гены, а не полные таблицы.
+    """
+    db_path = os.path.join(results_folder, RESULTS_DB)
+    rows = zip(
+        [contrast] * len(results),
+        results["Gene ID"].astype(str),
+        results["Base Name"].astype(str),
+        results["GATA Name"].where(results["GATA Name"].notna(), None),
+        results["p-value"].astype(float),
+        results["log2(Exp/Control)"].astype(float),
+    )
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS de_results ("
+                "contrast TEXT NOT NULL, gene_id TEXT NOT NULL, base_name TEXT, gata_name TEXT, "
+                "pvalue REAL, log2fc REAL, PRIMARY KEY (contrast, gene_id)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_de_results_gene ON de_results (gene_id)")
+            conn.execute("DELETE FROM de_results WHERE contrast = ?", (contrast,))
+            conn.executemany(
+                "INSERT INTO de_results (contrast, gene_id, base_name, gata_name, pvalue, log2fc) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+    finally:
+        conn.close()
+    log(f"Результаты контраста {contrast} записаны в {db_path}")
 
 
 def move_counts_files(results_folder):
@@ -172,21 +325,24 @@ def move_counts_files(results_folder):
                 log(f"Не удалось переместить файл {file}: {e}")
 
 
-def main():
-    bam_folder, genome_folder, results_folder, settings = load_settings()
+def ask_yes_no(title, question):
+    # диалог при запуске скрипта отдельно; в GUI пайплайна вопрос задаёт вызывающий (StepContext.ask)
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        return messagebox.askyesno(title, question)
+    finally:
+        root.destroy()
+
+
+def count_from_bams(bam_folder, genome_folder, results_folder, ask=ask_yes_no):
     counts_folder = os.path.join(results_folder, "Counts")
-    
 
     skip_counting = False
     if os.path.exists(counts_folder):
         count_files = [f for f in os.listdir(counts_folder) if f.startswith("gene_counts_") and (f.endswith(".txt") or f.endswith(".txt.summary"))]
         if count_files:
-            root = tk.Tk()
-            root.withdraw()  
-            answer = messagebox.askyesno("Подсчёт файлов", "Найдены файлы подсчёта в папке Counts.\nПропустить этап подсчёта и использовать существующие файлы?")
-            if answer:
-                skip_counting = True
-            root.destroy()
+            skip_counting = ask("Подсчёт файлов", "Найдены файлы подсчёта в папке Counts.\nПропустить этап подсчёта и использовать существующие файлы?")
 
 
     all_bam_files = [f for f in os.listdir(bam_folder) if f.endswith("_sorted.bam")]
@@ -209,7 +365,6 @@ def main():
 
 
     sample_df = parse_sample_info(all_bam_files)
-    sample_df["group"] = sample_df["experiment"] + "_" + sample_df["condition"]
 
 
     count_file_dict = {}
@@ -238,19 +393,14 @@ def main():
         df = df.rename(columns={original_col: sample})
         count_dfs.append(df)
     global_counts = pd.concat(count_dfs, axis=1)
-    global_counts_filename = os.path.join(results_folder, "global_merged_counts.tsv")
-    global_counts.to_csv(global_counts_filename, sep="\t")
-    log(f"Глобальные count данные сохранены в файл: {global_counts_filename}")
-
 
-    sample_table = sample_df.set_index("full_sample")
-
-    log("Запуск глобальной нормализации DESeq2...")
-    dds = run_global_deseq2(global_counts, sample_table)
+    if not skip_counting:
+        move_counts_files(results_folder)
 
-    gene_mapping = settings.get("gene_mapping", {})
+    return global_counts, sample_df
 
 
+def run_contrasts(dds, sample_df, sample_table, gene_mapping, results_folder, settings=None):
     for experiment in sample_df["experiment"].unique():
         log(f"Извлечение результата для эксперимента: {experiment}")
         group_treated = f"{experiment}_treated"
@@ -264,9 +414,10 @@ def main():
         cond_counts = exp_samples["condition"].value_counts()
         insufficient_reps = cond_counts.min() < 3
 
-        stat_res = DeseqStats(dds, contrast=("group", group_treated, group_control))
-        stat_res.summary()
-        res = stat_res.results_df
+        with log.timed("stage", name=f"contrast {experiment}"):
+            stat_res = DeseqStats(dds, contrast=("group", group_treated, group_control))
+            stat_res.summary()
+            res = stat_res.results_df
 
         if insufficient_reps:
             log(f"В эксперименте {experiment} менее 3 биологических повторов. Устанавливаю p-value и FDR = 1.")
@@ -275,12 +426,54 @@ def main():
 
         base_name = experiment
         output_filename = f"results_Deseq2_{experiment}.tsv"
-        format_and_save_results(res, gene_mapping, results_folder, base_name, output_filename)
+        format_and_save_results(res, gene_mapping, results_folder, base_name, output_filename, settings)
+
+
+def main(settings=None, ask=ask_yes_no):
+    bam_folder, genome_folder, results_folder, settings = load_settings(settings)
+    options = settings.get("options", {})
+    global_counts_filename = os.path.join(results_folder, GLOBAL_COUNTS_FILE)
+
+    if options.get("deseq2_results_only", False) and table_exists(global_counts_filename):
+        log(f"Режим 'только результаты': используем сохранённую матрицу counts {global_counts_filename}")
+        # те же типы, что и после подсчёта: отпечаток модели не зависит от формата файла
+        global_counts = read_table(global_counts_filename, index_col=0).astype("int64")
+        global_counts.index = global_counts.index.astype(str)
+        sample_df = parse_sample_columns(global_counts.columns)
+    else:
+        if options.get("deseq2_results_only", False):
+            log(f"Файл {global_counts_filename} не найден, выполняется полный подсчёт.")
+        if options.get("deseq2_counts_from_stringtie", False):
+            gtf_folder = settings.get("folders", {}).get("gtf_folder")
+            if not gtf_folder or not os.path.isdir(gtf_folder):
+                log("Для подсчёта по StringTie не задана или не найдена папка gtf_folder!")
+                sys.exit(1)
+            read_length = options.get("read_length", DEFAULT_READ_LENGTH)
+            # counts сравнимы между образцами только для генов эталонной аннотации (StringTie с -e)
+            reference_only = not options.get("strict_annotation", False)
+            if reference_only:
+                log("Внимание: strict_annotation выключен (StringTie без -e). Идентификаторы новых локусов "
+                    "STRG.* назначаются в каждом образце независимо, поэтому в матрицу counts попадают "
+                    "только транскрипты с ref_gene_id.")
+            global_counts, sample_df = count_from_stringtie(gtf_folder, read_length, reference_only)
+        else:
+            global_counts, sample_df = count_from_bams(bam_folder, genome_folder, results_folder, ask)
+        write_table(global_counts, global_counts_filename, index=True, settings=settings)
+        log(f"Глобальные count данные сохранены в файл: {global_counts_filename}")
+
+    sample_df["group"] = sample_df["experiment"] + "_" + sample_df["condition"]
+    sample_table = sample_df.set_index("full_sample")
+
+    dds = get_or_fit_model(global_counts, sample_table, results_folder)
+
+    gene_mapping = settings.get("gene_mapping", {})
+    run_contrasts(dds, sample_df, sample_table, gene_mapping, results_folder, settings)
 
     log("Глобальный анализ DESeq2 завершён для всех экспериментов.")
 
-    if not skip_counting:
-        move_counts_files(results_folder)
+
+def run_step(ctx):
+    main(ctx.settings, ctx.ask or ask_yes_no)
 
 
 if __name__ == "__main__":
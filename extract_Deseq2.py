@@ -1,23 +1,25 @@
 import os
 import json
+import sqlite3
 import pandas as pd
 import re
+from pipeline_log import StepLog
+from results_io import read_table, write_table, PARQUET_EXT
 
 SETTINGS_FILE = "settings.json"
 LOG_FILE = "extract_deseq2_log.txt"
-
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(message + "\n")
-
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        raise FileNotFoundError("settings.json not found")
-    
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+RESULTS_DB = "deseq2_results.sqlite"
+SQLITE_MAX_PARAMS = 500
+log = StepLog("extract_Deseq2", LOG_FILE)
+
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            raise FileNotFoundError("settings.json not found")
+
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
     
     output_folder = settings["folders"].get("results_folder")
     gene_mapping = settings.get("gene_mapping", {})
@@ -26,7 +28,7 @@ def load_settings():
         log("В settings.json не указана папка results_folder!")
         raise ValueError("Missing results_folder")
     
-    return output_folder, gene_mapping
+    return output_folder, gene_mapping, settings
 
 def extract_gata_number(gata_name):
     """
@@ -40,20 +42,65 @@ def extract_gata_number(gata_name):
     else:
         return 999
 
-def extract_genes(output_folder, gene_mapping):
-
-    all_files = os.listdir(output_folder)
-    result_files = [f for f in all_files if f.startswith("results_Deseq2") and f.endswith(".tsv")]
+def read_genes_from_store(db_path, gene_mapping):
+    """
+    Читает из SQLite-хранилища только строки генов из gene_mapping
+    по индексу gene_id, без разбора полных таблиц results_Deseq2_*.tsv.
+    """
+    gene_ids = list(gene_mapping.keys())
+    chunks = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, len(gene_ids), SQLITE_MAX_PARAMS):
+            batch = gene_ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ", ".join("?" * len(batch))
+            query = (
+                'SELECT base_name AS "Base Name", gene_id AS "Gene ID", '
+                'pvalue AS "p-value", log2fc AS "log2(Exp/Control)" '
+                f"FROM de_results WHERE gene_id IN ({placeholders})"
+            )
+            chunks.append(pd.read_sql_query(query, conn, params=batch))
+    finally:
+        conn.close()
+
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    if df.empty:
+        return df
+    df["GATA Name"] = df["Gene ID"].map(gene_mapping)
+    log(f"Из хранилища {db_path} прочитано {len(df)} строк.")
+    return df[["Base Name", "Gene ID", "GATA Name", "p-value", "log2(Exp/Control)"]]
+
+def extract_genes(output_folder, gene_mapping, settings=None):
+
+    db_path = os.path.join(output_folder, RESULTS_DB)
+    if os.path.exists(db_path):
+        try:
+            combined_df = read_genes_from_store(db_path, gene_mapping)
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            log(f"Не удалось прочитать хранилище {db_path}: {e}. Читаю файлы results_Deseq2*.tsv.")
+            combined_df = None
+        if combined_df is not None and not combined_df.empty:
+            save_combined(combined_df, output_folder, settings)
+            return
+        log("В хранилище нет строк для интересующих генов. Читаю файлы results_Deseq2*.tsv.")
+
+    # каждый контраст — один раз: по имени .tsv read_table сам выберет parquet рядом с ним
+    result_files = {}
+    for f in sorted(os.listdir(output_folder)):
+        stem, ext = os.path.splitext(f)
+        if f.startswith("results_Deseq2") and ext in (".tsv", PARQUET_EXT):
+            result_files[stem] = f  # .tsv идёт после .parquet и заменяет его
+    result_files = list(result_files.values())
     
     if not result_files:
-        log("В папке нет файлов, начинающихся на 'results_Deseq2' с расширением .tsv")
+        log("В папке нет файлов, начинающихся на 'results_Deseq2' с расширением .tsv или .parquet")
         raise FileNotFoundError("No results_Deseq2*.tsv files found")
     
     dfs = []
     for file in result_files:
         file_path = os.path.join(output_folder, file)
         try:
-            df = pd.read_csv(file_path, sep='\t')
+            df = read_table(file_path)
         except Exception as e:
             log(f"Не удалось прочитать файл {file}: {e}")
             continue
@@ -78,7 +125,7 @@ def extract_genes(output_folder, gene_mapping):
             base_name = file[len("results_Deseq2"):]
         else:
             base_name = file
-        base_name = base_name.replace(".tsv", "").strip("_ ")
+        base_name = os.path.splitext(base_name)[0].strip("_ ")
         
 
         filtered_df["Base Name"] = base_name
@@ -99,16 +146,21 @@ def extract_genes(output_folder, gene_mapping):
     
 
     combined_df = pd.concat(dfs, ignore_index=True)
+    save_combined(combined_df, output_folder, settings)
 
-
+def save_combined(combined_df, output_folder, settings=None):
     combined_df["GATA_num"] = combined_df["GATA Name"].apply(extract_gata_number)
     combined_df = combined_df.sort_values(by=["Base Name", "GATA_num"])
     combined_df = combined_df.drop(columns=["GATA_num"])
     
     output_file = os.path.join(output_folder, "Deseq2.txt")
-    combined_df.to_csv(output_file, sep="\t", index=False)
+    write_table(combined_df, output_file, settings=settings)
     log(f"Итоговый файл сохранён: {output_file}")
 
+def run_step(ctx):
+    output_folder, gene_mapping, settings = load_settings(ctx.settings)
+    extract_genes(output_folder, gene_mapping, settings)
+
 if __name__ == "__main__":
-    output_folder, gene_mapping = load_settings()
-    extract_genes(output_folder, gene_mapping)
+    output_folder, gene_mapping, settings = load_settings()
+    extract_genes(output_folder, gene_mapping, settings)
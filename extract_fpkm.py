@@ -4,22 +4,22 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 import re
+from pipeline_log import StepLog
+from results_io import write_table, table_exists
 
 SETTINGS_FILE = "settings.json"
 LOG_FILE = "extract_fpkm_log.txt"
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+log = StepLog("extract_fpkm", LOG_FILE)
 
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(message + "\n")
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            raise FileNotFoundError("settings.json not found")
 
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        raise FileNotFoundError("settings.json not found")
-
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
 
     gtf_folder = settings["folders"].get("gtf_folder")
     output_folder = settings["folders"].get("results_folder")
@@ -29,16 +29,22 @@ def load_settings():
         log("В settings.json не указаны gtf_folder или results_folder!")
         raise ValueError("Missing folders in settings")
 
-    return gtf_folder, output_folder, gene_mapping
+    return gtf_folder, output_folder, gene_mapping, settings
 
 def get_unique_filename(base_name, extension, folder):
     counter = 1
     file_name = f"{base_name}{extension}"
-    while os.path.exists(os.path.join(folder, file_name)):
+    while table_exists(os.path.join(folder, file_name)):
         file_name = f"{base_name}_{counter}{extension}"
         counter += 1
     return os.path.join(folder, file_name)
 
+def get_output_path(base_name, extension, output_folder, run_folder=None):
+    # в папке запуска имена фиксированы; без неё — прежняя схема с суффиксами _N
+    if run_folder:
+        return os.path.join(run_folder, f"{base_name}{extension}")
+    return get_unique_filename(base_name, extension, output_folder)
+
 def normalize_base_name(file_name):
 
     match = re.match(r"^(.*?)(Control)?\d+_sorted\.gtf$", file_name)
@@ -47,7 +53,7 @@ def normalize_base_name(file_name):
         return f"{prefix}{'_Control' if control else ''}"
     return file_name
 
-def extract_fpkm(gtf_folder, output_folder, gene_mapping):
+def extract_fpkm(gtf_folder, output_folder, gene_mapping, run_folder=None, settings=None):
     gata_order = list(gene_mapping.values())
     results = []
     gata4_count = defaultdict(int)
@@ -80,8 +86,9 @@ def extract_fpkm(gtf_folder, output_folder, gene_mapping):
     df["GATA Order"] = df["GATA Name"].apply(lambda x: gata_order.index(x.split("_")[0]) if x.split("_")[0] in gata_order else -1)
     df = df.sort_values(by=["GATA Order", "File"]).drop(columns=["GATA Order"])
 
-    output_fpkm_all = get_unique_filename("GTF_results_fpkm_all", ".txt", output_folder)
-    df.to_csv(output_fpkm_all, sep="\t", index=False)
+    output_fpkm_all = get_output_path("GTF_results_fpkm_all", ".txt", output_folder, run_folder)
+    write_table(df, output_fpkm_all, settings=settings)
+    fpkm_all_df = df.copy()
 
     df["Base Name"] = df["File"].apply(normalize_base_name)
     df["IsControl"] = df["Base Name"].str.endswith("_Control")
@@ -90,8 +97,8 @@ def extract_fpkm(gtf_folder, output_folder, gene_mapping):
     avg_df["GATA Order"] = avg_df["GATA Name"].apply(lambda x: gata_order.index(x.split("_")[0]) if x.split("_")[0] in gata_order else -1)
     avg_df = avg_df.sort_values(by=["GATA Order", "Base Name", "IsControl"]).drop(columns=["GATA Order"])
 
-    output_fpkm_avg = get_unique_filename("GTF_results_fpkm_avg", ".txt", output_folder)
-    avg_df.to_csv(output_fpkm_avg, sep="\t", index=False)
+    output_fpkm_avg = get_output_path("GTF_results_fpkm_avg", ".txt", output_folder, run_folder)
+    write_table(avg_df, output_fpkm_avg, settings=settings)
 
     log2_results = []
 
@@ -132,13 +139,19 @@ def extract_fpkm(gtf_folder, output_folder, gene_mapping):
     log2_df["GATA Order"] = log2_df["GATA Name"].apply(lambda x: gata_order.index(x.split("_")[0]) if x.split("_")[0] in gata_order else -1)
     log2_df = log2_df.sort_values(by=["GATA Order", "Base Name"]).drop(columns=["GATA Order"])
 
-    output_log2 = get_unique_filename("GTF_results_log2", ".txt", output_folder)
-    log2_df.to_csv(output_log2, sep="\t", index=False)
+    output_log2 = get_output_path("GTF_results_log2", ".txt", output_folder, run_folder)
+    write_table(log2_df, output_log2, settings=settings)
 
     log(f"GTF_results_fpkm_all сохранён: {output_fpkm_all}")
     log(f"GTF_results_fpkm_avg сохранён: {output_fpkm_avg}")
     log(f"GTF_results_log2 сохранён: {output_log2}")
 
+    return {"fpkm_all": fpkm_all_df, "fpkm_avg": avg_df, "log2": log2_df}
+
+def run_step(ctx):
+    gtf_folder, output_folder, gene_mapping, settings = load_settings(ctx.settings)
+    ctx.data.update(extract_fpkm(gtf_folder, output_folder, gene_mapping, ctx.run_folder, settings))
+
 if __name__ == "__main__":
-    gtf_folder, output_folder, gene_mapping = load_settings()
-    extract_fpkm(gtf_folder, output_folder, gene_mapping)
\ No newline at end of file
+    gtf_folder, output_folder, gene_mapping, settings = load_settings()
+    extract_fpkm(gtf_folder, output_folder, gene_mapping, os.environ.get(RUN_FOLDER_ENV), settings)
\ No newline at end of file
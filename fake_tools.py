@@ -0,0 +1,225 @@
+import os
+import sys
+import stat
+import time
+import zlib
+import multiprocessing
+
+import numpy as np
+
+# Заменители внешних программ для замеров оркестрации (pipeline_benchmark.py):
+# hisat2, hisat2-build, samtools view/sort, stringtie и featureCounts с теми же
+# аргументами командной строки. Каждый читает свои входные файлы, тратит процессорное
+# время (или спит) пропорционально их размеру и пишет выход правдоподобного размера
+# и формата. Оболочка wsl просто выполняет свою команду.
+MODE_ENV = "PIPESEQ_FAKE_MODE"        # cpu (по умолчанию) или sleep
+SCALE_ENV = "PIPESEQ_FAKE_SCALE"      # секунд процессорного времени на МБ входа, множитель к COST
+THREADS_ENV = "PIPESEQ_FAKE_THREADS"  # переопределяет -p/-@/-T из команды
+MB = 1024 * 1024
+CHUNK = 4 * MB
+DEFAULT_SCALE = 0.05
+# относительная стоимость МБ входа и отношение размера выхода к входу
+COST = {"hisat2": 1.0, "samtools view": 0.2, "samtools sort": 0.4, "stringtie": 0.3, "featureCounts": 0.15}
+OUTPUT_RATIO = {"hisat2": 1.2, "samtools view": 0.3, "samtools sort": 1.0}
+TOOLS = ("hisat2", "hisat2-build", "samtools", "stringtie", "featureCounts")
+
+
+def _burn(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        sum(range(1000))
+
+
+def work(tool, input_bytes, threads):
+    """Нагрузка, пропорциональная входу: threads процессов делят между собой cpu-секунды."""
+    seconds = input_bytes / MB * COST.get(tool, 0.1) * float(os.environ.get(SCALE_ENV, DEFAULT_SCALE))
+    threads = max(1, int(os.environ.get(THREADS_ENV) or threads))
+    if os.environ.get(MODE_ENV, "cpu") == "sleep":
+        time.sleep(seconds / threads)
+        return
+    workers = [multiprocessing.Process(target=_burn, args=(seconds / threads,)) for _ in range(threads - 1)]
+    for w in workers:
+        w.start()
+    _burn(seconds / threads)
+    for w in workers:
+        w.join()
+
+
+def consume(paths):
+    """Читает файлы целиком (как программа читает вход); возвращает их суммарный размер."""
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(CHUNK)
+                if not block:
+                    break
+                total += len(block)
+    return total
+
+
+def write_filler(path, size, header=b""):
+    with open(path, "wb") as f:
+        f.write(header)
+        line = b"fake\t0\tchr1\t1\t60\t75M\t*\t0\t0\t" + b"A" * 75 + b"\t" + b"F" * 75 + b"\n"
+        block = line * max(1, CHUNK // len(line))
+        left = max(0, size - len(header))
+        while left > 0:
+            f.write(block[:left])
+            left -= min(left, len(block))
+
+
+def _option(args, *names, default=None):
+    for name in names:
+        if name in args:
+            return args[args.index(name) + 1]
+    return default
+
+
+def _positional(args, with_value):
+    # аргументы, не являющиеся флагами и их значениями
+    out, skip = [], False
+    for a in args:
+        if skip:
+            skip = False
+        elif a in with_value:
+            skip = True
+        elif not a.startswith("-"):
+            out.append(a)
+    return out
+
+
+def read_reference(path):
+    """gene_id, хромосома, начало, конец и цепь генов эталонного GTF (по строкам gene/transcript)."""
+    genes = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("#") or len(fields) < 9 or fields[2] not in ("gene", "transcript"):
+                continue
+            gene_id = fields[8].split('gene_id "', 1)[1].split('"', 1)[0]
+            genes.setdefault(gene_id, (fields[0], int(fields[3]), int(fields[4]), fields[6]))
+    return genes
+
+
+def expression(gene_ids, sample, input_bytes):
+    """Уровни экспрессии образца: общий базовый профиль, эффект эксперимента у части генов и шум."""
+    n = len(gene_ids)
+    base = np.random.default_rng(0).lognormal(2.0, 1.5, n)
+    name = os.path.basename(sample).split("_")[0]
+    experiment = name.split("Control")[0].rstrip("0123456789")
+    effect = np.random.default_rng(zlib.crc32(experiment.encode())).normal(0.0, 1.5, n)
+    effect[np.random.default_rng(zlib.crc32(experiment.encode()) + 1).random(n) >= 0.1] = 0.0
+    rng = np.random.default_rng(zlib.crc32(name.encode()))
+    treated = "Control" not in name
+    return base * np.exp2(effect * treated) * rng.lognormal(0.0, 0.2, n) * max(input_bytes / MB, 0.1)
+
+
+def hisat2(args):
+    reads = [p for p in (_option(args, "-1"), _option(args, "-2"), _option(args, "-U")) if p]
+    out = _option(args, "-S")
+    size = consume(reads)
+    work("hisat2", size, _option(args, "-p", default=1))
+    write_filler(out, int(size * OUTPUT_RATIO["hisat2"]), b"@HD\tVN:1.0\tSO:unsorted\n@SQ\tSN:chr1\tLN:1000000\n"
+                 b"@PG\tID:hisat2\tPN:hisat2\tVN:2.2.1\n")
+    n_reads = size // 350 if "-1" in args else size // 175
+    sys.stderr.write(f"{n_reads} reads; of these:\n  {n_reads} (100.00%) were paired; of these:\n"
+                     f"95.00% overall alignment rate\n")
+
+
+def hisat2_build(args):
+    fasta, base = _positional(args, ())[:2]
+    size = consume([fasta])
+    work("hisat2", size, 1)
+    for i in range(1, 9):
+        write_filler(f"{base}.{i}.ht2", max(size // 8, 1024))
+
+
+def samtools(args):
+    command, rest = args[0], args[1:]
+    tool = f"samtools {command}"
+    out = _option(rest, "-o")
+    inputs = [p for p in _positional(rest, ("-o", "-@", "-m", "-T")) if p != out]
+    size = consume(inputs)
+    work(tool, size, _option(rest, "-@", default=1))
+    write_filler(out, int(size * OUTPUT_RATIO.get(tool, 1.0)), b"BAM\x01")
+
+
+def stringtie(args):
+    bam = _positional(args, ("-G", "-o", "-A", "-c", "-p", "-l", "-m", "-f"))[0]
+    reference = _option(args, "-G")
+    size = consume([bam, reference])
+    work("stringtie", size, _option(args, "-p", default=1))
+
+    genes = read_reference(reference)
+    ids = list(genes)
+    fpkm = expression(ids, bam, size)
+    tpm = fpkm / fpkm.sum() * 1e6
+    cov = fpkm * 0.4
+    lines = ["# stringtie " + " ".join(args) + "\n", "# StringTie version 2.2.1\n"]
+    for i, gene in enumerate(ids):
+        chrom, start, end, strand = genes[gene]
+        tx = f'gene_id "{gene}"; transcript_id "{gene}.t1"; ref_gene_id "{gene}";'
+        lines.append(f'{chrom}\tStringTie\ttranscript\t{start}\t{end}\t1000\t{strand}\t.\t{tx} '
+                     f'cov "{cov[i]:.6f}"; FPKM "{fpkm[i]:.6f}"; TPM "{tpm[i]:.6f}";\n')
+        lines.append(f'{chrom}\tStringTie\texon\t{start}\t{end}\t1000\t{strand}\t.\t{tx} '
+                     f'exon_number "1"; cov "{cov[i]:.6f}";\n')
+    with open(_option(args, "-o"), "w") as f:
+        f.write("".join(lines))
+    coverage = _option(args, "-A")
+    if coverage:
+        with open(coverage, "w") as f:
+            f.write("Gene ID\tGene Name\tReference\tStrand\tStart\tEnd\tCoverage\tFPKM\tTPM\n")
+            f.write("".join(f"{g}\t-\t{genes[g][0]}\t{genes[g][3]}\t{genes[g][1]}\t{genes[g][2]}\t"
+                            f"{cov[i]:.6f}\t{fpkm[i]:.6f}\t{tpm[i]:.6f}\n" for i, g in enumerate(ids)))
+
+
+def feature_counts(args):
+    annotation, out = _option(args, "-a"), _option(args, "-o")
+    bams = _positional(args, ("-a", "-o", "-T", "-g", "-t", "-s"))
+    size = consume([annotation] + bams)
+    work("featureCounts", size, _option(args, "-T", default=1))
+
+    genes = read_reference(annotation)
+    ids = list(genes)
+    rng = np.random.default_rng(zlib.crc32(out.encode()))
+    counts = [rng.poisson(expression(ids, bam, os.path.getsize(bam)) * 20) for bam in bams]
+    with open(out, "w") as f:
+        f.write(f'# Program:featureCounts v2.0.6; Command:"featureCounts" ' + " ".join(f'"{a}"' for a in args) + "\n")
+        f.write("\t".join(["Geneid", "Chr", "Start", "End", "Strand", "Length"] + bams) + "\n")
+        for i, g in enumerate(ids):
+            chrom, start, end, strand = genes[g]
+            f.write("\t".join([g, chrom, str(start), str(end), strand, str(end - start + 1)]
+                              + [str(c[i]) for c in counts]) + "\n")
+    with open(out + ".summary", "w") as f:
+        f.write("\t".join(["Status"] + bams) + "\n")
+        f.write("\t".join(["Assigned"] + [str(int(c.sum())) for c in counts]) + "\n")
+
+
+def install(bin_folder):
+    """Создаёт в bin_folder исполняемые обёртки программ и wsl; возвращает bin_folder для начала PATH."""
+    os.makedirs(bin_folder, exist_ok=True)
+    scripts = {tool: f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" {tool} "$@"\n' for tool in TOOLS}
+    # wsl bash -c "..." -> bash -c "..." на этой же машине
+    scripts["wsl"] = '#!/bin/sh\nexec "$@"\n'
+    for name, text in scripts.items():
+        path = os.path.join(bin_folder, name)
+        with open(path, "w") as f:
+            f.write(text)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_folder
+
+
+HANDLERS = {
+    "hisat2": hisat2,
+    "hisat2-build": hisat2_build,
+    "samtools": samtools,
+    "stringtie": stringtie,
+    "featureCounts": feature_counts,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in HANDLERS:
+        print(f"Использование: python fake_tools.py {{{'|'.join(HANDLERS)}}} [аргументы]", file=sys.stderr)
+        sys.exit(2)
+    HANDLERS[sys.argv[1]](sys.argv[2:])
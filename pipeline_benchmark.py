@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline_log
+from pipeline_log import StepLog, read_run_records, write_run_report, write_run_trace
+from resource_usage import record_name
+from benchmark import format_table, environment
+from benchmark_data import SyntheticDataset
+from fake_tools import install, MODE_ENV, SCALE_ENV, THREADS_ENV, DEFAULT_SCALE
+
+# Замер оркестрации пайплайна без настоящих HISAT2/samtools/StringTie/featureCounts:
+# программы подменяются заменителями из fake_tools.py (и оболочкой wsl) в начале PATH,
+# а сами скрипты шагов запускаются как есть. Выравнивание и SAM → BAM идут по образцам,
+# как в PipeSeq, с заданным числом одновременных образцов; затем stringtie_expression
+# и deseq2_analysis по всей когорте. Для каждой комбинации — makespan, загрузка CPU,
+# занятость слотов и накладные расходы скриптов сверх времени программ.
+#   python pipeline_benchmark.py --samples 6,12 --concurrency 1,2,4
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PER_SAMPLE_SCRIPTS = ("align_hisat2.py", "process_sam_to_bam.py")
+COHORT_SCRIPTS = ("stringtie_expression.py", "deseq2_analysis.py")
+COLUMNS = ["samples", "concurrency", "tool_threads", "makespan_s", "per_sample_s", "cohort_s",
+           "cpu_s", "cpu_util", "slot_busy", "tool_s", "overhead_s", "status"]
+log = StepLog("pipeline_benchmark", echo=False)
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def prepare(folder, n_samples, n_genes, reads):
+    """Входные данные и settings.json одного прогона; возвращает имена образцов."""
+    data = SyntheticDataset(n_genes, n_samples)
+    folders = {name: os.path.join(folder, name) for name in ("Fastq", "Output", "GTF", "Results", "Genome")}
+    folders["Index"] = os.path.join(folders["Genome"], "Index")
+    for path in folders.values():
+        os.makedirs(path, exist_ok=True)
+    data.write_reference(folders["Genome"])
+    data.write_fastq(folders["Fastq"], reads)
+    # готовый индекс: align_hisat2 не запускает hisat2-build
+    for i in range(1, 9):
+        open(os.path.join(folders["Index"], f"genome_index.{i}.ht2"), "w").close()
+
+    settings = {
+        "folders": {
+            "fastq_folder": folders["Fastq"], "bam_folder": folders["Output"], "gtf_folder": folders["GTF"],
+            "results_folder": folders["Results"], "genome_index": folders["Index"], "genome_folder": folders["Genome"],
+        },
+        "options": {"delete_intermediate_files": False, "strict_annotation": True, "stringtie_sensitivity": 0.001},
+        "gene_mapping": data.gene_mapping,
+    }
+    with open(os.path.join(folder, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=4)
+    return [data.sample_name(s) for s in range(len(data.samples))]
+
+
+def run_script(script, folder, env, sample=None, slot=None):
+    # вывод скрипта (и stderr программ) — в отдельный файл, чтобы не смешивать параллельные образцы
+    out_path = os.path.join(folder, "output", f"{os.path.splitext(script)[0]}_{sample or 'all'}.txt")
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    fields = {"script": script}
+    if slot is not None:
+        fields["slot"] = slot
+    with open(out_path, "wb") as out:
+        log.run([sys.executable, os.path.join(SCRIPT_DIR, script)] + ([sample] if sample else []),
+                sample=sample, fields=fields, cwd=folder, env=env, stdout=out, stderr=subprocess.STDOUT)
+
+
+def run_config(work, n_samples, concurrency, args):
+    folder = os.path.join(work, f"samples{n_samples}_c{concurrency}")
+    os.makedirs(folder, exist_ok=True)
+    samples = prepare(folder, n_samples, args.genes, args.reads)
+    run_folder = os.path.join(folder, "run")
+    pipeline_log.configure(run_folder)
+
+    env = dict(os.environ)
+    env["PATH"] = install(os.path.join(work, "bin")) + os.pathsep + env.get("PATH", "")
+    env[pipeline_log.RUN_FOLDER_ENV] = run_folder
+    env[MODE_ENV] = args.mode
+    env[SCALE_ENV] = str(args.scale)
+    if args.tool_threads:
+        env[THREADS_ENV] = str(args.tool_threads)
+
+    # номер слота — поток пула, в котором выполняется образец (строка на временной шкале)
+    slots, local = itertools.count(), threading.local()
+
+    def sample_task(sample):
+        if not hasattr(local, "slot"):
+            local.slot = next(slots)
+        with log.timed("sample", sample=sample, slot=local.slot):
+            for script in PER_SAMPLE_SCRIPTS:
+                run_script(script, folder, env, sample, local.slot)
+
+    started, start, times = time.time(), time.perf_counter(), os.times()
+    row = {"samples": len(samples), "concurrency": concurrency, "tool_threads": args.tool_threads or "-",
+           "status": "ok"}
+    try:
+        with log.timed("stage", name="per-sample"):
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(sample_task, samples))
+        row["per_sample_s"] = round(time.perf_counter() - start, 3)
+        with log.timed("stage", name="cohort"):
+            for script in COHORT_SCRIPTS:
+                run_script(script, folder, env)
+    except subprocess.CalledProcessError as e:
+        row["status"] = f"error: {e} (см. {os.path.join(folder, 'output')})"
+    makespan = time.perf_counter() - start
+    after = os.times()
+    cpu = after.children_user - times.children_user + after.children_system - times.children_system
+
+    records = read_run_records(started) or []
+    write_run_report(started)
+    write_run_trace(started)
+    sample_s = sum(r["duration_s"] for r in records if r.get("event") == "sample")
+    tool_s = sum(r["duration_s"] for r in records if r.get("event") == "tool" and r.get("step") != log.step)
+    # накладные расходы по образцам: время скриптов выравнивания и SAM → BAM сверх их программ
+    per_sample_steps = {os.path.splitext(s)[0] for s in PER_SAMPLE_SCRIPTS}
+    script_s = sum(r["duration_s"] for r in records
+                   if r.get("event") == "tool" and r.get("step") == log.step and r.get("script") in PER_SAMPLE_SCRIPTS)
+    per_sample_tool_s = sum(r["duration_s"] for r in records
+                            if r.get("event") == "tool" and r.get("step") in per_sample_steps)
+    row.update({
+        "makespan_s": round(makespan, 3),
+        "cohort_s": round(makespan - row.get("per_sample_s", makespan), 3),
+        "cpu_s": round(cpu, 3),
+        "cpu_util": round(cpu / (makespan * (os.cpu_count() or 1)), 3) if makespan else None,
+        "slot_busy": round(sample_s / (row["per_sample_s"] * concurrency), 3) if row.get("per_sample_s") else None,
+        "tool_s": round(tool_s, 3),
+        # запуск интерпретатора, импорты, журналы и обход папок
+        "overhead_s": round(script_s - per_sample_tool_s, 3),
+        "tools": tool_breakdown(records),
+        # журналы, resource_summary.txt и trace.json остаются только в папке --work
+        "logs": pipeline_log.logs_folder() if args.work else None,
+    })
+    return row
+
+
+def tool_breakdown(records):
+    totals = {}
+    for rec in records:
+        if rec.get("event") == "tool" and rec.get("step") != log.step:
+            name = record_name(rec)
+            totals[name] = round(totals.get(name, 0.0) + rec.get("duration_s", 0.0), 3)
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замер оркестрации пайплайна на заменителях внешних программ")
+    parser.add_argument("--samples", type=_int_list, default=[6, 12], help="числа образцов через запятую")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4],
+                        help="числа одновременно обрабатываемых образцов через запятую")
+    parser.add_argument("--tool-threads", type=int, default=None,
+                        help="потоков у программ вместо -p/-@/-T из команд (по умолчанию как в командах)")
+    parser.add_argument("--genes", type=int, default=2000, help="генов в эталонной аннотации")
+    parser.add_argument("--reads", type=int, default=50000, help="ридов на образец (в каждом из пары файлов)")
+    parser.add_argument("--mode", choices=("cpu", "sleep"), default="cpu",
+                        help="cpu — программы нагружают процессор, sleep — только ждут")
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE, help="cpu-секунд на МБ входа")
+    parser.add_argument("--work", help="рабочая папка (по умолчанию временная, удаляется)")
+    parser.add_argument("--report", default="pipeline_benchmark.json",
+                        help="JSON с результатами; рядом пишется таблица .txt")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work = args.work or tempfile.mkdtemp(prefix="pipeseq_pipeline_bench_")
+    rows = []
+    try:
+        for n_samples in args.samples:
+            for concurrency in args.concurrency:
+                print(f"{n_samples} образцов, {concurrency} одновременно...", flush=True)
+                row = run_config(work, n_samples, concurrency, args)
+                print(f"  makespan {row['makespan_s']} s, CPU {row['cpu_util']}, {row['status']}", flush=True)
+                rows.append(row)
+    finally:
+        pipeline_log.shutdown()
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "settings": vars(args), "results": rows}, f,
+                  ensure_ascii=False, indent=1)
+    table_path = os.path.splitext(args.report)[0] + ".txt"
+    with open(table_path, "w", encoding="utf-8") as f:
+        f.write(format_table(rows, COLUMNS))
+    print(format_table(rows, COLUMNS))
+    print(f"Результаты сохранены: {args.report}, {table_path}")
+    return 0 if all(row["status"] == "ok" for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
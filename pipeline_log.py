@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+import subprocess
+from contextlib import contextmanager
+from resource_usage import UsageMonitor, run_measured, write_report, record_name
+
+# Общий журнал шагов пайплайна. Сообщения складываются в очередь, фоновый поток
+# пишет их пачками: один open/write на файл за пачку, а не на каждое сообщение.
+# Кроме текстового лога шага каждая запись попадает в JSON lines журнал запуска
+# (logs/run.jsonl) и, если указан образец, в журнал образца (logs/samples/<образец>.jsonl).
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+LOGS_SUBFOLDER = "logs"
+SAMPLES_SUBFOLDER = "samples"
+RUN_LOG = "run.jsonl"
+TRACE_FILE = "trace.json"
+REPORT_EVENTS = ("step", "stage", "tool")
+FLUSH_INTERVAL = 0.5
+MAX_BATCH = 5000
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+_run_folder = None
+_STOP = object()
+
+
+def configure(run_folder=None):
+    """Папка текущего запуска; без неё журналы пишутся в ./logs (или в папку из PIPESEQ_RUN_FOLDER)."""
+    global _run_folder
+    _run_folder = run_folder
+
+
+def logs_folder():
+    run_folder = _run_folder or os.environ.get(RUN_FOLDER_ENV)
+    return os.path.join(run_folder, LOGS_SUBFOLDER) if run_folder else LOGS_SUBFOLDER
+
+
+def run_id():
+    run_folder = _run_folder or os.environ.get(RUN_FOLDER_ENV)
+    return os.path.basename(os.path.normpath(run_folder)) if run_folder else None
+
+
+def sample_log_path(sample, folder=None):
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in str(sample))
+    return os.path.join(folder or logs_folder(), SAMPLES_SUBFOLDER, safe + ".jsonl")
+
+
+def _format(entry):
+    t = entry["t"]
+    ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)) + f".{int(t % 1 * 1000):03d}"
+    return json.dumps({"ts": ts, **entry}, ensure_ascii=False, default=str) + "\n"
+
+
+def _write_batch(batch):
+    # JSON собирается в фоновом потоке; строки пачки группируются по файлам
+    # и дописываются одним вызовом write
+    lines = {}
+    for folder, entry, text_file in batch:
+        line = _format(entry)
+        lines.setdefault(os.path.join(folder, RUN_LOG), []).append(line)
+        if "sample" in entry:
+            lines.setdefault(sample_log_path(entry["sample"], folder), []).append(line)
+        if text_file:
+            lines.setdefault(text_file, []).append(entry["message"] + "\n")
+    for path, chunk in lines.items():
+        try:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(chunk))
+        except OSError as e:
+            print(f"Не удалось записать журнал {path}: {e}", file=sys.stderr)
+
+
+def _writer_loop():
+    pending, last_write = [], time.monotonic()
+    while True:
+        try:
+            item = _queue.get(timeout=FLUSH_INTERVAL)
+        except queue.Empty:
+            item = None
+        stop = item is _STOP
+        done = []
+        if isinstance(item, threading.Event):
+            done.append(item)
+        elif item is not None and not stop:
+            pending.append(item)
+        # забираем всё, что успело накопиться, не дожидаясь следующего тика
+        while len(pending) < MAX_BATCH:
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                done.append(item)
+            else:
+                pending.append(item)
+        now = time.monotonic()
+        if pending and (stop or done or len(pending) >= MAX_BATCH or now - last_write >= FLUSH_INTERVAL):
+            _write_batch(pending)
+            pending, last_write = [], now
+        for event in done:
+            event.set()
+        if stop:
+            return
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="pipeline-log", daemon=True)
+            _writer.start()
+
+
+def flush(timeout=10):
+    """Ждёт, пока всё отправленное в очередь окажется в файлах."""
+    if _writer is None or not _writer.is_alive():
+        return
+    event = threading.Event()
+    _queue.put(event)
+    event.wait(timeout)
+
+
+def shutdown():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        _queue.put(_STOP)
+        _writer.join(10)
+    _writer = None
+
+
+atexit.register(shutdown)
+
+
+def _emit(item):
+    _ensure_writer()
+    _queue.put(item)
+
+
+def read_run_records(since=None, events=None):
+    """Записи журнала запуска начиная с времени since (только события events, если заданы)."""
+    flush()
+    records = []
+    try:
+        with open(os.path.join(logs_folder(), RUN_LOG), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if (events is None or rec.get("event") in events) and (since is None or rec.get("t", 0) >= since):
+                    records.append(rec)
+    except OSError:
+        return None
+    return records
+
+
+def write_run_report(since=None):
+    """
+    Отчёт о ресурсах по записям журнала запуска (шаги, этапы и внешние программы, начиная с
+    времени since): resource_report.json и resource_summary.txt рядом с run.jsonl.
+    """
+    records = read_run_records(since, REPORT_EVENTS)
+    return None if records is None else write_report(records, logs_folder())
+
+
+def trace_events(records):
+    """
+    Записи с длительностью -> события формата Trace Event (ph "X"), которые открываются
+    в chrome://tracing и Perfetto: строка — процесс и поток (или slot), отрезок — этап образца.
+    """
+    spans = [rec for rec in records if rec.get("duration_s") is not None and "t" in rec]
+    if not spans:
+        return []
+    origin = min(rec["t"] - rec["duration_s"] for rec in spans)
+    events, processes = [], {}
+    for rec in spans:
+        name = record_name(rec)
+        if rec.get("sample") is not None:
+            name = f"{name} [{rec['sample']}]"
+        pid = rec.get("pid", 0)
+        processes.setdefault(pid, rec.get("step"))
+        args = {k: v for k, v in rec.items() if k not in ("t", "ts", "pid", "tid", "slot", "event")}
+        events.append({
+            "name": name,
+            "cat": rec.get("event", ""),
+            "ph": "X",
+            "ts": round((rec["t"] - rec["duration_s"] - origin) * 1e6, 1),
+            "dur": round(rec["duration_s"] * 1e6, 1),
+            "pid": pid,
+            "tid": rec.get("slot", rec.get("tid", 0)),
+            "args": args,
+        })
+    events.sort(key=lambda e: (e["pid"], e["tid"], e["ts"]))
+    meta = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{step} ({pid})"}}
+            for pid, step in processes.items()]
+    return meta + events
+
+
+def write_run_trace(since=None):
+    """trace.json рядом с run.jsonl: шаги, этапы, программы и образцы запуска на временной шкале."""
+    records = read_run_records(since)
+    if records is None:
+        return None
+    path = os.path.join(logs_folder(), TRACE_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events(records), "displayTimeUnit": "ms"}, f,
+                  ensure_ascii=False, default=str)
+    return path
+
+
+class StepLog:
+    """
+    Журнал одного шага: log("сообщение") печатает строку, дописывает её в текстовый
+    лог шага (text_file) и кладёт структурированную запись в журналы запуска/образца.
+    """
+
+    def __init__(self, step, text_file=None, echo=True, echo_fn=print):
+        self.step = step
+        self.text_file = text_file
+        self.echo = echo
+        self.echo_fn = echo_fn
+
+    def __call__(self, message, sample=None, **fields):
+        self.record("message", message=message, sample=sample, **fields)
+
+    def record(self, event, message=None, sample=None, **fields):
+        if message is not None and self.echo:
+            self.echo_fn(message)
+        entry = {
+            "t": time.time(),
+            "run": run_id(),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "step": self.step,
+            "event": event,
+        }
+        if sample is not None:
+            entry["sample"] = sample
+        if message is not None:
+            entry["message"] = message
+        entry.update(fields)
+        _emit((logs_folder(), entry, self.text_file if message is not None else None))
+
+    @contextmanager
+    def timed(self, event, sample=None, usage=False, **fields):
+        """
+        Засекает блок и пишет запись event с duration_s и status (ok/error);
+        usage=True добавляет процессорное время, пиковую память и ввод/вывод процесса.
+        """
+        start = time.perf_counter()
+        status = "ok"
+        monitor = UsageMonitor() if usage else None
+        try:
+            if monitor is not None:
+                with monitor:
+                    yield
+            else:
+                yield
+        except BaseException as e:
+            status = "error"
+            fields["error"] = repr(e)
+            raise
+        finally:
+            if monitor is not None:
+                fields.update(monitor.usage)
+            self.record(event, sample=sample, status=status,
+                        duration_s=round(time.perf_counter() - start, 6), **fields)
+
+    def run(self, command, sample=None, fields=None, parse_time=False, **kwargs):
+        """
+        subprocess.run(check=True) с записью команды, кода возврата, длительности и
+        ресурсов программы; fields — дополнительные поля записи, parse_time — команда
+        собрана resource_usage.wsl_command, kwargs передаются в subprocess.Popen.
+        """
+        start = time.perf_counter()
+        returncode, usage = None, {}
+        try:
+            result, usage = run_measured(command, parse_time=parse_time, **kwargs)
+            returncode = result.returncode
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command)
+            return result
+        finally:
+            self.record("tool", sample=sample, command=command,
+                        returncode=returncode, status="ok" if returncode == 0 else "error",
+                        duration_s=round(time.perf_counter() - start, 6), **usage, **(fields or {}))
+
+    def clear(self):
+        """Удаляет текстовый лог шага (после записи всего, что уже стоит в очереди)."""
+        flush()
+        if self.text_file and os.path.exists(self.text_file):
+            os.remove(self.text_file)
@@ -2,14 +2,12 @@ import os
 import subprocess
 import json
 import sys
+from pipeline_log import StepLog
+from resource_usage import wsl_command
 
 SETTINGS_FILE = "settings.json"
 LOG_FILE = "process_sam_to_bam_log.txt"
-
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as log_file:
-        log_file.write(message + "\n")
+log = StepLog("process_sam_to_bam", LOG_FILE)
 
 def load_settings():
     if not os.path.exists(SETTINGS_FILE):
@@ -39,12 +37,12 @@ def convert_path_to_wsl(win_path):
         return wsl_path
     return path
 
-def run_command(command):
-    log(f"Запуск в WSL:\n{command}")
+def run_command(command, sample=None):
+    log(f"Запуск в WSL:\n{command}", sample=sample)
     try:
-        subprocess.run(f'wsl bash -c "{command}"', shell=True, check=True)
+        log.run(wsl_command(command), sample=sample, parse_time=True, shell=True)
     except subprocess.CalledProcessError as e:
-        log(f"Ошибка выполнения команды: {e}")
+        log(f"Ошибка выполнения команды: {e}", sample=sample)
         sys.exit(1)
 
 def process_files():
@@ -78,9 +76,9 @@ def process_files():
             sam_path_wsl = f"{bam_folder_wsl}/{sam_file}"
             bam_path_wsl = f"{bam_folder_wsl}/{sample_name}.bam"
 
-            log(f"\nКонвертация {sam_file} -> {sample_name}.bam")
+            log(f"\nКонвертация {sam_file} -> {sample_name}.bam", sample=sample_name)
             command = f"samtools view -@ 4 -S -b {sam_path_wsl} -o {bam_path_wsl}"
-            run_command(command)
+            run_command(command, sample=sample_name)
 
             if delete_intermediate:
                 try:
@@ -114,9 +112,9 @@ def process_files():
         bam_path_wsl = f"{bam_folder_wsl}/{bam_file}"
         sorted_bam_path_wsl = f"{bam_folder_wsl}/{sample_name}_sorted.bam"
 
-        log(f"\nСортировка {bam_file} -> {sample_name}_sorted.bam")
+        log(f"\nСортировка {bam_file} -> {sample_name}_sorted.bam", sample=sample_name)
         command = f"samtools sort -@ 4 -o {sorted_bam_path_wsl} {bam_path_wsl}"
-        run_command(command)
+        run_command(command, sample=sample_name)
 
         if delete_intermediate:
             try:
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import runpy
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# Профилирование шагов по запросу, без правки кода: переменная окружения PIPESEQ_PROFILE
+# или options.profile_steps в settings.json ("cprofile" — детерминированный профиль,
+# "sample" — выборка стеков для flame graph; true равно "cprofile"). Вместе с профилем
+# tracemalloc сохраняет пик выделенной памяти и строки, которые её выделили.
+PROFILE_ENV = "PIPESEQ_PROFILE"
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
+PROFILE_MODES = ("cprofile", "sample")
+PROFILES_SUBFOLDER = "profiles"
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 30
+# профиль, который уже идёт: вложенные profiled/profile_call (например, декорированная функция
+# внутри `python profiling.py script.py`) ничего не включают. Флаг общий для всех потоков:
+# с Python 3.12 профилировщик может быть активен только один на интерпретатор.
+_active_lock = threading.Lock()
+_active = None
+
+
+def _read_settings():
+    try:
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def profile_mode(settings=None):
+    """Режим профилирования (cprofile/sample) или None; переменная окружения важнее настроек."""
+    value = os.environ.get(PROFILE_ENV)
+    if value is None:
+        settings = _read_settings() if settings is None else settings
+        value = settings.get("options", {}).get("profile_steps", False)
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("", "0", "false", "off", "no"):
+            return None
+        return value if value in PROFILE_MODES else "cprofile"
+    return "cprofile" if value else None
+
+
+def profiles_folder(run_folder=None, settings=None):
+    """Папка профилей: папка запуска, иначе results_folder из settings.json, иначе текущая."""
+    base = run_folder or os.environ.get(RUN_FOLDER_ENV)
+    if not base:
+        settings = _read_settings() if settings is None else settings
+        base = settings.get("folders", {}).get("results_folder") or "."
+    return os.path.join(base, PROFILES_SUBFOLDER)
+
+
+class StackSampler:
+    """Выборочный профилировщик: раз в interval запоминает стек потока, где он запущен."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path):
+        # формат collapsed stacks: flamegraph.pl, speedscope, inferno
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _write_memory(path, name, elapsed, current, peak, snapshot):
+    lines = [
+        f"step: {name}",
+        f"wall_s: {elapsed:.3f}",
+        f"peak_traced_mb: {peak / 1024 / 1024:.2f}",
+        f"current_traced_mb: {current / 1024 / 1024:.2f}",
+        "",
+        f"top {TOP_ALLOCATIONS} allocations still held at the end (by line):",
+    ]
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024 / 1024:10.2f} MB  {stat.count:9d} blocks  {frame.filename}:{frame.lineno}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profiled(name, mode=None, folder=None):
+    """
+    Профилирует блок, если профилирование включено (mode или PIPESEQ_PROFILE/settings.json).
+    В folder пишутся <имя>.prof и <имя>_stats.txt (cprofile) или <имя>.folded (sample),
+    а также <имя>_memory.txt с пиком tracemalloc. Внутри уже идущего профиля ничего не включает.
+    """
+    global _active
+    mode = mode or profile_mode()
+    if not mode:
+        yield
+        return
+    with _active_lock:
+        nested = _active is not None
+        if not nested:
+            _active = name
+    if nested:
+        # замеры попадают во внешний профиль; второй cProfile отключил бы внешний
+        # (а на 3.12+ не запустился бы), а reset_peak стёр бы его пик памяти
+        yield
+        return
+    try:
+        with _profile(name, mode, folder):
+            yield
+    finally:
+        with _active_lock:
+            _active = None
+
+
+@contextmanager
+def _profile(name, mode, folder):
+    folder = folder or profiles_folder()
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+
+    own_tracing = not tracemalloc.is_tracing()
+    if own_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile() if mode == "cprofile" else StackSampler()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if own_tracing:
+            tracemalloc.stop()
+        if mode == "cprofile":
+            profiler.dump_stats(base + ".prof")
+            with open(base + "_stats.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        else:
+            profiler.write_folded(base + ".folded")
+        _write_memory(base + "_memory.txt", name, elapsed, current, peak, snapshot)
+        print(f"Профиль {name} сохранён: {base}*")
+
+
+def profile_call(name):
+    """Декоратор: функция профилируется, только когда профилирование включено."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profiled(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def script_command(script, args=(), settings=None):
+    """Команда запуска скрипта отдельным процессом — через этот модуль, если профилирование включено."""
+    if profile_mode(settings):
+        return [sys.executable, os.path.abspath(__file__), script, *args]
+    return [sys.executable, script, *args]
+
+
+def run_script(script, args=()):
+    name = os.path.splitext(os.path.basename(script))[0]
+    script_folder = os.path.dirname(os.path.abspath(script))
+    if script_folder not in sys.path:
+        sys.path.insert(0, script_folder)
+    sys.argv = [script, *args]
+    with profiled(name, mode=profile_mode() or "cprofile"):
+        runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python profiling.py script.py [аргументы скрипта]", file=sys.stderr)
+        sys.exit(2)
+    run_script(sys.argv[1], sys.argv[2:])
@@ -3,74 +3,74 @@ import json
 import pandas as pd
 import numpy as np
 import re
+from pipeline_log import StepLog
+from results_io import read_table, write_table, latest_table, table_exists
 
 SETTINGS_FILE = "settings.json"
-
-def log(message):
-    print(message)
-
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        exit(1)
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+log = StepLog("pvalues_log2")
+
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            exit(1)
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
     results_folder = settings.get("folders", {}).get("results_folder")
     if not results_folder:
         log("В settings.json не задан путь к results_folder.")
         exit(1)
-    return results_folder
+    return results_folder, settings
 
 def get_unique_filename(base_name, extension, folder):
     counter = 1
     file_name = f"{base_name}{extension}"
-    while os.path.exists(os.path.join(folder, file_name)):
+    while table_exists(os.path.join(folder, file_name)):
         file_name = f"{base_name}_{counter}{extension}"
         counter += 1
     return os.path.join(folder, file_name)
 
+def load_latest_table(base_name, folder, kind):
+    # самая свежая версия base_name / base_name_N (TSV или parquet, см. get_unique_filename)
+    path = latest_table(base_name, folder)
+    log(f"Найден файл {kind}: {path}")
+    if path is None:
+        return None
+    try:
+        df = read_table(path)
+        log(f"Загружен {kind} файл: {path}, строк: {len(df)}")
+        return df
+    except Exception as e:
+        log(f"Ошибка при загрузке {path}: {e}")
+        return None
+
 def extract_order(name):
     base = name.split("_")[0]
     match = re.search(r"(\d+(?:\.\d+)?)", base)
     return float(match.group(1)) if match else float('inf')
 
-def main():
-    input_folder = load_settings()
-
-    pvalue_files = sorted([f for f in os.listdir(input_folder) if f.startswith("GTF_results_pvalues") and f.endswith(".txt")])
-    log2_files = sorted([f for f in os.listdir(input_folder) if f.startswith("GTF_results_log2") and f.endswith(".txt")])
-
-    log(f"Найдено файлов p-values: {len(pvalue_files)} -> {pvalue_files}")
-    log(f"Найдено файлов log2: {len(log2_files)} -> {log2_files}")
-
-    if not pvalue_files or not log2_files:
+def main(settings=None, pvalues_df=None, log2_df=None, run_folder=None):
+    results_folder, settings = load_settings(settings)
+    input_folder = run_folder or results_folder
+
+    # берётся только результат текущего запуска (или самая свежая версия файла),
+    # а не все когда-либо сохранённые GTF_results_pvalues* / GTF_results_log2*
+    if pvalues_df is None:
+        pvalues_df = load_latest_table("GTF_results_pvalues", input_folder, "p-value")
+    else:
+        log(f"Используем p-values предыдущего шага, строк: {len(pvalues_df)}")
+    if log2_df is None:
+        log2_df = load_latest_table("GTF_results_log2", input_folder, "log2")
+    else:
+        log(f"Используем log2 предыдущего шага, строк: {len(log2_df)}")
+
+    if pvalues_df is None or log2_df is None:
         log("Нет нужных файлов для объединения.")
         exit(1)
 
-    pvalue_dfs = []
-    for f in pvalue_files:
-        try:
-            df = pd.read_csv(os.path.join(input_folder, f), sep="\t")
-            log(f"Загружен p-value файл: {f}, строк: {len(df)}")
-            pvalue_dfs.append(df)
-        except Exception as e:
-            log(f"Ошибка при загрузке {f}: {e}")
-
-    log2_dfs = []
-    for f in log2_files:
-        try:
-            df = pd.read_csv(os.path.join(input_folder, f), sep="\t")
-            log(f"Загружен log2 файл: {f}, строк: {len(df)}")
-            log2_dfs.append(df)
-        except Exception as e:
-            log(f"Ошибка при загрузке {f}: {e}")
-
-    if not pvalue_dfs or not log2_dfs:
-        log("Не удалось загрузить данные.")
-        exit(1)
-
-    pvalues_df = pd.concat(pvalue_dfs, ignore_index=True)
-    log2_df = pd.concat(log2_dfs, ignore_index=True)
+    pvalues_df = pvalues_df.copy()
+    log2_df = log2_df.copy()
 
     pvalues_df["Base Name"] = pvalues_df["Base Name"].str.strip()
     log2_df["Base Name"] = log2_df["Base Name"].str.strip()
@@ -85,10 +85,17 @@ def main():
     merged_df = merged_df.sort_values(by=["Base Name", "GATA Order"]).drop(columns=["GATA Order"])
     merged_df = merged_df.drop_duplicates()
 
-    output_file = get_unique_filename("Stringtie", ".txt", input_folder)
-    merged_df.to_csv(output_file, sep="\t", index=False)
+    if run_folder:
+        output_file = os.path.join(run_folder, "Stringtie.txt")
+    else:
+        output_file = get_unique_filename("Stringtie", ".txt", input_folder)
+    write_table(merged_df, output_file, settings=settings)
 
     log(f"Объединённый файл сохранён: {output_file}")
+    return merged_df
+
+def run_step(ctx):
+    ctx.data["stringtie"] = main(ctx.settings, ctx.data.get("pvalues"), ctx.data.get("log2"), ctx.run_folder)
 
 if __name__ == "__main__":
-    main()
+    main(run_folder=os.environ.get(RUN_FOLDER_ENV))
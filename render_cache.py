@@ -0,0 +1,118 @@
+import os
+import json
+import shutil
+import hashlib
+import inspect
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Кэш отрисованных картинок: имя файла — хэш содержимого входных таблиц,
+# действующих настроек и исходного кода модуля, который рисует картинку
+CACHE_SUBFOLDER = ".render_cache"
+MAX_CACHE_FILES = 500
+
+
+def cache_folder(base_folder):
+    return os.path.join(base_folder, CACHE_SUBFOLDER)
+
+
+@lru_cache(maxsize=None)
+def _source_digest(path):
+    # правка кода отрисовки тоже должна сбрасывать кэш
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def _update_hash(h, obj):
+    if isinstance(obj, pd.DataFrame):
+        h.update(b"DataFrame")
+        h.update(json.dumps([list(map(str, obj.columns)), list(map(str, obj.index.names)),
+                             list(map(str, obj.dtypes))]).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b"Series")
+        h.update(str(obj.name).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, (list, tuple)):
+        # элементы хэшируются по отдельности: в списке могут быть массивы и таблицы
+        h.update(f"{type(obj).__name__}{len(obj)}".encode("utf-8"))
+        for item in obj:
+            _update_hash(h, item)
+    elif isinstance(obj, np.ndarray):
+        h.update(b"ndarray")
+        h.update(f"{obj.dtype}{obj.shape}".encode("utf-8"))
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(json.dumps(obj, sort_keys=True, default=str).encode("utf-8"))
+
+
+def render_key(render_fn, *inputs):
+    """
+    Ключ кэша для картинки, которую строит render_fn по данным inputs
+    (DataFrame, массивы, словари настроек, скаляры).
+    """
+    h = hashlib.sha256()
+    h.update(f"{render_fn.__module__}.{render_fn.__qualname__}".encode("utf-8"))
+    h.update(_source_digest(inspect.getsourcefile(render_fn) or "").encode("utf-8"))
+    for obj in inputs:
+        _update_hash(h, obj)
+    return h.hexdigest()
+
+
+def _cached_path(cache_dir, key, output_path):
+    return os.path.join(cache_dir, key + os.path.splitext(output_path)[1])
+
+
+def restore_cached(cache_dir, key, output_path):
+    cached = _cached_path(cache_dir, key, output_path)
+    if not os.path.exists(cached):
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    shutil.copyfile(cached, output_path)
+    os.utime(cached)
+    return True
+
+
+def store_cached(cache_dir, key, output_path):
+    if not os.path.exists(output_path):
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = _cached_path(cache_dir, key, output_path)
+    # запись через временный файл: кэш могут пополнять несколько процессов сразу
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    shutil.copyfile(output_path, tmp)
+    os.replace(tmp, cached)
+    prune_cache(cache_dir)
+
+
+def prune_cache(cache_dir, max_files=MAX_CACHE_FILES):
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.is_file() and not e.name.endswith(".tmp")]
+    except OSError:
+        return
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for e in entries[:len(entries) - max_files]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+def cached_render(cache_dir, key, output_path, render):
+    """
+    При попадании в кэш копирует готовую картинку в output_path и возвращает None,
+    иначе вызывает render(), сохраняет результат в кэш и возвращает то, что вернул render().
+    """
+    if cache_dir and restore_cached(cache_dir, key, output_path):
+        return None
+    result = render()
+    if cache_dir:
+        store_cached(cache_dir, key, output_path)
+    return result
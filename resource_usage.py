@@ -0,0 +1,304 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+# psutil необязателен: с ним память и ввод/вывод считаются по всему дереву процессов и на Windows
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Учёт ресурсов шагов и внешних программ: процессорное время (user/sys), пиковая
+# резидентная память и объём чтения/записи. Для команд, запущенных в WSL, цифры
+# берутся из GNU time внутри WSL — со стороны Windows виден только wsl.exe.
+MB = 1024 * 1024
+SAMPLE_INTERVAL = 0.2
+USAGE_FIELDS = ("cpu_user_s", "cpu_sys_s", "peak_rss_mb", "read_mb", "write_mb")
+REPORT_FILE = "resource_report.json"
+SUMMARY_FILE = "resource_summary.txt"
+# формат GNU time по умолчанию (без -f: в строке команды для cmd.exe не должно быть %)
+GNU_TIME_CPU_RE = re.compile(r'([\d.]+)user ([\d.]+)system \S+elapsed .*?(\d+)maxresident\)k')
+GNU_TIME_IO_RE = re.compile(r'(\d+)inputs\+(\d+)outputs \(\d+major\+\d+minor\)pagefaults')
+BLOCK_SIZE = 512
+# программы, у которых в имя этапа входит подкоманда (samtools view / samtools sort)
+SUBCOMMAND_TOOLS = {"samtools", "bcftools", "bedtools"}
+
+
+def _mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / MB, 3)
+
+
+def _maxrss_bytes(ru):
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    return ru.ru_maxrss if sys.platform == "darwin" else ru.ru_maxrss * 1024
+
+
+def _current_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _io_bytes():
+    if psutil is not None:
+        try:
+            io = psutil.Process().io_counters()
+            return io.read_bytes, io.write_bytes
+        except (AttributeError, psutil.Error):
+            return None
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class UsageMonitor:
+    """Ресурсы текущего процесса за время блока with (для шагов, выполняемых в этом процессе)."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.usage = {}
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = _current_rss()
+            if rss is not None:
+                self._peak = max(self._peak, rss)
+
+    def __enter__(self):
+        self._times = os.times()
+        self._io = _io_bytes()
+        self._peak = _current_rss() or 0
+        self._thread = threading.Thread(target=self._sample, name="usage-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        times, io = os.times(), _io_bytes()
+        peak = max(self._peak, _current_rss() or 0)
+        if not peak and resource is not None:
+            peak = _maxrss_bytes(resource.getrusage(resource.RUSAGE_SELF))
+        self.usage = {
+            "cpu_user_s": round(times.user - self._times.user, 3),
+            "cpu_sys_s": round(times.system - self._times.system, 3),
+            "peak_rss_mb": _mb(peak or None),
+            "read_mb": _mb(io[0] - self._io[0]) if io and self._io else None,
+            "write_mb": _mb(io[1] - self._io[1]) if io and self._io else None,
+        }
+        return False
+
+
+def wsl_command(command):
+    """Строка для shell=True: команда в WSL, обёрнутая в GNU time, если он там установлен."""
+    timed = f"if [ -x /usr/bin/time ]; then /usr/bin/time {command}; else {command}; fi"
+    return f'wsl bash -c "{timed}"'
+
+
+def _forward_stderr(stream, found):
+    # stderr программы пробрасывается как есть, кроме двух строк отчёта GNU time
+    out = sys.stderr
+    for raw in iter(stream.readline, b""):
+        line = raw.decode("utf-8", errors="replace")
+        cpu, io = GNU_TIME_CPU_RE.search(line), GNU_TIME_IO_RE.search(line)
+        if cpu:
+            found["cpu_user_s"], found["cpu_sys_s"] = float(cpu.group(1)), float(cpu.group(2))
+            found["peak_rss_mb"] = _mb(int(cpu.group(3)) * 1024)
+        elif io:
+            found["read_mb"] = _mb(int(io.group(1)) * BLOCK_SIZE)
+            found["write_mb"] = _mb(int(io.group(2)) * BLOCK_SIZE)
+        elif out is not None:
+            out.write(line)
+            out.flush()
+    stream.close()
+
+
+def _tree(proc):
+    try:
+        return [proc] + proc.children(recursive=True)
+    except psutil.Error:
+        return [proc]
+
+
+def _watch_tree(pid, interval):
+    # последние известные счётчики каждого процесса дерева, пик суммарной памяти
+    # и код возврата (psutil сам дожидается потомка, повторный Popen.wait его не узнает)
+    seen, peak = {}, 0
+    try:
+        root = psutil.Process(pid)
+    except psutil.Error:
+        return seen, peak, None
+    while True:
+        rss = 0
+        for p in _tree(root):
+            try:
+                with p.oneshot():
+                    cpu = p.cpu_times()
+                    try:
+                        io = p.io_counters()
+                        io = (io.read_bytes, io.write_bytes)
+                    except (AttributeError, psutil.Error):
+                        io = None
+                    rss += p.memory_info().rss
+                seen[p.pid] = (cpu.user, cpu.system, io)
+            except psutil.Error:
+                continue
+        peak = max(peak, rss)
+        try:
+            return seen, peak, root.wait(interval)
+        except psutil.TimeoutExpired:
+            continue
+        except psutil.Error:
+            return seen, peak, None
+
+
+def run_measured(command, parse_time=False, interval=SAMPLE_INTERVAL, **kwargs):
+    """
+    subprocess без check: возвращает (CompletedProcess, usage). parse_time — команда
+    собрана wsl_command, и её stderr нужно разобрать на отчёт GNU time.
+    """
+    found = {}
+    if parse_time:
+        kwargs["stderr"] = subprocess.PIPE
+    proc = subprocess.Popen(command, **kwargs)
+    reader = None
+    if parse_time:
+        reader = threading.Thread(target=_forward_stderr, args=(proc.stderr, found), daemon=True)
+        reader.start()
+
+    usage = dict.fromkeys(USAGE_FIELDS)
+    if psutil is not None:
+        seen, peak, returncode = _watch_tree(proc.pid, interval)
+        if returncode is None:
+            proc.wait()
+        else:
+            proc.returncode = returncode
+        if seen:
+            usage["cpu_user_s"] = round(sum(s[0] for s in seen.values()), 3)
+            usage["cpu_sys_s"] = round(sum(s[1] for s in seen.values()), 3)
+            ios = [s[2] for s in seen.values() if s[2] is not None]
+            if ios:
+                usage["read_mb"] = _mb(sum(r for r, _ in ios))
+                usage["write_mb"] = _mb(sum(w for _, w in ios))
+        usage["peak_rss_mb"] = _mb(peak or None)
+    elif hasattr(os, "wait4"):
+        # rusage именно этого потомка (вместе с дождавшимися им процессами)
+        _, status, ru = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        usage.update({
+            "cpu_user_s": round(ru.ru_utime, 3),
+            "cpu_sys_s": round(ru.ru_stime, 3),
+            "peak_rss_mb": _mb(_maxrss_bytes(ru)),
+            "read_mb": _mb(ru.ru_inblock * BLOCK_SIZE),
+            "write_mb": _mb(ru.ru_oublock * BLOCK_SIZE),
+        })
+    else:
+        proc.wait()
+
+    if reader is not None:
+        reader.join()
+    usage.update(found)
+    return subprocess.CompletedProcess(command, proc.returncode), usage
+
+
+def record_name(record):
+    """Имя строки отчёта: этап, скрипт шага или программа, вызванная командой (samtools — с подкомандой)."""
+    if record.get("name"):
+        return record["name"]
+    if record.get("script"):
+        return record["script"]
+    command = record.get("command")
+    if not command:
+        return record.get("event", "")
+    text = command if isinstance(command, str) else " ".join(map(str, command))
+    m = (re.search(r'then /usr/bin/time (.+?); else', text)
+         or re.search(r'^wsl bash -c "(.*)"$', text.strip()))
+    tokens = m.group(1).split() if m else text.split()
+    if not isinstance(command, str) and len(command) > 1 and "python" in os.path.basename(str(command[0])).lower():
+        tokens = [str(command[1])]
+    if not tokens:
+        return ""
+    name = re.split(r'[\\/]', tokens[0].strip('"'))[-1]
+    name = name[:-4] if name.lower().endswith(".exe") else name
+    if name in SUBCOMMAND_TOOLS and len(tokens) > 1:
+        name = f"{name} {tokens[1]}"
+    return name
+
+
+def summarize(records):
+    """Строки отчёта, сгруппированные по (событие, шаг, имя) и упорядоченные по суммарному времени."""
+    rows = {}
+    for rec in records:
+        key = (rec.get("event"), rec.get("step"), record_name(rec))
+        row = rows.setdefault(key, {
+            "event": key[0], "step": key[1], "name": key[2], "count": 0, "errors": 0,
+            "wall_s": 0.0, "cpu_user_s": 0.0, "cpu_sys_s": 0.0,
+            "peak_rss_mb": None, "read_mb": None, "write_mb": None, "samples": set(),
+        })
+        row["count"] += 1
+        row["errors"] += rec.get("status") == "error"
+        row["wall_s"] += rec.get("duration_s") or 0.0
+        row["cpu_user_s"] += rec.get("cpu_user_s") or 0.0
+        row["cpu_sys_s"] += rec.get("cpu_sys_s") or 0.0
+        if rec.get("peak_rss_mb") is not None:
+            row["peak_rss_mb"] = max(row["peak_rss_mb"] or 0.0, rec["peak_rss_mb"])
+        for field in ("read_mb", "write_mb"):
+            if rec.get(field) is not None:
+                row[field] = (row[field] or 0.0) + rec[field]
+        if rec.get("sample") is not None:
+            row["samples"].add(rec["sample"])
+
+    total = {}
+    for row in rows.values():
+        total[row["event"]] = total.get(row["event"], 0.0) + row["wall_s"]
+    out = []
+    for row in sorted(rows.values(), key=lambda r: (r["event"] != "step", -r["wall_s"])):
+        row["samples"] = len(row["samples"])
+        row["share"] = round(row["wall_s"] / total[row["event"]], 4) if total[row["event"]] else 0.0
+        for field in ("wall_s", "cpu_user_s", "cpu_sys_s", "read_mb", "write_mb"):
+            if row[field] is not None:
+                row[field] = round(row[field], 3)
+        out.append(row)
+    return out
+
+
+def _fmt(value):
+    return "-" if value is None else (f"{value:.2f}" if isinstance(value, float) else str(value))
+
+
+def format_summary(rows):
+    columns = ["event", "step", "name", "count", "samples", "errors", "wall_s", "share",
+               "cpu_user_s", "cpu_sys_s", "peak_rss_mb", "read_mb", "write_mb"]
+    table = [columns] + [[_fmt(row[c]) for c in columns] for row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(r, widths)).rstrip() for r in table) + "\n"
+
+
+def write_report(records, folder):
+    """Пишет resource_report.json (все замеры и сводка) и resource_summary.txt в folder."""
+    os.makedirs(folder, exist_ok=True)
+    rows = summarize(records)
+    report_path = os.path.join(folder, REPORT_FILE)
+    summary_path = os.path.join(folder, SUMMARY_FILE)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"generated": time.strftime("%Y-%m-%dT%H:%M:%S"), "summary": rows, "records": records},
+                  f, ensure_ascii=False, indent=1, default=str)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        f.write(format_summary(rows))
+    return report_path, summary_path
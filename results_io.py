@@ -0,0 +1,165 @@
+import os
+import re
+import json
+
+import numpy as np
+import pandas as pd
+
+# pyarrow необязателен: без него таблицы, как и раньше, пишутся и читаются только в TSV
+try:
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pq = None
+    PARQUET_AVAILABLE = False
+
+# Общий формат таблиц результатов. Рядом с каждым TSV (GTF_results_*, Stringtie*.txt,
+# results_Deseq2_*.tsv, Deseq2.txt, global_merged_counts.tsv) пишется <имя>.parquet
+# со сжатием и объявленными типами столбцов: имена — категориальные, FPKM/TPM/log2 —
+# float32. p-value и FDR остаются float64: в float32 значения DESeq2 меньше ~1e-38
+# обратились бы в 0. TSV можно отключить (options.export_tsv = false в settings.json).
+PARQUET_EXT = ".parquet"
+COMPRESSION = "zstd"
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
+COLUMN_TYPES = {
+    "File": "category",
+    "Base Name": "category",
+    "Gene ID": "category",
+    "GATA Name": "category",
+    "IsControl": "bool",
+    "FPKM": "float32",
+    "TPM": "float32",
+    "log2(Exp/Control)": "float32",
+    "p-value": "float64",
+    "FDR": "float64",
+}
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def export_tsv(settings=None):
+    """Писать ли TSV рядом с parquet; без pyarrow TSV пишется всегда."""
+    if not PARQUET_AVAILABLE:
+        return True
+    if settings is None:
+        try:
+            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            settings = {}
+    return bool(settings.get("options", {}).get("export_tsv", True))
+
+
+def columnar_path(path):
+    return os.path.splitext(path)[0] + PARQUET_EXT
+
+
+def apply_schema(df):
+    """Копия таблицы с объявленными типами известных столбцов; целые счётчики — int32, если помещаются."""
+    df = df.copy()
+    for col in df.columns:
+        dtype = COLUMN_TYPES.get(col)
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+        elif dtype == "bool":
+            if df[col].notna().all():
+                df[col] = df[col].astype(bool)
+        elif dtype is not None:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+        elif pd.api.types.is_integer_dtype(df[col]) and (df[col].abs().max() if len(df) else 0) <= INT32_MAX:
+            df[col] = df[col].astype(np.int32)
+    if df.index.name in COLUMN_TYPES or df.index.name == "gene":
+        df.index = df.index.astype("category")
+    return df
+
+
+def write_table(df, path, index=False, tsv=None, settings=None):
+    """
+    Сохраняет таблицу: path — имя TSV (.txt/.tsv) или .parquet. Рядом с TSV пишется
+    parquet (если есть pyarrow), сам TSV — если tsv=True или включён options.export_tsv.
+    Возвращает список записанных файлов.
+    """
+    written = []
+    to_parquet = path.endswith(PARQUET_EXT)
+    if tsv is None:
+        tsv = not to_parquet and export_tsv(settings)
+    if tsv and not to_parquet:
+        # TSV пишется из исходной таблицы: числа в нём те же, что и до появления parquet
+        df.to_csv(path, sep="\t", index=index)
+        written.append(path)
+    # parquet — вторым: он не старше TSV, и read_table выберет именно его
+    if PARQUET_AVAILABLE or to_parquet:
+        target = columnar_path(path)
+        apply_schema(df).to_parquet(target, compression=COMPRESSION, index=index)
+        written.append(target)
+    return written
+
+
+def resolve_path(path):
+    """Файл, который будет прочитан вместо path: parquet рядом с TSV, если он не старше TSV."""
+    if path.endswith(PARQUET_EXT) or not PARQUET_AVAILABLE:
+        return path
+    columnar = columnar_path(path)
+    if os.path.exists(columnar) and (not os.path.exists(path) or os.path.getmtime(columnar) >= os.path.getmtime(path)):
+        return columnar
+    return path
+
+
+def table_columns(path):
+    """Имена столбцов без чтения данных."""
+    path = resolve_path(path)
+    if path.endswith(PARQUET_EXT):
+        schema = pq.read_schema(path)
+        index_cols = json.loads((schema.metadata or {}).get(b"pandas", b"{}")).get("index_columns", [])
+        return [name for name in schema.names if name not in index_cols]
+    return list(pd.read_csv(path, sep="\t", nrows=0).columns)
+
+
+def read_table(path, columns=None, index_col=None):
+    """
+    Читает таблицу результатов (TSV или parquet рядом с ним) только со столбцами columns.
+    Типы схемы (float32 и т.д.) есть только в parquet, записанном пайплайном; в TSV
+    имена становятся категориальными, а числовые столбцы схемы — float64, где
+    нечисловые значения («-», «NA» и т.п.) заменяются на NaN.
+    """
+    path = resolve_path(path)
+    if path.endswith(PARQUET_EXT):
+        df = pd.read_parquet(path, columns=columns)
+        if index_col is not None and df.index.name is None:
+            df = df.set_index(df.columns[index_col] if isinstance(index_col, int) else index_col)
+        return df
+    # имена читаются строками: строковое значение не может вызвать ошибку разбора
+    names = {c: str for c, dtype in COLUMN_TYPES.items() if dtype == "category"}
+    if index_col is not None:
+        # столбец индекса задаётся позицией в файле, поэтому файл читается целиком
+        df = pd.read_csv(path, sep="\t", index_col=index_col, dtype=names)
+        if columns is not None:
+            df = df[list(columns)]
+    else:
+        df = pd.read_csv(path, sep="\t", usecols=columns, dtype=names)
+    for col in df.columns:
+        dtype = COLUMN_TYPES.get(col)
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+        elif dtype in ("float32", "float64"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+    return df
+
+
+def latest_table(base_name, folder):
+    """
+    Самая свежая версия base_name / base_name_N (TSV или parquet, см. get_unique_filename);
+    возвращает путь для read_table или None.
+    """
+    rx = re.compile(rf"^{re.escape(base_name)}(_\d+)?\.(txt|tsv|parquet)$")
+    candidates = {}
+    for f in os.listdir(folder):
+        if rx.match(f):
+            stem, path = os.path.splitext(f)[0], os.path.join(folder, f)
+            candidates[stem] = max(candidates.get(stem, (0, None)), (os.path.getmtime(path), path))
+    if not candidates:
+        return None
+    return max(candidates.values())[1]
+
+
+def table_exists(path):
+    return os.path.exists(path) or os.path.exists(columnar_path(path))
@@ -1,6 +1,7 @@
 import sys
 import os
 import json
+import time
 import subprocess
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QPushButton, QTextEdit, QMessageBox,
@@ -8,10 +9,13 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QFont
 from PyQt6.QtCore import Qt
+from step_runner import StepContext, create_run_folder, run_step
+from pipeline_log import StepLog, configure, write_run_report, write_run_trace
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = os.path.join(script_dir, "settings.json")
 PIPELINE_LOG = os.path.join(script_dir, "run_pipeline_log.txt")
+run_log = StepLog("run_pipeline", PIPELINE_LOG, echo=False)
 
 
 STEPS_STRINGTIE = [
@@ -51,7 +55,8 @@ class PipelineApp(QWidget):
                     "delete_intermediate_files": False,
                     "fix_genome": False,
                     "use_stringtie": True,
-                    "use_deseq2": False
+                    "use_deseq2": False,
+                    "run_steps_in_process": True
                 },
                 "gene_mapping": {},
                 "visualization": {
@@ -124,8 +129,7 @@ class PipelineApp(QWidget):
 
     def log(self, message):
         self.log_output.append(message)
-        with open(PIPELINE_LOG, "a", encoding="utf-8") as log_file:
-            log_file.write(message + "\n")
+        run_log(message)
 
     def show_error_dialog(self, title, message):
 
@@ -192,6 +196,15 @@ class PipelineApp(QWidget):
         self.progress_bar.setMaximum(len(steps))
         self.progress_bar.setValue(0)
 
+        # шаги выполняются в этом же интерпретаторе (тяжёлые библиотеки импортируются один раз);
+        # run_steps_in_process = false возвращает запуск каждого шага отдельным процессом
+        in_process = self.settings["options"].get("run_steps_in_process", True)
+        run_folder = create_run_folder(self.settings["folders"].get("results_folder", ""))
+        configure(run_folder)
+        started = time.time()
+        if run_folder:
+            self.log(f"Результаты запуска сохраняются в {run_folder}\n")
+        ctx = StepContext(self.settings, script_dir, run_folder, ask=self.ask_yes_no)
 
         for script, description in steps:
             full_path = os.path.join(script_dir, script)
@@ -205,15 +218,16 @@ class PipelineApp(QWidget):
                         break
                     else:
                         self.log("Pipeline interrupted by user.")
+                        self.write_run_reports(started)
                         QMessageBox.information(self, "Interrupted", "Pipeline has been completed.")
                         return
                 self.log(f"Запуск {description} [{script}]...")
                 try:
-                    subprocess.run(["python", full_path], check=True)
+                    run_step(script, ctx, in_process)
                     self.log(f"{description} завершено.\n")
                     self.progress_bar.setValue(self.progress_bar.value() + 1)
                     break
-                except subprocess.CalledProcessError as e:
+                except Exception as e:
                     self.log(f"Error в {description}: {e}")
                     choice = self.show_error_dialog("Error", f"Error при выполнении {description}: {e}\n\nDo you want to repeat a step, skip it, or end processes?")
                     if choice == "retry":
@@ -222,6 +236,7 @@ class PipelineApp(QWidget):
                         break
                     else:
                         self.log("Pipeline interrupted by user.")
+                        self.write_run_reports(started)
                         QMessageBox.information(self, "Interrupted", "Pipeline has been completed.")
                         return
 
@@ -230,8 +245,23 @@ class PipelineApp(QWidget):
             self.clean_intermediate_files()
 
         self.log("Pipeline successfully completed!\n")
+        self.write_run_reports(started)
         QMessageBox.information(self, "Done", "Analysis completed successfully.")
 
+    def ask_yes_no(self, title, question):
+        # вопросы шагов, выполняемых в этом процессе, — диалогами Qt, а не tkinter
+        return QMessageBox.question(self, title, question) == QMessageBox.StandardButton.Yes
+
+    def write_run_reports(self, started):
+        # время, процессор, память и ввод/вывод каждого шага и программы, от дорогих к дешёвым,
+        # и временная шкала запуска для chrome://tracing / Perfetto
+        paths = write_run_report(since=started)
+        if paths:
+            self.log(f"Отчёт о ресурсах запуска: {paths[1]}")
+        trace = write_run_trace(since=started)
+        if trace:
+            self.log(f"Временная шкала запуска: {trace}")
+
     def clean_intermediate_files(self):
         self.log("Removing intermediate files...")
         bam_folder = self.settings["folders"].get("bam_folder", "")
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import importlib
+import subprocess
+from pipeline_log import StepLog, configure
+from profiling import PROFILE_ENV, profile_mode, profiled, profiles_folder, script_command
+
+# Шаги пайплайна, которые можно выполнять внутри одного интерпретатора:
+# скрипт -> модуль с функцией run_step(ctx)
+IN_PROCESS_STEPS = {
+    "stringtie_expression.py": "stringtie_expression",
+    "extract_fpkm.py": "extract_fpkm",
+    "GTF_results_pvalues.py": "GTF_results_pvalues",
+    "pvalues_log2.py": "pvalues_log2",
+    "deseq2_analysis.py": "deseq2_analysis",
+    "extract_Deseq2.py": "extract_Deseq2",
+}
+
+RUN_FOLDER_ENV = "PIPESEQ_RUN_FOLDER"
+RUNS_SUBFOLDER = "Runs"
+step_log = StepLog("step_runner", echo=False)
+
+
+class StepContext:
+    """
+    Общий контекст шагов: настройки читаются один раз, модули (pandas, scipy,
+    pydeseq2) импортируются один раз и переиспользуются между шагами и запусками.
+    data — таблицы, которые шаги передают друг другу в памяти;
+    run_folder — папка текущего запуска, куда шаги сохраняют свои результаты;
+    ask(title, question) -> bool — вопрос пользователю средствами вызывающего GUI,
+    чтобы шаги в его процессе не открывали диалоги другого инструментария (tkinter).
+    """
+    def __init__(self, settings, script_dir, run_folder=None, ask=None):
+        self.settings = settings
+        self.script_dir = script_dir
+        self.run_folder = run_folder
+        self.ask = ask
+        self.data = {}
+
+    @property
+    def folders(self):
+        return self.settings.get("folders", {})
+
+    @property
+    def options(self):
+        return self.settings.get("options", {})
+
+    @property
+    def gene_mapping(self):
+        return self.settings.get("gene_mapping", {})
+
+
+def create_run_folder(results_folder):
+    if not results_folder:
+        return None
+    run_folder = os.path.join(results_folder, RUNS_SUBFOLDER, time.strftime("run_%Y%m%d_%H%M%S"))
+    os.makedirs(run_folder, exist_ok=True)
+    return run_folder
+
+
+def supports_in_process(script):
+    return script in IN_PROCESS_STEPS
+
+
+def run_step_in_process(script, ctx):
+    if ctx.script_dir not in sys.path:
+        sys.path.insert(0, ctx.script_dir)
+    module = importlib.import_module(IN_PROCESS_STEPS[script])
+    mode = profile_mode(ctx.settings)
+    try:
+        with profiled(IN_PROCESS_STEPS[script], mode, profiles_folder(ctx.run_folder, ctx.settings)):
+            module.run_step(ctx)
+    except SystemExit as e:
+        # шаги завершаются через sys.exit(1) при ошибках — приводим к тому же виду, что и subprocess
+        if e.code not in (None, 0):
+            raise subprocess.CalledProcessError(e.code if isinstance(e.code, int) else 1, [script]) from e
+
+
+def run_step_subprocess(script, ctx):
+    env = dict(os.environ)
+    if ctx.run_folder:
+        env[RUN_FOLDER_ENV] = ctx.run_folder
+    mode = profile_mode(ctx.settings)
+    if mode:
+        env[PROFILE_ENV] = mode
+    # ресурсы дочернего интерпретатора попадают в журнал запуска записью tool
+    step_log.run(script_command(os.path.join(ctx.script_dir, script), settings=ctx.settings),
+                 fields={"script": script}, env=env)
+
+
+def run_step(script, ctx, in_process=True):
+    # журналы шагов, выполняемых в этом процессе, пишутся в папку текущего запуска
+    configure(ctx.run_folder)
+    in_process = in_process and supports_in_process(script)
+    with step_log.timed("step", usage=in_process, script=script, mode="in_process" if in_process else "subprocess"):
+        if in_process:
+            run_step_in_process(script, ctx)
+        else:
+            run_step_subprocess(script, ctx)
@@ -2,22 +2,21 @@ import os
 import subprocess
 import json
 import sys
+from pipeline_log import StepLog
+from resource_usage import wsl_command
 
 SETTINGS_FILE = "settings.json"
 LOG_FILE = "stringtie_expression_log.txt"
+log = StepLog("stringtie_expression", LOG_FILE)
 
-def log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as log_file:
-        log_file.write(message + "\n")
+def load_settings(settings=None):
+    if settings is None:
+        if not os.path.exists(SETTINGS_FILE):
+            log(f"Файл настроек {SETTINGS_FILE} не найден!")
+            sys.exit(1)
 
-def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        log(f"Файл настроек {SETTINGS_FILE} не найден!")
-        sys.exit(1)
-
-    with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = json.load(f)
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
 
     folders = settings.get("folders", {})
     bam_folder = folders.get("bam_folder")
@@ -51,16 +50,16 @@ def convert_path_to_wsl(win_path):
         return wsl_path
     return path
 
-def run_command(command):
-    log(f"Запуск в WSL:\n{command}")
+def run_command(command, sample=None):
+    log(f"Запуск в WSL:\n{command}", sample=sample)
     try:
-        subprocess.run(f'wsl bash -c "{command}"', shell=True, check=True)
+        log.run(wsl_command(command), sample=sample, parse_time=True, shell=True)
     except subprocess.CalledProcessError as e:
-        log(f"Ошибка выполнения команды: {e}")
+        log(f"Ошибка выполнения команды: {e}", sample=sample)
         sys.exit(1)
 
-def calculate_expression_with_stringtie():
-    bam_folder, gtf_target_folder, reference_gtf, settings = load_settings()
+def calculate_expression_with_stringtie(settings=None):
+    bam_folder, gtf_target_folder, reference_gtf, settings = load_settings(settings)
 
     if not os.path.exists(bam_folder):
         log(f"Папка BAM/Output не найдена: {bam_folder}")
@@ -101,7 +100,7 @@ def calculate_expression_with_stringtie():
         gtf_output_wsl = f"{gtf_target_folder_wsl}/{condition_name}.gtf"
         coverage_output_wsl = f"{gtf_target_folder_wsl}/{condition_name}_coverage.tsv"
 
-        log(f"Обработка {bam_file} с StringTie...")
+        log(f"Обработка {bam_file} с StringTie...", sample=condition_name)
 
         command = (
             f"stringtie {bam_path_wsl} "
@@ -109,12 +108,15 @@ def calculate_expression_with_stringtie():
             f"-o {gtf_output_wsl} "
             f"{stringtie_flags} --rf -A {coverage_output_wsl}"
         )
-        run_command(command)
+        run_command(command, sample=condition_name)
 
-        log(f"Завершена обработка: {bam_file}")
+        log(f"Завершена обработка: {bam_file}", sample=condition_name)
 
     log("Все файлы обработаны StringTie!")
 
+def run_step(ctx):
+    calculate_expression_with_stringtie(ctx.settings)
+
 if __name__ == "__main__":
     calculate_expression_with_stringtie()
     log("Скрипт успешно завершён!")
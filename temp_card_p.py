@@ -1,53 +1,93 @@
 import os
 import json
+import glob
+import argparse
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 import re
-from tkinter import Tk, Label, Entry, Button, StringVar, BooleanVar, Checkbutton, filedialog, Listbox
+from concurrent.futures import ProcessPoolExecutor
+from tkinter import Tk, Label, Entry, Button, StringVar, BooleanVar, Checkbutton, OptionMenu, filedialog, Listbox
 from matplotlib.colors import LinearSegmentedColormap, TwoSlopeNorm
+from matplotlib.collections import LineCollection
 import sys
+import subprocess
+
+from render_cache import cache_folder, render_key, restore_cached, store_cached, cached_render
+from profiling import profile_call
+from results_io import read_table, table_columns
 
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 settings_path = os.path.join(script_dir, "settings.json")
 config_path = os.path.join(script_dir, "heatmap_config.json")
 
+REQUIRED_COLUMNS = ["Base Name", "GATA Name", "log2(Exp/Control)", "p-value"]
+# имя для генов без GATA Name (неразмеченные гены полногеномных results_Deseq2_*.tsv)
+FALLBACK_GENE_COLUMN = "Gene ID"
+
+# выше этого числа ячеек карта рисуется одной сеткой без подписей и отдельных прямоугольников
+LARGE_HEATMAP_CELLS = 1000
+MAX_TICK_LABELS = 150
+SIGNIFICANCE_LEVEL = 0.05
+
+# способы отбора top-N генов для полногеномных таблиц
+TOP_GENE_METHODS = ["abs_log2fc", "variance", "significance"]
+
+
+def load_results_folder():
+    with open(settings_path, "r") as f:
+        settings = json.load(f)
+    return settings["folders"]["results_folder"]
+
+
+def load_table(path):
+    # читаются только нужные столбцы; из parquet имена приходят категориальными
+    columns = table_columns(path)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Отсутствуют необходимые столбцы: {missing_columns}")
+    fallback = [FALLBACK_GENE_COLUMN] if FALLBACK_GENE_COLUMN in columns else []
+    return fill_gene_names(read_table(path, columns=REQUIRED_COLUMNS + fallback))
+
+
+def fill_gene_names(df):
+    """
+    Пустой GATA Name заменяется на Gene ID; если Gene ID в таблице нет,
+    строки без имени отбрасываются.
+    """
+    names = df["GATA Name"]
+    if names.notna().all():
+        return df.drop(columns=[FALLBACK_GENE_COLUMN], errors="ignore")
+    df = df.copy()
+    if FALLBACK_GENE_COLUMN in df.columns:
+        names = names.astype(object).where(names.notna(), df[FALLBACK_GENE_COLUMN].astype(object))
+        df["GATA Name"] = names.astype("category")
+        df = df.drop(columns=[FALLBACK_GENE_COLUMN])
+    return df[df["GATA Name"].notna()]
+
+
+def get_possible_values(df):
+    possible_conditions = sorted(df["Base Name"].unique())
+    possible_genes = sorted(
+        (str(x) for x in df["GATA Name"].unique()),
+        key=lambda x: (int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else float('inf'), x)
+    )
+    return possible_conditions, possible_genes
 
-with open(settings_path, "r") as f:
-    settings = json.load(f)
-results_folder = settings["folders"]["results_folder"]
-
-
-root_file = Tk()
-root_file.withdraw()
-selected_file = filedialog.askopenfilename(
-    initialdir=results_folder,
-    title="Выберите файл для тепловой карты",
-    filetypes=(("Text files", "*.txt"), ("All files", "*.*"))
-)
-root_file.destroy()
-if not selected_file:
-    raise FileNotFoundError("Файл не выбран")
-print(f"Используем файл: {selected_file}")
-
-
-df = pd.read_csv(selected_file, sep="\t")
-required_columns = ["Base Name", "GATA Name", "log2(Exp/Control)", "p-value"]
-missing_columns = [col for col in required_columns if col not in df.columns]
-if missing_columns:
-    raise ValueError(f"Отсутствуют необходимые столбцы: {missing_columns}")
-
-possible_conditions = sorted(df["Base Name"].unique())
-possible_genes = sorted(
-    df["GATA Name"].unique(),
-    key=lambda x: (int(re.search(r'\d+', x).group()) if re.search(r'\d+', x) else float('inf'), x)
-)
 
+def limit_to_top_genes(df, cfg):
+    """Строки только top_n_genes генов (если задано); иначе таблица без изменений."""
+    top_n = int(cfg.get("top_n_genes", 0) or 0)
+    if top_n <= 0:
+        return df
+    selected = select_top_genes(df, top_n, cfg.get("top_genes_by", "abs_log2fc"))
+    return df[df["GATA Name"].isin(selected)]
 
-def load_or_ask_config(possible_conditions, possible_genes):
 
+def load_config(possible_conditions, possible_genes, path=None):
     config = {
         "title": "Heatmap of Log2 Fold Change",
         "xlabel": "GATA factors",
@@ -61,12 +101,24 @@ def load_or_ask_config(possible_conditions, possible_genes):
         "sort_conditions_by_max_exp": False,
         "sort_genes_by_max_exp": False,
         "remove_color_for_high_p": False,
-        "generate_histograms": False
+        "generate_histograms": False,
+        "histograms_as_pdf": False,
+        "large_heatmap_cells": LARGE_HEATMAP_CELLS,
+        "top_n_genes": 0,
+        "top_genes_by": "abs_log2fc",
+        "render_cache": True
     }
-    if os.path.exists(config_path):
-        with open(config_path, "r") as f:
+    path = path or config_path
+    if os.path.exists(path):
+        with open(path, "r") as f:
             file_config = json.load(f)
             config.update(file_config)
+    return config
+
+
+def load_or_ask_config(possible_conditions, possible_genes):
+
+    config = load_config(possible_conditions, possible_genes)
 
     root = Tk()
     root.title("Настройки тепловой карты")
@@ -118,6 +170,18 @@ def load_or_ask_config(possible_conditions, possible_genes):
         text="Гистограммы по генам вместо тепловой карты",
         variable=generate_hist_var
     ).grid(row=11, column=0, columnspan=3, sticky="w")
+    hist_pdf_var = BooleanVar(value=config.get("histograms_as_pdf", False))
+    Checkbutton(
+        root,
+        text="Гистограммы одним многостраничным PDF",
+        variable=hist_pdf_var
+    ).grid(row=14, column=0, columnspan=3, sticky="w")
+
+    top_n_var = StringVar(value=str(config.get("top_n_genes", 0)))
+    top_by_var = StringVar(value=config.get("top_genes_by", "abs_log2fc"))
+    Label(root, text="Top-N генов (0 — все):").grid(row=15, column=0, sticky="w")
+    Entry(root, textvariable=top_n_var, width=8).grid(row=15, column=1, sticky="w")
+    OptionMenu(root, top_by_var, *TOP_GENE_METHODS).grid(row=15, column=2, sticky="w")
 
     def update_summary(*args):
         summary = (
@@ -227,82 +291,365 @@ def load_or_ask_config(possible_conditions, possible_genes):
         config["sort_genes_by_max_exp"] = sort_genes_var.get()
         config["remove_color_for_high_p"] = remove_color_var.get()
         config["generate_histograms"] = generate_hist_var.get()
+        config["histograms_as_pdf"] = hist_pdf_var.get()
+        try:
+            config["top_n_genes"] = max(0, int(top_n_var.get() or 0))
+        except ValueError:
+            config["top_n_genes"] = 0
+        config["top_genes_by"] = top_by_var.get()
         with open(config_path, "w") as f:
             json.dump(config, f, indent=2)
         root.destroy()
 
-    Button(root, text="Сохранить и продолжить", command=save_and_close).grid(row=14, column=0, columnspan=3, pady=10)
+    Button(root, text="Сохранить и продолжить", command=save_and_close).grid(row=16, column=0, columnspan=3, pady=10)
 
     root.mainloop()
     return config
 
-cfg = load_or_ask_config(possible_conditions, possible_genes)
 
+def resolve_order(custom_order, available):
+    # порядок из конфигурации для присутствующих значений, остальные — в конце
+    available = list(available)
+    present = set(available)
+    order = [x for x in (custom_order or []) if x in present]
+    seen = set(order)
+    return order + [x for x in sorted(available) if x not in seen]
+
+
+def select_top_genes(df, n, method="abs_log2fc"):
+    """
+    Возвращает n генов с наибольшим |log2FC|, дисперсией log2FC по условиям
+    или наименьшим p-value. Используется частичная сортировка (argpartition),
+    полностью сортируются только отобранные n значений.
+    """
+    genes = df["GATA Name"].to_numpy()
+    codes, uniques = pd.factorize(genes)
+    if n <= 0 or n >= len(uniques):
+        return list(uniques)
+
+    if method == "abs_log2fc":
+        score = np.abs(df["log2(Exp/Control)"]).groupby(codes).max()
+    elif method == "variance":
+        score = df["log2(Exp/Control)"].groupby(codes).var()
+    elif method == "significance":
+        score = -df["p-value"].groupby(codes).min()
+    else:
+        raise ValueError(f"Неизвестный способ отбора генов: {method}")
+
+    score = score.reindex(range(len(uniques))).to_numpy(dtype=float)
+    score = np.where(np.isnan(score), -np.inf, score)
+    top = np.argpartition(-score, n - 1)[:n]
+    top = top[np.argsort(-score[top], kind="stable")]
+    return list(uniques[top])
 
-df["Base Name"] = df["Base Name"].str.replace(r"(_rep\d+|_\d+)$", "", regex=True)
 
+def prepare_matrices(df, cfg):
+    df = limit_to_top_genes(df, cfg).copy()
+    df["Base Name"] = df["Base Name"].str.replace(r"(_rep\d+|_\d+)$", "", regex=True)
 
-if cfg.get("sort_conditions_by_max_exp", False):
-    condition_max = df.groupby("Base Name")["log2(Exp/Control)"].max()
-    base_order = list(condition_max.sort_values(ascending=False).index)
-else:
-    base_order = cfg.get("custom_condition_order") or sorted(df["Base Name"].unique())
 
-if cfg.get("sort_genes_by_max_exp", False):
-    gene_max = df.groupby("GATA Name")["log2(Exp/Control)"].max()
-    control_gene = None
-    for gene in gene_max.index:
-        if gene.startswith("Control"):
-            control_gene = gene
-            break
-    if control_gene:
-        non_control_genes = [g for g in gene_max.index if g != control_gene]
-        non_control_sorted = list(gene_max[non_control_genes].sort_values(ascending=False).index)
-        gene_order = [control_gene] + non_control_sorted
+    if cfg.get("sort_conditions_by_max_exp", False):
+        condition_max = df.groupby("Base Name", observed=True)["log2(Exp/Control)"].max()
+        base_order = list(condition_max.sort_values(ascending=False).index)
+    else:
+        base_order = resolve_order(cfg.get("custom_condition_order"), df["Base Name"].unique())
+
+    if cfg.get("sort_genes_by_max_exp", False):
+        gene_max = df.groupby("GATA Name", observed=True)["log2(Exp/Control)"].max()
+        control_gene = None
+        for gene in gene_max.index:
+            if gene.startswith("Control"):
+                control_gene = gene
+                break
+        if control_gene:
+            non_control_genes = [g for g in gene_max.index if g != control_gene]
+            non_control_sorted = list(gene_max[non_control_genes].sort_values(ascending=False).index)
+            gene_order = [control_gene] + non_control_sorted
+        else:
+            gene_order = list(gene_max.sort_values(ascending=False).index)
     else:
-        gene_order = list(gene_max.sort_values(ascending=False).index)
-else:
-    gene_order = cfg.get("custom_gene_order") or sorted(df["GATA Name"].unique())
+        gene_order = resolve_order(cfg.get("custom_gene_order"), df["GATA Name"].unique())
+
+    df["Base Name"] = pd.Categorical(df["Base Name"], categories=base_order, ordered=True)
+    df["GATA Name"] = pd.Categorical(df["GATA Name"], categories=gene_order, ordered=True)
+
+    heatmap_data = df.pivot(index="Base Name", columns="GATA Name", values="log2(Exp/Control)")
+    annotations = df.pivot(index="Base Name", columns="GATA Name", values="p-value")
+    return heatmap_data, annotations, base_order, gene_order
 
-df["Base Name"] = pd.Categorical(df["Base Name"], categories=base_order, ordered=True)
-df["GATA Name"] = pd.Categorical(df["GATA Name"], categories=gene_order, ordered=True)
 
-heatmap_data = df.pivot(index="Base Name", columns="GATA Name", values="log2(Exp/Control)")
-annotations = df.pivot(index="Base Name", columns="GATA Name", values="p-value")
 def sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', "_", name)
 
-import subprocess 
 
-if cfg.get("generate_histograms", False):
+HISTOGRAM_DPI = 300
+HISTOGRAM_GENES_PER_WORKER = 10
+
+
+def _histogram_figure(conditions):
+    # одна фигура на процесс: для каждого гена меняются только высоты столбцов и подписи
+    fig, ax = plt.subplots(figsize=(8, 5))
+    bars = ax.bar(range(len(conditions)), np.zeros(len(conditions)), edgecolor='black')
+    ax.set_xticks(range(len(conditions)))
+    ax.set_xticklabels(conditions, rotation=45, ha='right')
+    ax.set_xlabel("Conditions")
+    ax.set_ylabel("Log2(Exp/Control)")
+    title = ax.set_title("")
+    fig.tight_layout()
+    return fig, ax, bars, title
+
+
+def _update_histogram(ax, bars, title, gene, values):
+    # пределы осей и поля пересчитываются так же, как у новой фигуры с plt.bar:
+    # картинка совпадает с прежней попиксельно
+    for bar, height in zip(bars, np.asarray(values, dtype=float)):
+        bar.set_height(height)
+    ax.relim()
+    ax.autoscale_view()
+    ax.set_xticks(range(len(bars)))  # как plt.xticks: пределы расширяются до всех меток
+    title.set_text(f"{gene}: Expression change across conditions")
+    ax.figure.tight_layout()
+
+
+def histogram_path(folder, gene):
+    return os.path.join(folder, sanitize_filename(gene) + ".png")
+
+
+def _render_histogram_chunk(conditions, genes_values, folder):
+    fig, ax, bars, title = _histogram_figure(conditions)
+    paths = []
+    for gene, values in genes_values:
+        _update_histogram(ax, bars, title, gene, values)
+        out_path = histogram_path(folder, gene)
+        fig.savefig(out_path, dpi=HISTOGRAM_DPI)
+        paths.append(out_path)
+    plt.close(fig)
+    return paths
+
+
+def render_histograms(heatmap_data, gene_order, folder, workers=None, cache_dir=None):
+    """
+    PNG-гистограмма на каждый ген. Гены делятся между процессами,
+    каждый процесс переиспользует одну заранее построенную фигуру.
+    С cache_dir перерисовываются только гены, чьи значения изменились.
+    """
+    os.makedirs(folder, exist_ok=True)
+    conditions = [str(c) for c in heatmap_data.index]
+    genes_values = [(str(gene), heatmap_data[gene].to_numpy(dtype=float).tolist()) for gene in gene_order]
+    all_paths = [histogram_path(folder, gene) for gene, _ in genes_values]
+
+    keys = {}
+    if cache_dir:
+        pending = []
+        for (gene, values), out_path in zip(genes_values, all_paths):
+            key = render_key(_render_histogram_chunk, conditions, gene, values)
+            if not restore_cached(cache_dir, key, out_path):
+                keys[out_path] = key
+                pending.append((gene, values))
+        genes_values = pending
+    if not genes_values:
+        return all_paths
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(1, len(genes_values) // HISTOGRAM_GENES_PER_WORKER))
+    if workers <= 1:
+        paths = _render_histogram_chunk(conditions, genes_values, folder)
+    else:
+        chunks = [genes_values[k::workers] for k in range(workers)]
+        paths = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool:
+            for chunk_paths in pool.map(_render_histogram_chunk, [conditions] * workers, chunks, [folder] * workers):
+                paths.extend(chunk_paths)
+
+    for out_path in paths:
+        if out_path in keys:
+            store_cached(cache_dir, keys[out_path], out_path)
+    return all_paths
+
+
+def render_histograms_pdf(heatmap_data, gene_order, pdf_path):
+    conditions = [str(c) for c in heatmap_data.index]
+    fig, ax, bars, title = _histogram_figure(conditions)
+    with PdfPages(pdf_path) as pdf:
+        for gene in gene_order:
+            _update_histogram(ax, bars, title, str(gene), heatmap_data[gene].to_numpy(dtype=float))
+            pdf.savefig(fig)
+    plt.close(fig)
+    return pdf_path
+
+
+SCALE_LABELS = {
+    6: "+64x", 5: "+32x", 4: "+16x", 3: "+8x", 2: "+4x", 1: "+2x",
+    0: "no change",
+    -1: "÷2", -2: "÷4", -3: "÷8", -4: "÷16", -5: "÷32", -6: "÷64"
+}
+
+
+def label_colorbar(cbar, vmin, vmax):
+    cbar.ax.yaxis.set_ticks_position("left")
+    for value, label in SCALE_LABELS.items():
+        if vmin <= value <= vmax:
+            pos = (value - vmin) / (vmax - vmin)
+            cbar.ax.text(1.2, pos, label, ha='left', va='center', fontsize=9, transform=cbar.ax.transAxes)
+
+
+def significance_outlines(mask):
+    """
+    Отрезки границ значимых ячеек одним массивом — то же, что рамка на каждую ячейку,
+    но без отдельного Rectangle на каждую.
+    """
+    n_rows, n_cols = mask.shape
+    padded_rows = np.zeros((n_rows + 2, n_cols), dtype=bool)
+    padded_rows[1:-1] = mask
+    h_rows, h_cols = np.nonzero(padded_rows[:-1] | padded_rows[1:])
+    padded_cols = np.zeros((n_rows, n_cols + 2), dtype=bool)
+    padded_cols[:, 1:-1] = mask
+    v_rows, v_cols = np.nonzero(padded_cols[:, :-1] | padded_cols[:, 1:])
+
+    horizontal = np.stack([np.column_stack([h_cols, h_rows]), np.column_stack([h_cols + 1, h_rows])], axis=1)
+    vertical = np.stack([np.column_stack([v_cols, v_rows]), np.column_stack([v_cols, v_rows + 1])], axis=1)
+    return np.concatenate([horizontal, vertical]).astype(float)
+
+
+def render_heatmap_large(heatmap_data, annotations, cfg, output_path):
+    values = heatmap_data.to_numpy(dtype=float)
+    p_values = annotations.reindex(index=heatmap_data.index, columns=heatmap_data.columns).to_numpy(dtype=float)
+    n_rows, n_cols = values.shape
+
+    vmax = float(np.nanmax(np.abs(values)))
+    vmin = -vmax
+    custom_cmap = LinearSegmentedColormap.from_list("custom_cmap", [cfg["color_low"], cfg["color_mid"], cfg["color_high"]])
+    custom_cmap.set_bad("white")
+    norm = TwoSlopeNorm(vmin=vmin, vcenter=0, vmax=vmax)
+
+    # маскирование незначимых ячеек — маска массива вместо белого прямоугольника поверх ячейки
+    hide = np.isnan(values)
+    if cfg.get("remove_color_for_high_p", False):
+        hide |= p_values > SIGNIFICANCE_LEVEL
+
+    fig, ax = plt.subplots(figsize=(min(30, max(12, n_cols * 0.12)), min(20, max(8, n_rows * 0.3))))
+    mesh = ax.pcolormesh(np.ma.masked_array(values, mask=hide), cmap=custom_cmap, norm=norm, rasterized=True)
+
+    if cfg["show_p_values"]:
+        outlines = LineCollection(significance_outlines(p_values < SIGNIFICANCE_LEVEL), colors="black", linewidths=0.3)
+        outlines.set_rasterized(True)
+        ax.add_collection(outlines)
+
+    ax.set_xlim(0, n_cols)
+    ax.set_ylim(n_rows, 0)
+    ax.set_aspect("equal" if max(n_rows, n_cols) <= 3 * min(n_rows, n_cols) else "auto")
+    if n_cols <= MAX_TICK_LABELS:
+        ax.set_xticks(np.arange(n_cols) + 0.5)
+        ax.set_xticklabels(heatmap_data.columns, rotation=45, ha="right", fontsize=6)
+    else:
+        ax.set_xticks([])
+    if n_rows <= MAX_TICK_LABELS:
+        ax.set_yticks(np.arange(n_rows) + 0.5)
+        ax.set_yticklabels(heatmap_data.index, rotation=0, fontsize=8)
+    else:
+        ax.set_yticks([])
+
+    label_colorbar(fig.colorbar(mesh, ax=ax), vmin, vmax)
+
+    ax.set_title(cfg["title"], fontsize=14, fontweight="bold")
+    ax.set_xlabel(cfg["xlabel"], fontsize=12)
+    ax.set_ylabel(cfg["ylabel"], fontsize=12)
+    fig.tight_layout()
+
+    fig.savefig(output_path, dpi=300)
+    return fig
+
 
-    folder = os.path.join(
-        results_folder,
-        sanitize_filename(cfg["title"]) + "_histograms"
+def render_cache_dir(cfg, base_folder):
+    return cache_folder(base_folder) if cfg.get("render_cache", True) else None
+
+
+def render_heatmap_cached(heatmap_data, annotations, cfg, output_path, cache_dir):
+    """
+    Возвращает фигуру или None, если картинка с теми же данными и настройками уже была построена
+    и просто скопирована из кэша.
+    """
+    key = render_key(render_heatmap, heatmap_data, annotations, cfg)
+    return cached_render(cache_dir, key, output_path,
+                         lambda: render_heatmap(heatmap_data, annotations, cfg, output_path))
+
+
+def render_histograms_pdf_cached(heatmap_data, gene_order, pdf_path, cache_dir):
+    key = render_key(render_histograms_pdf, heatmap_data, gene_order)
+    cached_render(cache_dir, key, pdf_path, lambda: render_histograms_pdf(heatmap_data, gene_order, pdf_path))
+    return pdf_path
+
+
+def render_heatmap(heatmap_data, annotations, cfg, output_path):
+    if heatmap_data.size > cfg.get("large_heatmap_cells", LARGE_HEATMAP_CELLS):
+        return render_heatmap_large(heatmap_data, annotations, cfg, output_path)
+
+    base_order = list(heatmap_data.index)
+    gene_order = list(heatmap_data.columns)
+
+    vmax = max(abs(heatmap_data.min().min()), abs(heatmap_data.max().max()))
+    vmin = -vmax
+    custom_cmap = LinearSegmentedColormap.from_list("custom_cmap", [cfg["color_low"], cfg["color_mid"], cfg["color_high"]])
+    norm = TwoSlopeNorm(vmin=vmin, vcenter=0, vmax=vmax)
+
+    if cfg["show_p_values"]:
+        def format_pvalue(log2_val, p_val):
+
+            return f"{log2_val:.1f}\n({p_val:.2f})" if p_val >= 0.05 else f"*{log2_val:.1f}*\n({p_val:.2f})"
+        annot_text = np.vectorize(format_pvalue)(heatmap_data.values, annotations.values)
+    else:
+        annot_text = np.vectorize(lambda x: f"{x:.1f}")(heatmap_data.values)
+
+    fig = plt.figure(figsize=(max(12, len(gene_order) * 0.8), max(8, len(base_order) * 0.5)))
+
+    ax = sns.heatmap(
+        heatmap_data,
+        cmap=custom_cmap,
+        norm=norm,
+        annot=annot_text,
+        fmt="",
+        linewidths=0.5,
+        cbar=True,
+        linecolor='black',
+        square=True
     )
-    os.makedirs(folder, exist_ok=True)
- 
-    folder = os.path.abspath(folder)
-    print(f"Гистограммы будут сохранены тут: {folder}")
-
-    for gene in gene_order:
-    
-        series = heatmap_data[gene]
-        conditions = list(series.index)
-        values = list(series.values)
-
-        plt.figure(figsize=(8, 5))
-        plt.bar(range(len(conditions)), values, edgecolor='black')
-        plt.xticks(range(len(conditions)), conditions, rotation=45, ha='right')
-        plt.title(f"{gene}: Expression change across conditions")
-        plt.xlabel("Conditions")
-        plt.ylabel("Log2(Exp/Control)")
-        plt.tight_layout()
-
-        out_path = os.path.join(folder, sanitize_filename(gene) + ".png")
-        plt.savefig(out_path, dpi=300)
-        plt.close()
 
+
+    if cfg["show_p_values"]:
+        for i in range(heatmap_data.shape[0]):
+            for j in range(heatmap_data.shape[1]):
+                if annotations.iloc[i, j] < 0.05:
+                    ax.add_patch(plt.Rectangle((j, i), 1, 1, fill=False, edgecolor='black', lw=1))
+
+
+    if cfg.get("remove_color_for_high_p", False):
+        for i in range(heatmap_data.shape[0]):
+            for j in range(heatmap_data.shape[1]):
+                if annotations.iloc[i, j] > 0.05:
+                    ax.add_patch(plt.Rectangle((j, i), 1, 1, fill=True, color="white", lw=0))
+        for text in ax.texts:
+            x, y = text.get_position()
+            col = int(x)
+            row = int(y)
+            if row < heatmap_data.shape[0] and col < heatmap_data.shape[1]:
+                if annotations.iloc[row, col] > 0.05:
+                    text.set_fontsize(text.get_fontsize() / 2)
+
+
+    label_colorbar(ax.collections[0].colorbar, vmin, vmax)
+
+    plt.title(cfg["title"], fontsize=14, fontweight="bold")
+    plt.xlabel(cfg["xlabel"], fontsize=12)
+    plt.ylabel(cfg["ylabel"], fontsize=12)
+    plt.xticks(rotation=45, ha="right")
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+
+    plt.savefig(output_path, dpi=300)
+    return fig
+
+
+def open_folder(folder):
     try:
         if sys.platform == "win32":
             os.startfile(folder)
@@ -313,86 +660,168 @@ if cfg.get("generate_histograms", False):
     except Exception as e:
         print(f"Не удалось автоматически открыть папку: {e}")
 
-    print("Гистограммы успешно сохранены.")
-    sys.exit(0)
-
-vmax = max(abs(heatmap_data.min().min()), abs(heatmap_data.max().max()))
-vmin = -vmax
-custom_cmap = LinearSegmentedColormap.from_list("custom_cmap", [cfg["color_low"], cfg["color_mid"], cfg["color_high"]])
-norm = TwoSlopeNorm(vmin=vmin, vcenter=0, vmax=vmax)
-
-if cfg["show_p_values"]:
-    def format_pvalue(log2_val, p_val):
-
-        return f"{log2_val:.1f}\n({p_val:.2f})" if p_val >= 0.05 else f"*{log2_val:.1f}*\n({p_val:.2f})"
-    annot_text = np.vectorize(format_pvalue)(heatmap_data.values, annotations.values)
-else:
-    annot_text = np.vectorize(lambda x: f"{x:.1f}")(heatmap_data.values)
-
-plt.figure(figsize=(max(12, len(gene_order) * 0.8), max(8, len(base_order) * 0.5)))
-
-ax = sns.heatmap(
-    heatmap_data,
-    cmap=custom_cmap,
-    norm=norm,
-    annot=annot_text,
-    fmt="",
-    linewidths=0.5,
-    cbar=True,
-    linecolor='black',
-    square=True
-)
-
-
-if cfg["show_p_values"]:
-    for i in range(heatmap_data.shape[0]):
-        for j in range(heatmap_data.shape[1]):
-            if annotations.iloc[i, j] < 0.05:
-                ax.add_patch(plt.Rectangle((j, i), 1, 1, fill=False, edgecolor='black', lw=1))
-
-
-if cfg.get("remove_color_for_high_p", False):
-    for i in range(heatmap_data.shape[0]):
-        for j in range(heatmap_data.shape[1]):
-            if annotations.iloc[i, j] > 0.05:
-                ax.add_patch(plt.Rectangle((j, i), 1, 1, fill=True, color="white", lw=0))
-    for text in ax.texts:
-        x, y = text.get_position()
-        col = int(x)
-        row = int(y)
-        if row < heatmap_data.shape[0] and col < heatmap_data.shape[1]:
-            if annotations.iloc[row, col] > 0.05:
-                text.set_fontsize(text.get_fontsize() / 2)
-
-
-cbar = ax.collections[0].colorbar
-cbar.ax.yaxis.set_ticks_position("left")
-scale_labels = {
-    6: "+64x", 5: "+32x", 4: "+16x", 3: "+8x", 2: "+4x", 1: "+2x", 
-    0: "no change", 
-    -1: "÷2", -2: "÷4", -3: "÷8", -4: "÷16", -5: "÷32", -6: "÷64"
-}
-for value, label in scale_labels.items():
-    if vmin <= value <= vmax:
-        pos = (value - vmin) / (vmax - vmin)
-        cbar.ax.text(1.2, pos, label, ha='left', va='center', fontsize=9, transform=cbar.ax.transAxes)
-
-plt.title(cfg["title"], fontsize=14, fontweight="bold")
-plt.xlabel(cfg["xlabel"], fontsize=12)
-plt.ylabel(cfg["ylabel"], fontsize=12)
-plt.xticks(rotation=45, ha="right")
-plt.yticks(rotation=0)
-plt.tight_layout()
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
+@profile_call("temp_card_p")
+def main():
+    results_folder = load_results_folder()
 
-filename = sanitize_filename(cfg["title"]).strip()
-if not filename:
-    filename = "heatmap"
 
-output_path = os.path.join(results_folder, f"{filename}.png")
-plt.savefig(output_path, dpi=300)
-plt.show()
+    root_file = Tk()
+    root_file.withdraw()
+    selected_file = filedialog.askopenfilename(
+        initialdir=results_folder,
+        title="Выберите файл для тепловой карты",
+        filetypes=(("Text files", "*.txt"), ("Parquet files", "*.parquet"), ("All files", "*.*"))
+    )
+    root_file.destroy()
+    if not selected_file:
+        raise FileNotFoundError("Файл не выбран")
+    print(f"Используем файл: {selected_file}")
+
+
+    df = load_table(selected_file)
+    # списки для диалога — по генам, отобранным сохранёнными настройками, а не по всему геному
+    possible_conditions, possible_genes = get_possible_values(limit_to_top_genes(df, load_config([], [])))
+
+    cfg = load_or_ask_config(possible_conditions, possible_genes)
+    heatmap_data, annotations, base_order, gene_order = prepare_matrices(df, cfg)
+    cache_dir = render_cache_dir(cfg, results_folder)
 
-print(f"Тепловая карта сохранена: {output_path}")
+    if cfg.get("generate_histograms", False):
+
+        folder = os.path.join(
+            results_folder,
+            sanitize_filename(cfg["title"]) + "_histograms"
+        )
+        folder = os.path.abspath(folder)
+        if cfg.get("histograms_as_pdf", False):
+            pdf_path = folder + ".pdf"
+            render_histograms_pdf_cached(heatmap_data, gene_order, pdf_path, cache_dir)
+            print(f"Гистограммы сохранены в {pdf_path}")
+            open_folder(os.path.dirname(pdf_path))
+        else:
+            print(f"Гистограммы будут сохранены тут: {folder}")
+            render_histograms(heatmap_data, gene_order, folder, cache_dir=cache_dir)
+            open_folder(folder)
+
+        print("Гистограммы успешно сохранены.")
+        sys.exit(0)
+
+    filename = sanitize_filename(cfg["title"]).strip()
+    if not filename:
+        filename = "heatmap"
+
+    output_path = os.path.join(results_folder, f"{filename}.png")
+    fig = render_heatmap_cached(heatmap_data, annotations, cfg, output_path, cache_dir)
+    if fig is None:
+        print("Данные и настройки не изменились — картинка взята из кэша.")
+        open_folder(os.path.dirname(output_path))
+    else:
+        plt.show()
+
+    print(f"Тепловая карта сохранена: {output_path}")
+
+
+# ---------- Пакетный режим (без GUI) ----------
+
+def _init_batch_worker():
+    plt.switch_backend("Agg")
+
+
+@profile_call("temp_card_p.render_file")
+def render_file(path, config_file, out_folder, out_name):
+    """
+    Строит тепловую карту (или гистограммы) для одного файла без диалогов;
+    выполняется в процессе-обработчике пакетного режима.
+    """
+    df = limit_to_top_genes(load_table(path), load_config([], [], config_file))
+    possible_conditions, possible_genes = get_possible_values(df)
+    cfg = load_config(possible_conditions, possible_genes, config_file)
+    heatmap_data, annotations, base_order, gene_order = prepare_matrices(df, cfg)
+    cache_dir = render_cache_dir(cfg, out_folder)
+
+    if cfg.get("generate_histograms", False):
+        folder = os.path.join(out_folder, out_name + "_histograms")
+        if cfg.get("histograms_as_pdf", False):
+            return render_histograms_pdf_cached(heatmap_data, gene_order, folder + ".pdf", cache_dir)
+        # файлы уже распределены по процессам пакетного режима — внутри процесса рисуем последовательно
+        render_histograms(heatmap_data, gene_order, folder, workers=1, cache_dir=cache_dir)
+        return folder
+
+    output_path = os.path.join(out_folder, f"{out_name}.png")
+    fig = render_heatmap_cached(heatmap_data, annotations, cfg, output_path, cache_dir)
+    if fig is not None:
+        plt.close(fig)
+    return output_path
+
+
+def expand_inputs(patterns, results_folder):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches and not os.path.isabs(pattern):
+            matches = sorted(glob.glob(os.path.join(results_folder, pattern)))
+        for path in matches:
+            path = os.path.abspath(path)
+            if os.path.isfile(path) and path not in files:
+                files.append(path)
+    return files
+
+
+def output_names(files):
+    # имя PNG = имя входного файла; при совпадении добавляется имя родительской папки
+    stems = [sanitize_filename(os.path.splitext(os.path.basename(p))[0]) for p in files]
+    names = []
+    for path, stem in zip(files, stems):
+        if stems.count(stem) > 1:
+            parent = sanitize_filename(os.path.basename(os.path.dirname(path)))
+            stem = f"{parent}_{stem}"
+        names.append(stem)
+    return names
+
+
+def batch_main(patterns, config_file=None, out_folder=None, workers=None):
+    plt.switch_backend("Agg")
+    results_folder = load_results_folder()
+    out_folder = out_folder or results_folder
+    os.makedirs(out_folder, exist_ok=True)
+    config_file = config_file or config_path
+
+    files = expand_inputs(patterns, results_folder)
+    if not files:
+        print("Не найдено ни одного файла для построения тепловых карт.")
+        return 1
+    print(f"Файлов для построения: {len(files)}")
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool:
+        futures = {
+            pool.submit(render_file, path, config_file, out_folder, name): path
+            for path, name in zip(files, output_names(files))
+        }
+        for future, path in futures.items():
+            try:
+                print(f"{path} -> {future.result()}")
+            except Exception as e:
+                failed += 1
+                print(f"Ошибка при обработке {path}: {type(e).__name__}: {e}")
+
+    print(f"Готово: {len(files) - failed} из {len(files)}.")
+    return 1 if failed else 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Тепловые карты log2(Exp/Control) с p-value")
+    parser.add_argument("--batch", nargs="+", metavar="FILE_OR_GLOB",
+                        help="пакетный режим без GUI: файлы или маски (относительно results_folder)")
+    parser.add_argument("--config", default=None, help="путь к heatmap_config.json")
+    parser.add_argument("--out", default=None, help="папка для PNG (по умолчанию results_folder)")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.batch:
+        sys.exit(batch_main(args.batch, args.config, args.out, args.workers))
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+from profiling import profiled, profile_call
+
+
+def _work_after_inner():
+    return sum(range(10000))
+
+
+@profile_call("inner")
+def _decorated():
+    return sum(range(1000))
+
+
+def _profile_files(folder):
+    return sorted(os.listdir(folder))
+
+
+def test_decorated_function_inside_profiled_keeps_outer_profile(tmp_path):
+    with profiled("outer", mode="cprofile", folder=str(tmp_path)):
+        _decorated()
+        _work_after_inner()
+
+    files = _profile_files(tmp_path)
+    assert all(f.startswith("outer_") for f in files)
+    assert len([f for f in files if f.endswith(".prof")]) == 1
+    stats = next(f for f in files if f.endswith("_stats.txt"))
+    text = (tmp_path / stats).read_text(encoding="utf-8")
+    # код после вложенного вызова остаётся во внешнем профиле
+    assert "_work_after_inner" in text
+    assert "_decorated" in text
+    assert profiling._active is None
+
+
+def test_profiling_can_start_again_after_nested_call(tmp_path):
+    with profiled("first", mode="sample", folder=str(tmp_path)):
+        _decorated()
+    with profiled("second", mode="cprofile", folder=str(tmp_path)):
+        _decorated()
+    names = {f.split("_")[0] for f in _profile_files(tmp_path)}
+    assert names == {"first", "second"}